@@ -0,0 +1,103 @@
+"""Скорость загрузки уведомлений о недоставке: разбор DSN из Maildir и пакетное сохранение.
+
+Во временном Maildir создаются уведомления RFC 3464 с копией заголовков исходного письма
+для писем, заведенных в очереди на время теста. Все изменения в базе откатываются в конце.
+
+Запуск: python benchmarks/bench_bounces.py [количество уведомлений]
+"""
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+import mailbox  # noqa: E402
+
+from django.db import transaction  # noqa: E402
+
+from mailing.bounces import MailboxSource, ingest_bounces, parse_bounces, parse_message  # noqa: E402
+from mailing.models import OutboxEmail  # noqa: E402
+
+
+DSN_TEMPLATE = """From: MAILER-DAEMON@mx.example.com
+Subject: Undelivered Mail Returned to Sender
+MIME-Version: 1.0
+Content-Type: multipart/report; report-type=delivery-status; boundary="dsn"
+
+--dsn
+Content-Type: text/plain; charset=us-ascii
+
+Could not deliver to {recipient}
+
+--dsn
+Content-Type: message/delivery-status
+
+Reporting-MTA: dns; mx.example.com
+
+Final-Recipient: rfc822; {recipient}
+Action: failed
+Status: {status}
+Diagnostic-Code: smtp; 550 {status} User unknown
+
+--dsn
+Content-Type: text/rfc822-headers
+
+Message-ID: {message_id}
+To: {recipient}
+Subject: Mailing
+
+--dsn--
+"""
+
+
+def make_dsn(message_id, recipient, index):
+    status = '5.1.1' if index % 4 else '4.2.2'
+    return DSN_TEMPLATE.format(message_id=message_id, recipient=recipient, status=status).encode()
+
+
+class Rollback(Exception):
+    pass
+
+
+def main(count):
+    with tempfile.TemporaryDirectory() as directory:
+        maildir = mailbox.Maildir(Path(directory) / 'bounces')
+        recipients = [(f'<bench-{index}@example.com>', f'user{index}@bounce-bench.example') for index in range(count)]
+        for index, (message_id, recipient) in enumerate(recipients):
+            maildir.add(make_dsn(message_id, recipient, index))
+
+        source = MailboxSource(maildir._path)
+        started = time.perf_counter()
+        parsed = sum(len(parse_bounces(parse_message(stream))) for _, stream in source.messages())
+        elapsed = time.perf_counter() - started
+        print(f'Разбор: {parsed} недоставок за {elapsed:.2f} с, {count / elapsed * 60:,.0f} писем в минуту')
+
+        try:
+            with transaction.atomic():
+                OutboxEmail.objects.bulk_create(
+                    [
+                        OutboxEmail(idempotency_key=f'bench:{message_id}', message_id=message_id,
+                                    recipient=recipient, status='sent')
+                        for message_id, recipient in recipients
+                    ],
+                    batch_size=2000,
+                )
+                started = time.perf_counter()
+                stats = ingest_bounces(source)
+                elapsed = time.perf_counter() - started
+                raise Rollback
+        except Rollback:
+            pass
+        print(f'Разбор и сохранение: {stats["matched"]} писем, {stats["suppressed"]} адресов подавлено '
+              f'за {elapsed:.2f} с, {count / elapsed * 60:,.0f} писем в минуту')
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20000)
@@ -0,0 +1,73 @@
+"""Сравнение задержки запроса при разных режимах соединений с PostgreSQL:
+новое соединение на каждый запрос, постоянные соединения (CONN_MAX_AGE) и пул psycopg 3.
+
+Каждый режим запускается в отдельном процессе с нужными переменными окружения,
+запрос моделируется сигналами request_started/request_finished вокруг одного SELECT,
+как это делает обработчик Django. Нужны настройки базы в .env; для пула —
+пакет psycopg[binary,pool].
+
+Запуск: python benchmarks/bench_db_connections.py [количество запросов]
+"""
+import json
+import os
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+MODES = [
+    ('Новое соединение на каждый запрос', {'PROCESS_ROLE': 'web', 'CONN_MAX_AGE': '0', 'DB_POOL': 'False'}),
+    ('Постоянные соединения (CONN_MAX_AGE)', {'PROCESS_ROLE': 'web', 'CONN_MAX_AGE': '60', 'DB_POOL': 'False'}),
+    ('Пул psycopg 3', {'PROCESS_ROLE': 'asgi', 'DB_POOL': 'True'}),
+]
+
+
+def measure(count):
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+
+    import django
+
+    django.setup()
+
+    from django.core.signals import request_finished, request_started
+    from django.db import connection
+
+    latencies = []
+    for _ in range(count):
+        started = time.perf_counter()
+        request_started.send(sender=None)
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT 1')
+            cursor.fetchone()
+        request_finished.send(sender=None)
+        latencies.append(time.perf_counter() - started)
+    latencies.sort()
+    print(json.dumps(latencies))
+
+
+def run(name, env, count):
+    result = subprocess.run(
+        [sys.executable, __file__, '--measure', str(count)],
+        env={**os.environ, **env},
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        error = result.stderr.strip().splitlines()[-1] if result.stderr.strip() else 'неизвестная ошибка'
+        print(f'{name:<40} пропущен: {error}')
+        return
+    latencies = json.loads(result.stdout.strip().splitlines()[-1])
+    p50 = latencies[len(latencies) // 2] * 1000
+    p95 = latencies[int(len(latencies) * 0.95)] * 1000
+    print(f'{name:<40} p50 {p50:8.2f} мс  p95 {p95:8.2f} мс')
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 2 and sys.argv[1] == '--measure':
+        measure(int(sys.argv[2]))
+    else:
+        count = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+        print(f'Запросов: {count}')
+        for name, env in MODES:
+            run(name, env, count)
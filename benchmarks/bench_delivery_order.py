@@ -0,0 +1,174 @@
+"""Пропускная способность отправки через локальный SMTP-сервер-приемник при разном порядке доставки.
+
+В процессе запускается SMTP-приемник на 127.0.0.1, который принимает письма и отбрасывает их.
+Сравниваются:
+- порядок очереди: при смене домена получателя соединение маршрута открывается заново
+  (так ведет себя отправитель, держащий одно соединение, при прямой доставке на MX);
+- маршруты по доменам (plan_delivery и send_via_pool): домен закреплен за аккаунтом пула,
+  соединения остаются открытыми всю серию;
+- то же с несколькими RCPT TO в одной транзакции.
+
+Время измеряется по часам, а не вычисляется. --handshake-ms добавляет паузу перед приветствием
+сервера, чтобы смоделировать установку соединения с удаленным сервером (TCP и TLS).
+
+Запуск: python benchmarks/bench_delivery_order.py [количество писем] [--handshake-ms 50] [--recipients 50]
+"""
+import argparse
+import os
+import random
+import socketserver
+import sys
+import threading
+import time
+from pathlib import Path
+from types import SimpleNamespace
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.core.mail import get_connection  # noqa: E402
+
+from mailing.outbox import plan_delivery, send_transaction, send_via_pool  # noqa: E402
+from mailing.smtp_pool import SmtpAccount, SmtpPool  # noqa: E402
+
+DOMAINS = (
+    ['gmail.com'] * 40 + ['mail.ru'] * 25 + ['yandex.ru'] * 20 + ['outlook.com'] * 10
+    + [f'company{index}.ru' for index in range(5)]
+)
+
+
+class SinkHandler(socketserver.StreamRequestHandler):
+    """Минимальный SMTP-диалог: принимает письма и отбрасывает их"""
+
+    def reply(self, line):
+        self.wfile.write(line + b'\r\n')
+
+    def handle(self):
+        stats = self.server.stats
+        with self.server.lock:
+            stats['connections'] += 1
+        time.sleep(self.server.handshake)
+        self.reply(b'220 sink ESMTP')
+        in_data = False
+        for line in self.rfile:
+            if in_data:
+                if line == b'.\r\n':
+                    in_data = False
+                    with self.server.lock:
+                        stats['transactions'] += 1
+                    self.reply(b'250 OK')
+                continue
+            command = line[:4].upper()
+            if command == b'EHLO':
+                # Многострочный ответ одной записью: иначе Nagle и отложенный ACK добавляют ~40 мс
+                self.reply(b'250-sink\r\n250 8BITMIME')
+            elif command == b'RCPT':
+                with self.server.lock:
+                    stats['recipients'] += 1
+                self.reply(b'250 OK')
+            elif command == b'DATA':
+                in_data = True
+                self.reply(b'354 End data with <CR><LF>.<CR><LF>')
+            elif command == b'QUIT':
+                self.reply(b'221 Bye')
+                return
+            else:
+                self.reply(b'250 OK')
+
+
+class SmtpSink(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, handshake):
+        super().__init__(('127.0.0.1', 0), SinkHandler)
+        self.handshake = handshake
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.stats = {'connections': 0, 'transactions': 0, 'recipients': 0}
+
+
+def make_batch(count):
+    message = SimpleNamespace(pk=1, version=1, subject='Новости', body='Текст без подстановок. ' * 40,
+                              html_body='', attachments=SimpleNamespace(all=list))
+    mailing = SimpleNamespace(message_id=1, message=message, owner_id=1)
+    rng = random.Random(1)
+    batch = []
+    for index in range(count):
+        domain = rng.choice(DOMAINS)
+        batch.append(SimpleNamespace(
+            id=index, mailing_id=1, mailing=mailing, client_id=None, from_email='',
+            message_id=f'<bench-{index}@example.com>', recipient=f'client{index}@{domain}',
+            recipient_domain=domain,
+        ))
+    return batch
+
+
+def connection_options(sink):
+    return {
+        'backend': 'django.core.mail.backends.smtp.EmailBackend',
+        'host': '127.0.0.1', 'port': sink.server_address[1],
+        'username': '', 'password': '', 'use_tls': False, 'use_ssl': False,
+    }
+
+
+def send_in_queue_order(batch, sink):
+    """Одно соединение маршрута за раз: при смене домена оно закрывается и открывается заново"""
+    connection = None
+    current_domain = None
+    for email in batch:
+        if email.recipient_domain != current_domain:
+            if connection is not None:
+                connection.close()
+            connection = get_connection(fail_silently=False, **connection_options(sink))
+            connection.open()
+            current_domain = email.recipient_domain
+        send_transaction([email], connection, {}, 'news@example.com')
+    connection.close()
+
+
+def send_by_route(batch, sink, max_recipients=1, accounts=4):
+    pool = SmtpPool([
+        SmtpAccount(f'route{index}', from_email='news@example.com', **connection_options(sink))
+        for index in range(accounts)
+    ])
+    try:
+        for group in plan_delivery(batch, max_recipients):
+            send_via_pool(group, pool, {})
+    finally:
+        pool.close()
+
+
+def run(name, sink, send, *args):
+    sink.reset()
+    started = time.perf_counter()
+    send(*args)
+    elapsed = time.perf_counter() - started
+    stats = sink.stats
+    print(f'{name:<42} {elapsed:7.2f} с  {stats["recipients"] / elapsed:8.0f} писем/с  '
+          f'соединений {stats["connections"]:5}  транзакций {stats["transactions"]:6}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('count', type=int, nargs='?', default=2000)
+    parser.add_argument('--handshake-ms', type=float, default=0)
+    parser.add_argument('--recipients', type=int, default=50)
+    args = parser.parse_args()
+
+    sink = SmtpSink(args.handshake_ms / 1000)
+    threading.Thread(target=sink.serve_forever, daemon=True).start()
+    batch = make_batch(args.count)
+    print(f'Писем: {args.count}, установка соединения: {args.handshake_ms:g} мс')
+    try:
+        run('Порядок очереди', sink, send_in_queue_order, batch, sink)
+        run('Маршруты по доменам, 1 адрес', sink, send_by_route, batch, sink)
+        run(f'Маршруты по доменам, до {args.recipients} адресов', sink, send_by_route, batch, sink, args.recipients)
+    finally:
+        sink.shutdown()
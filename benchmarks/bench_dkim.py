@@ -0,0 +1,69 @@
+"""Пропускная способность подготовки писем рассылки: без подписи, с подписью DKIM,
+вычисляющей хеш тела заново для каждого письма, и с общим хешем тела на рассылку.
+
+Ключ RSA 2048 создается на время теста; нужен пакет cryptography.
+Письма только собираются и подписываются, SMTP-сервер не нужен.
+
+Запуск: python benchmarks/bench_dkim.py [количество писем] [размер HTML-версии в КБ]
+"""
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from cryptography.hazmat.primitives import serialization  # noqa: E402
+from cryptography.hazmat.primitives.asymmetric import rsa  # noqa: E402
+from django.core.mail import EmailMultiAlternatives  # noqa: E402
+
+from mailing.dkim import DkimEmailBackend  # noqa: E402
+
+BODY = 'Здравствуйте!\n\n' + 'Текст рассылки без подстановок.\n' * 40
+
+
+def make_message(index, html, body_key=None):
+    message = EmailMultiAlternatives(
+        subject=f'Специальное предложение для клиента {index}',
+        body=BODY,
+        from_email='news@example.com',
+        to=[f'client{index}@example.com'],
+        headers={'Message-ID': f'<bench-{index}@example.com>'},
+    )
+    message.attach_alternative(html, 'text/html')
+    if body_key is not None:
+        message.dkim_body_key = body_key
+    return message
+
+
+def run(name, backend, count, html, body_key=None):
+    started = time.perf_counter()
+    for index in range(count):
+        backend.message_bytes(make_message(index, html, body_key))
+    elapsed = time.perf_counter() - started
+    print(f'{name:<40} {elapsed:6.2f} с  {count / elapsed:8.0f} писем/с')
+
+
+if __name__ == '__main__':
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    html_size = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    html = '<p>' + 'Текст рассылки без подстановок. ' * (html_size * 1024 // 60) + '</p>'
+
+    with tempfile.NamedTemporaryFile(suffix='.pem') as key_file:
+        key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        key_file.write(key.private_bytes(
+            serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption(),
+        ))
+        key_file.flush()
+
+        print(f'Писем: {count}, HTML-версия: {html_size} КБ')
+        run('Без подписи', DkimEmailBackend(), count, html)
+        signed = DkimEmailBackend(dkim_selector='bench', dkim_private_key_path=key_file.name)
+        run('DKIM, хеш тела на каждое письмо', signed, count, html)
+        run('DKIM, хеш тела один раз на рассылку', signed, count, html, body_key=('bench', 1))
@@ -0,0 +1,73 @@
+"""Сравнение стоимости персонализации письма: шаблоны Django на каждого получателя
+против сообщения, скомпилированного один раз на рассылку.
+
+Запуск: python benchmarks/bench_templating.py [количество получателей]
+"""
+import os
+import sys
+import time
+from pathlib import Path
+from types import SimpleNamespace
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.template import Context, Template  # noqa: E402
+
+from mailing.templating import compile_message  # noqa: E402
+
+SUBJECT = 'Специальное предложение для {{ full_name }}'
+BODY = '\n'.join(
+    ['Здравствуйте, {{ full_name }}!']
+    + ['Текст рассылки без подстановок.'] * 40
+    + ['Письмо отправлено на {{ email }}.']
+)
+
+
+def make_recipients(count):
+    return [
+        {'id': index, 'email': f'client{index}@example.com', 'full_name': f'Клиент {index}', 'comment': ''}
+        for index in range(count)
+    ]
+
+
+def bench_django_templates(recipients):
+    for recipient in recipients:
+        context = Context(recipient, autoescape=False)
+        Template(SUBJECT).render(context)
+        Template(BODY).render(context)
+
+
+def bench_compiled(recipients):
+    message = SimpleNamespace(
+        pk=1,
+        version=1,
+        subject=SUBJECT,
+        body=BODY,
+        html_body='',
+        attachments=SimpleNamespace(all=list),
+    )
+    for recipient in recipients:
+        compiled = compile_message(message)
+        compiled.subject.render(recipient)
+        compiled.body.render(recipient)
+
+
+def run(name, func, recipients):
+    started = time.perf_counter()
+    func(recipients)
+    elapsed = time.perf_counter() - started
+    per_message = elapsed / len(recipients) * 1_000_000
+    print(f'{name:<40} {elapsed:8.3f} с  {per_message:8.2f} мкс/письмо')
+
+
+if __name__ == '__main__':
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    recipients = make_recipients(count)
+    print(f'Получателей: {count}')
+    run('Template() на каждого получателя', bench_django_templates, recipients)
+    run('compile_message() + format_map', bench_compiled, recipients)
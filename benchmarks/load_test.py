@@ -0,0 +1,195 @@
+"""Нагрузочный тест страниц панели: запросы в секунду и задержки при параллельных пользователях.
+
+Скрипт не зависит от Django и сторонних библиотек: HTTP/1.1 поверх asyncio с keep-alive.
+Запускается против уже поднятого сервера, поэтому одинаково измеряет WSGI и ASGI:
+
+    gunicorn config.wsgi:application --workers 4 --threads 4 --bind 127.0.0.1:8000
+    gunicorn config.asgi:application --workers 4 -k uvicorn.workers.UvicornWorker --bind 127.0.0.1:8001
+
+    python benchmarks/load_test.py http://127.0.0.1:8000 --email user@example.com --password secret
+    python benchmarks/load_test.py http://127.0.0.1:8001 --email user@example.com --password secret
+
+По умолчанию опрашиваются главная страница и списки; --path добавляет свои адреса
+(например, /mailings/1/ и /mailings/1/progress/). --streams N держит открытыми N потоков
+хода отправки (--stream-path /mailings/1/progress/stream/) запущенной рассылки, как вкладки
+наблюдающих за ней пользователей: под WSGI каждый поток занимает поток сервера.
+"""
+import argparse
+import asyncio
+import re
+import time
+from http.cookies import SimpleCookie
+from urllib.parse import urlencode, urlsplit
+
+DEFAULT_PATHS = ['/', '/clients/', '/messages/', '/mailings/']
+CSRF_INPUT_RE = re.compile(rb'name="csrfmiddlewaretoken" value="([^"]+)"')
+
+
+class HttpConnection:
+    """Одно keep-alive соединение с сервером"""
+
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.reader = self.writer = None
+
+    async def request(self, method, path, headers=None, body=b''):
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        lines = [f'{method} {path} HTTP/1.1', f'Host: {self.host}:{self.port}', f'Content-Length: {len(body)}']
+        lines += [f'{name}: {value}' for name, value in (headers or {}).items()]
+        self.writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode() + body)
+        await self.writer.drain()
+
+        status_line = await self.reader.readline()
+        if not status_line:
+            await self.close()
+            raise ConnectionError('Сервер закрыл соединение')
+        status = int(status_line.split()[1])
+        response_headers = []
+        while True:
+            line = await self.reader.readline()
+            if line in (b'\r\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            response_headers.append((name.strip().lower(), value.strip()))
+
+        header_map = dict(response_headers)
+        if header_map.get('transfer-encoding') == 'chunked':
+            content = b''
+            while True:
+                size = int((await self.reader.readline()).strip(), 16)
+                content += await self.reader.readexactly(size + 2)
+                if size == 0:
+                    break
+        else:
+            content = await self.reader.readexactly(int(header_map.get('content-length', 0)))
+        if header_map.get('connection') == 'close':
+            await self.close()
+        return status, response_headers, content
+
+    async def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.reader = self.writer = None
+
+
+def collect_cookies(cookies, response_headers):
+    for name, value in response_headers:
+        if name == 'set-cookie':
+            cookie = SimpleCookie(value)
+            cookies.update({key: morsel.value for key, morsel in cookie.items()})
+
+
+def cookie_header(cookies):
+    return '; '.join(f'{name}={value}' for name, value in cookies.items())
+
+
+async def login(host, port, login_path, email, password):
+    """Входит через форму и возвращает cookies сессии"""
+    connection = HttpConnection(host, port)
+    cookies = {}
+    _, headers, content = await connection.request('GET', login_path)
+    collect_cookies(cookies, headers)
+    token = CSRF_INPUT_RE.search(content).group(1).decode()
+    body = urlencode({'csrfmiddlewaretoken': token, 'username': email, 'password': password}).encode()
+    status, headers, _ = await connection.request('POST', login_path, {
+        'Cookie': cookie_header(cookies),
+        'Content-Type': 'application/x-www-form-urlencoded',
+        'Referer': f'http://{host}:{port}{login_path}',
+    }, body)
+    await connection.close()
+    collect_cookies(cookies, headers)
+    if status != 302:
+        raise SystemExit(f'Не удалось войти: сервер ответил {status}')
+    return cookies
+
+
+async def worker(host, port, paths, headers, deadline, latencies, errors, offset):
+    connection = HttpConnection(host, port)
+    index = offset
+    while time.perf_counter() < deadline:
+        path = paths[index % len(paths)]
+        index += 1
+        started = time.perf_counter()
+        try:
+            status, _, _ = await connection.request('GET', path, headers)
+        except (ConnectionError, OSError, asyncio.IncompleteReadError):
+            errors.append(path)
+            await connection.close()
+            continue
+        if status >= 400:
+            errors.append(path)
+        else:
+            latencies.append(time.perf_counter() - started)
+    await connection.close()
+
+
+async def hold_stream(host, port, path, headers, deadline):
+    """Держит открытым поток Server-Sent Events до конца теста"""
+    reader, writer = await asyncio.open_connection(host, port)
+    lines = [f'GET {path} HTTP/1.1', f'Host: {host}:{port}', 'Accept: text/event-stream']
+    lines += [f'{name}: {value}' for name, value in headers.items()]
+    writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode())
+    await writer.drain()
+    try:
+        while time.perf_counter() < deadline:
+            try:
+                if not await asyncio.wait_for(reader.read(4096), deadline - time.perf_counter()):
+                    break
+            except asyncio.TimeoutError:
+                break
+    finally:
+        writer.close()
+
+
+def percentile(values, fraction):
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+async def main(args):
+    url = urlsplit(args.url)
+    host, port = url.hostname, url.port or 80
+    headers = {}
+    if args.email:
+        cookies = await login(host, port, args.login_path, args.email, args.password)
+        headers['Cookie'] = cookie_header(cookies)
+
+    paths = args.path or DEFAULT_PATHS
+    latencies, errors = [], []
+    started = time.perf_counter()
+    deadline = started + args.duration
+    streams = [
+        asyncio.create_task(hold_stream(host, port, args.stream_path, headers, deadline))
+        for _ in range(args.streams if args.stream_path else 0)
+    ]
+    await asyncio.gather(*(
+        worker(host, port, paths, headers, deadline, latencies, errors, offset)
+        for offset in range(args.concurrency)
+    ))
+    await asyncio.gather(*streams, return_exceptions=True)
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    print(f'Сервер: {args.url}, пользователей: {args.concurrency}, открытых потоков: {len(streams)}, '
+          f'длительность: {elapsed:.1f} с')
+    print(f'Успешных запросов: {len(latencies)}, ошибок: {len(errors)}')
+    if latencies:
+        print(f'Запросов в секунду: {len(latencies) / elapsed:.1f}')
+        for name, fraction in (('p50', 0.5), ('p95', 0.95), ('p99', 0.99)):
+            print(f'{name}: {percentile(latencies, fraction) * 1000:.1f} мс')
+        print(f'max: {latencies[-1] * 1000:.1f} мс')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Нагрузочный тест страниц панели')
+    parser.add_argument('url', help='Адрес сервера, например http://127.0.0.1:8000')
+    parser.add_argument('--path', action='append', help='Адрес страницы; можно указать несколько раз')
+    parser.add_argument('--concurrency', type=int, default=50, help='Количество параллельных пользователей')
+    parser.add_argument('--duration', type=float, default=30, help='Длительность теста в секундах')
+    parser.add_argument('--email', help='Email пользователя для входа')
+    parser.add_argument('--password', help='Пароль пользователя для входа')
+    parser.add_argument('--streams', type=int, default=0, help='Количество открытых потоков хода отправки')
+    parser.add_argument('--stream-path', help='Адрес потока хода отправки запущенной рассылки')
+    parser.add_argument('--login-path', default='/users/login/', help='Адрес формы входа')
+    asyncio.run(main(parser.parse_args()))
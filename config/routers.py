@@ -0,0 +1,115 @@
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+from django.http import StreamingHttpResponse
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+PIN_COOKIE = 'db_primary_pin'
+# Сессии, пользователи и права всегда читаются с основной базы: иначе при отставании реплики
+# пользователь без закрепления мог бы оказаться разлогинен сразу после входа
+PRIMARY_APP_LABELS = ('sessions', 'auth', 'contenttypes')
+
+use_replica = ContextVar('use_replica', default=False)
+
+
+def replica_configured():
+    return settings.REPLICA_DATABASE in settings.DATABASES
+
+
+def reads_from_primary(model):
+    return model._meta.app_label in PRIMARY_APP_LABELS or model._meta.label_lower == settings.AUTH_USER_MODEL.lower()
+
+
+class ReplicaRouter:
+    """Направляет чтение на реплику, когда его разрешил ReplicaMiddleware; запись — всегда на основную базу"""
+
+    def db_for_read(self, model, **hints):
+        if use_replica.get() and not reads_from_primary(model):
+            return settings.REPLICA_DATABASE
+        return DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
+
+
+class ReplicaMiddleware:
+    """Отправляет чтение безопасных запросов на реплику
+
+    После POST и других изменяющих запросов пользователь на REPLICA_PIN_SECONDS
+    закрепляется за основной базой, чтобы сразу видеть свои изменения.
+    Фоновые команды не проходят через middleware и всегда работают с основной базой.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def reads_from_replica(self, request):
+        return (
+            replica_configured()
+            and request.method in SAFE_METHODS
+            and PIN_COOKIE not in request.COOKIES
+        )
+
+    def process_response(self, request, response, on_replica):
+        if request.method not in SAFE_METHODS and replica_configured():
+            response.set_cookie(PIN_COOKIE, '1', max_age=settings.REPLICA_PIN_SECONDS, httponly=True, samesite='Lax')
+        if on_replica and isinstance(response, StreamingHttpResponse):
+            # Потоковый ответ читает базу уже после выхода из middleware
+            if response.is_async:
+                response.streaming_content = _areplica_stream(response.streaming_content)
+            else:
+                response.streaming_content = _replica_stream(response.streaming_content)
+        return response
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        on_replica = self.reads_from_replica(request)
+        previous = use_replica.get()
+        use_replica.set(on_replica)
+        try:
+            response = self.get_response(request)
+        finally:
+            use_replica.set(previous)
+        return self.process_response(request, response, on_replica)
+
+    async def __acall__(self, request):
+        on_replica = self.reads_from_replica(request)
+        previous = use_replica.get()
+        use_replica.set(on_replica)
+        try:
+            response = await self.get_response(request)
+        finally:
+            use_replica.set(previous)
+        return self.process_response(request, response, on_replica)
+
+
+def _replica_stream(content):
+    previous = use_replica.get()
+    use_replica.set(True)
+    try:
+        yield from content
+    finally:
+        use_replica.set(previous)
+
+
+async def _areplica_stream(content):
+    previous = use_replica.get()
+    use_replica.set(True)
+    try:
+        async for chunk in content:
+            yield chunk
+    finally:
+        use_replica.set(previous)
@@ -1,10 +1,15 @@
+import json
 import os
+from importlib.util import find_spec
 from pathlib import Path
 
+from django.core.exceptions import ImproperlyConfigured
 from dotenv import load_dotenv
 
 BASE_DIR = Path(__file__).resolve().parent.parent
 
+# Роль, выставленная точкой входа (config/asgi.py, config/wsgi.py) или окружением процесса, важнее .env
+entrypoint_role = os.environ.get('PROCESS_ROLE')
 load_dotenv(override=True)
 SECRET_KEY = os.getenv('SECRET_KEY')
 
@@ -20,12 +25,15 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'users',
     'mailing',
 ]
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'config.staticfiles.PrecompressedStaticMiddleware',
+    'config.routers.ReplicaMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -62,9 +70,44 @@ DATABASES = {
         'PASSWORD': os.getenv('PASSWORD'),
         'HOST': os.getenv('HOST'),
         'PORT': os.getenv('PORT'),
+        'CONN_HEALTH_CHECKS': True,
     }
 }
 
+# Роль процесса: web — WSGI-сервер (config/wsgi.py), asgi — ASGI-сервер (config/asgi.py),
+# worker — фоновые команды send_mailings и send_outbox
+PROCESS_ROLE = entrypoint_role or os.getenv('PROCESS_ROLE') or 'web'
+DB_POOL = os.getenv('DB_POOL', 'False') == 'True'
+
+if PROCESS_ROLE == 'worker':
+    # Фоновый процесс все время работы держит одно соединение, на нем же выполняется LISTEN
+    DATABASES['default']['CONN_MAX_AGE'] = None
+elif DB_POOL:
+    # Пул psycopg 3 (pip install "psycopg[binary,pool]"); с пулом CONN_MAX_AGE должен быть 0
+    if find_spec('psycopg') is None or find_spec('psycopg_pool') is None:
+        raise ImproperlyConfigured('DB_POOL=True требует psycopg 3 с пулом: pip install "psycopg[binary,pool]"')
+    DATABASES['default']['OPTIONS'] = {
+        'pool': {
+            'min_size': int(os.getenv('DB_POOL_MIN_SIZE') or 2),
+            'max_size': int(os.getenv('DB_POOL_MAX_SIZE') or 10),
+            'timeout': int(os.getenv('DB_POOL_TIMEOUT') or 10),
+        },
+    }
+elif PROCESS_ROLE == 'web':
+    DATABASES['default']['CONN_MAX_AGE'] = int(os.getenv('CONN_MAX_AGE') or 60)
+
+# Реплика для чтения безопасных запросов веб-интерфейса; без DB_REPLICA_HOST все идет в основную базу
+REPLICA_DATABASE = 'replica'
+REPLICA_PIN_SECONDS = int(os.getenv('REPLICA_PIN_SECONDS') or 10)
+if os.getenv('DB_REPLICA_HOST'):
+    DATABASES[REPLICA_DATABASE] = {
+        **DATABASES['default'],
+        'HOST': os.getenv('DB_REPLICA_HOST'),
+        'PORT': os.getenv('DB_REPLICA_PORT') or DATABASES['default']['PORT'],
+        'TEST': {'MIRROR': 'default'},
+    }
+DATABASE_ROUTERS = ['config.routers.ReplicaRouter']
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -91,6 +134,7 @@ USE_TZ = True
 
 STATIC_URL = 'static/'
 STATICFILES_DIRS = [BASE_DIR / 'static']
+STATIC_ROOT = BASE_DIR / 'staticfiles'
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
@@ -99,7 +143,15 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 AUTH_USER_MODEL = 'users.CustomUser'
 
-EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
+# ModelBackend остается в списке, чтобы не разлогинить сессии, созданные до перехода на кеширующий бэкенд;
+# права он берет из того же _perm_cache пользователя и лишних запросов не делает
+AUTHENTICATION_BACKENDS = [
+    'users.backends.CachedModelBackend',
+    'django.contrib.auth.backends.ModelBackend',
+]
+
+# SMTP-бэкенд с подписью DKIM; без DKIM_SELECTOR и DKIM_PRIVATE_KEY_PATH письма не подписываются
+EMAIL_BACKEND = 'mailing.dkim.DkimEmailBackend'
 EMAIL_HOST = os.getenv('EMAIL_HOST', 'smtp.yandex.ru')
 EMAIL_PORT = int(os.getenv('EMAIL_PORT', 465))
 EMAIL_USE_TLS = os.getenv('EMAIL_USE_TLS', 'False') == 'True'
@@ -107,6 +159,20 @@ EMAIL_USE_SSL = os.getenv('EMAIL_USE_SSL', 'True') == 'True'
 EMAIL_HOST_USER = os.getenv('EMAIL_HOST_USER')
 EMAIL_HOST_PASSWORD = os.getenv('EMAIL_HOST_PASSWORD')
 DEFAULT_FROM_EMAIL = EMAIL_HOST_USER
+# Пул SMTP-аккаунтов в формате JSON: [{"name": ..., "host": ..., "port": ..., "username": ..., "password": ...,
+# "use_ssl": ..., "from_email": ..., "weight": ..., "daily_limit": ..., "hourly_limit": ...}, ...].
+# Пустой список — отправка через единственный аккаунт из настроек EMAIL_*
+EMAIL_ACCOUNTS = json.loads(os.getenv('EMAIL_ACCOUNTS') or '[]')
+
+DKIM_SELECTOR = os.getenv('DKIM_SELECTOR')
+DKIM_PRIVATE_KEY_PATH = os.getenv('DKIM_PRIVATE_KEY_PATH')
+# Домен подписи d=; по умолчанию домен адреса отправителя
+DKIM_DOMAIN = os.getenv('DKIM_DOMAIN')
+
+EMAIL_MX_RESOLVER = os.getenv('EMAIL_MX_RESOLVER') or 'mailing.validation.DnsResolver'
+EMAIL_MX_CACHE_TTL = int(os.getenv('EMAIL_MX_CACHE_TTL') or 60 * 60 * 24)
+# Больше 1 — письма без персонализации на один домен уходят одной транзакцией с To: undisclosed-recipients:;
+MAILING_MAX_RECIPIENTS_PER_MESSAGE = int(os.getenv('MAILING_MAX_RECIPIENTS_PER_MESSAGE') or 1)
 
 LOGIN_REDIRECT_URL = 'mailing:index'
 LOGIN_URL = 'users:login'
@@ -119,4 +185,12 @@ CACHES = {
     }
 }
 
-STATICFILES_STORAGE = 'django.contrib.staticfiles.storage.ManifestStaticFilesStorage'
+# collectstatic кладет рядом с файлами с хешем в имени сжатые копии .gz и .br (brotli — при установленном пакете)
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'config.staticfiles.CompressedManifestStaticFilesStorage',
+    },
+}
@@ -0,0 +1,168 @@
+import gzip
+import mimetypes
+import os
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage, staticfiles_storage
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.files.base import ContentFile
+from django.http import FileResponse, HttpResponseNotModified
+from django.utils._os import safe_join
+from django.utils.cache import patch_vary_headers
+from django.utils.http import http_date
+from django.views.static import was_modified_since
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE_EXTENSIONS = ('.css', '.js', '.map', '.svg', '.json', '.txt', '.html', '.xml', '.ico')
+MIN_COMPRESS_SIZE = 256
+MIN_COMPRESS_RATIO = 0.95
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+STATIC_CACHE_CONTROL = 'public, max-age=3600'
+# Порядок предпочтения при отдаче: brotli сжимает текст лучше gzip
+ENCODINGS = (('.br', 'br'), ('.gz', 'gzip'))
+
+
+def _gzip(content):
+    return gzip.compress(content, compresslevel=9, mtime=0)
+
+
+def _brotli(content):
+    return brotli.compress(content, quality=11)
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """Хранилище статики с хешами в именах, которое кладет рядом с файлами сжатые копии .gz и .br
+
+    Сжатие выполняется один раз в collectstatic; brotli — при установленном пакете brotli.
+    """
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run=dry_run, **options)
+        if dry_run:
+            return
+        for name in sorted({*paths, *self.hashed_files.values()}):
+            if name.endswith(COMPRESSIBLE_EXTENSIONS) and self.exists(name):
+                for compressed_name in self.compress(name):
+                    yield name, compressed_name, True
+
+    def compress(self, name):
+        with self.open(name) as source:
+            content = source.read()
+        if len(content) < MIN_COMPRESS_SIZE:
+            return
+        compressors = [('.gz', _gzip)]
+        if brotli is not None:
+            compressors.append(('.br', _brotli))
+        for suffix, compress in compressors:
+            compressed = compress(content)
+            if len(compressed) > len(content) * MIN_COMPRESS_RATIO:
+                continue
+            compressed_name = name + suffix
+            if self.exists(compressed_name):
+                self.delete(compressed_name)
+            self._save(compressed_name, ContentFile(compressed))
+            yield compressed_name
+
+
+def accepted_encodings(header):
+    """Кодировки из Accept-Encoding с их весами q; кодировки с q=0 клиент не принимает"""
+    weights = {}
+    for item in header.split(','):
+        coding, *params = (part.strip() for part in item.split(';'))
+        if not coding:
+            continue
+        weight = 1.0
+        for param in params:
+            name, _, value = param.partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    weight = float(value)
+                except ValueError:
+                    weight = 0.0
+        weights[coding.lower()] = weight
+    return weights
+
+
+def choose_encoding(header, available):
+    """Кодировка из доступных (в порядке предпочтения сервера) с наибольшим весом клиента или None"""
+    weights = accepted_encodings(header)
+    best, best_weight = None, 0.0
+    for candidate in available:
+        weight = weights.get(candidate, weights.get('*', 0.0))
+        if weight > best_weight:
+            best, best_weight = candidate, weight
+    return best
+
+
+class PrecompressedStaticMiddleware:
+    """Отдает собранную статику из STATIC_ROOT до остальных middleware
+
+    Если клиент принимает brotli или gzip, отдается заранее сжатая копия файла.
+    Файлы с хешем в имени из манифеста кешируются браузером навсегда (immutable),
+    остальные — на час. Манифест перечитывается, когда collectstatic его обновил.
+    В режиме DEBUG статику раздает runserver, и сюда запросы не доходят.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+        self.root = settings.STATIC_ROOT
+        self.prefix = '/' + settings.STATIC_URL.lstrip('/')
+        self.immutable = set()
+        self.manifest_mtime = None
+
+    def immutable_names(self):
+        """Имена файлов с хешем из манифеста; перечитываются при изменении файла манифеста"""
+        try:
+            path = staticfiles_storage.manifest_storage.path(staticfiles_storage.manifest_name)
+            mtime = os.stat(path).st_mtime_ns
+        except (AttributeError, NotImplementedError, OSError):
+            return self.immutable
+        if mtime != self.manifest_mtime:
+            hashed_files = staticfiles_storage.load_manifest()[0]
+            self.immutable, self.manifest_mtime = set(hashed_files.values()), mtime
+        return self.immutable
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return self.serve(request) or self.get_response(request)
+
+    async def __acall__(self, request):
+        return self.serve(request) or await self.get_response(request)
+
+    def serve(self, request):
+        if not self.root or request.method not in ('GET', 'HEAD') or not request.path_info.startswith(self.prefix):
+            return None
+        name = request.path_info[len(self.prefix):]
+        try:
+            path = safe_join(self.root, name)
+        except SuspiciousFileOperation:
+            return None
+        if not os.path.isfile(path):
+            return None
+
+        available = {candidate: path + suffix for suffix, candidate in ENCODINGS if os.path.isfile(path + suffix)}
+        encoding = choose_encoding(request.headers.get('Accept-Encoding', ''), available)
+        served_path = available.get(encoding, path)
+
+        stat = os.stat(served_path)
+        if not was_modified_since(request.headers.get('If-Modified-Since'), stat.st_mtime):
+            response = HttpResponseNotModified()
+        else:
+            content_type = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+            response = FileResponse(open(served_path, 'rb'), content_type=content_type)
+            response['Last-Modified'] = http_date(stat.st_mtime)
+            if encoding:
+                response['Content-Encoding'] = encoding
+        response['Cache-Control'] = IMMUTABLE_CACHE_CONTROL if name in self.immutable_names() else STATIC_CACHE_CONTROL
+        patch_vary_headers(response, ('Accept-Encoding',))
+        return response
@@ -0,0 +1,106 @@
+import json
+import os
+import tempfile
+from unittest import mock
+
+from django.contrib.auth.models import Permission
+from django.contrib.sessions.models import Session
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, override_settings
+
+from config.routers import PIN_COOKIE, ReplicaMiddleware, ReplicaRouter
+from config.staticfiles import IMMUTABLE_CACHE_CONTROL, STATIC_CACHE_CONTROL, PrecompressedStaticMiddleware
+from mailing.models import Mailing
+from users.models import CustomUser
+
+
+class ReplicaRoutingTests(SimpleTestCase):
+    def setUp(self):
+        patcher = mock.patch('config.routers.replica_configured', return_value=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.router = ReplicaRouter()
+        self.factory = RequestFactory()
+        self.read_databases = {}
+
+    def get_response(self, request):
+        """Запоминает, куда роутер направляет чтение во время обработки запроса"""
+        for model in (Mailing, Session, CustomUser, Permission):
+            self.read_databases[model] = self.router.db_for_read(model)
+        return HttpResponse()
+
+    def test_safe_request_reads_from_replica(self):
+        response = ReplicaMiddleware(self.get_response)(self.factory.get('/'))
+
+        self.assertEqual(self.read_databases[Mailing], 'replica')
+        self.assertNotIn(PIN_COOKIE, response.cookies)
+
+    def test_sessions_and_users_read_from_primary(self):
+        ReplicaMiddleware(self.get_response)(self.factory.get('/'))
+
+        self.assertEqual(self.read_databases[Session], 'default')
+        self.assertEqual(self.read_databases[CustomUser], 'default')
+        self.assertEqual(self.read_databases[Permission], 'default')
+
+    def test_writing_request_pins_to_primary(self):
+        response = ReplicaMiddleware(self.get_response)(self.factory.post('/'))
+
+        self.assertEqual(self.read_databases[Mailing], 'default')
+        self.assertIn(PIN_COOKIE, response.cookies)
+
+    def test_pin_cookie_keeps_reads_on_primary(self):
+        request = self.factory.get('/')
+        request.COOKIES[PIN_COOKIE] = '1'
+        ReplicaMiddleware(self.get_response)(request)
+
+        self.assertEqual(self.read_databases[Mailing], 'default')
+
+    def test_reads_outside_requests_use_primary(self):
+        self.assertEqual(self.router.db_for_read(Mailing), 'default')
+        self.assertEqual(self.router.db_for_write(Mailing), 'default')
+
+
+class PrecompressedStaticTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.root = directory.name
+        for name in ('app.css', 'app.css.br', 'app.css.gz', 'app.1a2b3c.css'):
+            with open(os.path.join(self.root, name), 'wb') as static_file:
+                static_file.write(name.encode())
+        settings_override = override_settings(STATIC_ROOT=self.root, STATIC_URL='/static/')
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.middleware = PrecompressedStaticMiddleware(lambda request: HttpResponse('not static'))
+        self.factory = RequestFactory()
+
+    def get(self, path, accept_encoding=''):
+        return self.middleware(self.factory.get(path, headers={'Accept-Encoding': accept_encoding}))
+
+    def test_encoding_follows_client_weights(self):
+        cases = (
+            ('gzip, deflate, br', 'br'),
+            ('br;q=0, gzip', 'gzip'),
+            ('gzip;q=0', None),
+            ('br;q=0.5, gzip;q=1.0', 'gzip'),
+            ('*', 'br'),
+            ('*;q=0, gzip', 'gzip'),
+            ('', None),
+        )
+        for accept_encoding, expected in cases:
+            response = self.get('/static/app.css', accept_encoding)
+            self.assertEqual(response.get('Content-Encoding'), expected, accept_encoding)
+            self.assertEqual(response['Vary'], 'Accept-Encoding')
+
+    def test_manifest_written_after_start_marks_files_immutable(self):
+        self.assertEqual(self.get('/static/app.1a2b3c.css')['Cache-Control'], STATIC_CACHE_CONTROL)
+
+        with open(os.path.join(self.root, 'staticfiles.json'), 'w') as manifest:
+            json.dump({'version': '1.1', 'paths': {'app.css': 'app.1a2b3c.css'}, 'hash': ''}, manifest)
+
+        self.assertEqual(self.get('/static/app.1a2b3c.css')['Cache-Control'], IMMUTABLE_CACHE_CONTROL)
+        self.assertEqual(self.get('/static/app.css')['Cache-Control'], STATIC_CACHE_CONTROL)
+
+    def test_other_requests_pass_through(self):
+        self.assertEqual(self.get('/mailings/').content, b'not static')
+        self.assertEqual(self.get('/static/missing.css').content, b'not static')
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import CustomUser
+from .models import CustomUser, OutboxEmail, Suppression
 from django.contrib.auth.admin import UserAdmin
 
 
@@ -8,3 +8,17 @@ class CustomUserAdmin(UserAdmin):
     list_display = ('username', 'email', 'is_staff', 'is_active',)
     list_filter = ('is_staff', 'is_superuser', 'is_active', 'groups',)
     search_fields = ('username', 'first_name', 'last_name', 'email')
+
+
+@admin.register(OutboxEmail)
+class OutboxEmailAdmin(admin.ModelAdmin):
+    list_display = ('subject', 'recipient', 'status', 'attempts', 'created_at', 'sent_at',)
+    list_filter = ('status',)
+    search_fields = ('recipient', 'subject')
+
+
+@admin.register(Suppression)
+class SuppressionAdmin(admin.ModelAdmin):
+    list_display = ('email', 'reason', 'created_at',)
+    list_filter = ('reason',)
+    search_fields = ('email',)
@@ -0,0 +1,150 @@
+import base64
+import hashlib
+import re
+import smtplib
+import time
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.mail.backends.smtp import EmailBackend
+from django.core.mail.message import sanitize_address
+
+try:
+    from cryptography.hazmat.primitives import hashes, serialization
+    from cryptography.hazmat.primitives.asymmetric import padding
+except ImportError:
+    serialization = None
+
+SIGNED_HEADERS = ('from', 'to', 'cc', 'reply-to', 'subject', 'date', 'message-id', 'mime-version', 'content-type')
+MAX_CACHED_BODY_HASHES = 256
+WSP_RE = re.compile(rb'[ \t]+')
+TRAILING_WSP_RE = re.compile(rb'[ \t]+\r\n')
+
+_body_hashes = {}
+
+
+@lru_cache(maxsize=None)
+def load_private_key(path):
+    """Читает и разбирает закрытый ключ один раз на процесс"""
+    if serialization is None:
+        raise ImproperlyConfigured('Для подписи DKIM нужен пакет cryptography: pip install cryptography')
+    with open(path, 'rb') as key_file:
+        return serialization.load_pem_private_key(key_file.read(), password=None)
+
+
+def canonicalize_body(body):
+    """Канонизация тела relaxed (RFC 6376, 3.4.4)"""
+    body = WSP_RE.sub(b' ', body)
+    body = TRAILING_WSP_RE.sub(b'\r\n', body)
+    body = body.rstrip(b'\r\n')
+    return body + b'\r\n' if body else b''
+
+
+def canonicalize_header(name, value):
+    """Канонизация заголовка relaxed (RFC 6376, 3.4.2)"""
+    value = WSP_RE.sub(b' ', value.replace(b'\r\n', b'')).strip(b' ')
+    return name.strip().lower() + b':' + value + b'\r\n'
+
+
+def split_headers(raw_headers):
+    """Разбивает блок заголовков на пары (имя, значение) с сохранением переносов"""
+    headers = []
+    for line in raw_headers.split(b'\r\n'):
+        if line[:1] in (b' ', b'\t') and headers:
+            name, value = headers[-1]
+            headers[-1] = (name, value + b'\r\n' + line)
+        else:
+            name, _, value = line.partition(b':')
+            headers.append((name, value))
+    return headers
+
+
+def body_hash(body, key=None):
+    """Хеш канонизированного тела; с ключом результат кешируется, поскольку тело рассылки у всех одинаковое"""
+    if key is not None and key in _body_hashes:
+        return _body_hashes[key]
+    digest = base64.b64encode(hashlib.sha256(canonicalize_body(body)).digest())
+    if key is not None:
+        if len(_body_hashes) >= MAX_CACHED_BODY_HASHES:
+            _body_hashes.clear()
+        _body_hashes[key] = digest
+    return digest
+
+
+def sign(message, domain, selector, private_key, body_key=None):
+    """Возвращает письмо с заголовком DKIM-Signature (rsa-sha256, relaxed/relaxed)
+
+    body_key — ключ тела, одинакового для всех писем рассылки: хеш тела тогда
+    считается один раз, а для каждого письма подписываются только заголовки.
+    """
+    raw_headers, _, body = message.partition(b'\r\n\r\n')
+    headers = split_headers(raw_headers)
+
+    # Подписывается последний экземпляр каждого заголовка (RFC 6376, 5.4.2)
+    signed = {}
+    for name, value in headers:
+        if name.strip().lower().decode('ascii') in SIGNED_HEADERS:
+            signed[name.strip().lower()] = (name, value)
+    names = [name for name in SIGNED_HEADERS if name.encode() in signed]
+
+    value = b' v=1; a=rsa-sha256; c=relaxed/relaxed; d=%s; s=%s; t=%d;\r\n\th=%s;\r\n\tbh=%s;\r\n\tb=' % (
+        domain.encode(), selector.encode(), int(time.time()), ':'.join(names).encode(), body_hash(body, body_key),
+    )
+    signed_data = b''.join(canonicalize_header(*signed[name.encode()]) for name in names)
+    signed_data += canonicalize_header(b'DKIM-Signature', value)[:-2]
+    signature = base64.b64encode(private_key.sign(signed_data, padding.PKCS1v15(), hashes.SHA256()))
+    return b'DKIM-Signature:' + value + signature + b'\r\n' + message
+
+
+def set_boundaries(mime_message, key):
+    """Задает границы частей по ключу тела, чтобы тело рассылки было одинаковым побайтно у всех писем"""
+    for index, part in enumerate(mime_message.walk()):
+        if part.is_multipart():
+            digest = hashlib.sha1(f'{key}:{index}'.encode()).hexdigest()
+            part.set_boundary(f'==============={digest}==')
+
+
+class DkimEmailBackend(EmailBackend):
+    """SMTP-бэкенд, подписывающий письма DKIM
+
+    Настройки DKIM_SELECTOR, DKIM_PRIVATE_KEY_PATH и DKIM_DOMAIN (по умолчанию домен отправителя);
+    для аккаунта из EMAIL_ACCOUNTS их можно переопределить параметрами dkim_selector,
+    dkim_private_key_path и dkim_domain. Без ключа письма отправляются неподписанными.
+    """
+
+    def __init__(self, dkim_domain=None, dkim_selector=None, dkim_private_key_path=None, **kwargs):
+        super().__init__(**kwargs)
+        self.dkim_domain = dkim_domain or getattr(settings, 'DKIM_DOMAIN', None)
+        self.dkim_selector = dkim_selector or getattr(settings, 'DKIM_SELECTOR', None)
+        self.dkim_private_key_path = dkim_private_key_path or getattr(settings, 'DKIM_PRIVATE_KEY_PATH', None)
+
+    def message_bytes(self, email_message):
+        """Письмо в виде байтов для SMTP, подписанное, если задан ключ
+
+        Письма рассылки с атрибутом dkim_body_key (см. build_message) получают
+        одинаковые границы частей и общий хеш тела.
+        """
+        body_key = getattr(email_message, 'dkim_body_key', None)
+        mime_message = email_message.message()
+        if body_key is not None:
+            set_boundaries(mime_message, body_key)
+        message = mime_message.as_bytes(linesep='\r\n')
+        if not (self.dkim_selector and self.dkim_private_key_path):
+            return message
+        domain = self.dkim_domain or email_message.from_email.rpartition('@')[2].rstrip('>')
+        return sign(message, domain, self.dkim_selector, load_private_key(self.dkim_private_key_path), body_key)
+
+    def _send(self, email_message):
+        if not email_message.recipients():
+            return False
+        encoding = email_message.encoding or settings.DEFAULT_CHARSET
+        from_email = sanitize_address(email_message.from_email, encoding)
+        recipients = [sanitize_address(address, encoding) for address in email_message.recipients()]
+        try:
+            self.connection.sendmail(from_email, recipients, self.message_bytes(email_message))
+        except smtplib.SMTPException:
+            if not self.fail_silently:
+                raise
+            return False
+        return True
@@ -1,5 +1,23 @@
 from django import forms
-from .models import Client, Message, Mailing
+from .models import Client, Message, Mailing, MessageAttachment
+
+
+class MultipleFileInput(forms.ClearableFileInput):
+    allow_multiple_selected = True
+
+
+class MultipleFileField(forms.FileField):
+    """Поле для загрузки нескольких файлов"""
+
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('widget', MultipleFileInput())
+        super().__init__(*args, **kwargs)
+
+    def clean(self, data, initial=None):
+        single_file_clean = super().clean
+        if isinstance(data, (list, tuple)):
+            return [single_file_clean(item, initial) for item in data]
+        return [single_file_clean(data, initial)] if data else []
 
 
 class ClientForm(forms.ModelForm):
@@ -8,28 +26,49 @@ class ClientForm(forms.ModelForm):
         fields = ['email', 'full_name', 'comment']
 
     def __init__(self, *args, **kwargs):
+        self.user = kwargs.pop('user', None)
         super().__init__(*args, **kwargs)
         for field_name, field in self.fields.items():
             field.widget.attrs['class'] = 'form-control'
 
+    def clean_email(self):
+        """Проверка уникальности email среди клиентов владельца"""
+        email = self.cleaned_data.get('email')
+        owner_id = self.instance.owner_id or getattr(self.user, 'pk', None)
+        duplicates = Client.objects.filter(email__iexact=email, owner_id=owner_id).exclude(pk=self.instance.pk)
+        if owner_id and duplicates.exists():
+            raise forms.ValidationError('Клиент с таким email уже существует')
+        return email
+
 
 class MessageForm(forms.ModelForm):
+    attachments = MultipleFileField(required=False, label='Вложения')
+
     class Meta:
         model = Message
-        fields = ['subject', 'body']
+        fields = ['subject', 'body', 'html_body']
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         for field_name, field in self.fields.items():
             field.widget.attrs['class'] = 'form-control'
 
+    def save(self, commit=True):
+        message = super().save(commit)
+        if commit:
+            for uploaded_file in self.cleaned_data['attachments']:
+                MessageAttachment.objects.create(message=message, file=uploaded_file)
+        return message
+
 
 class MailingForm(forms.ModelForm):
     class Meta:
         model = Mailing
-        fields = ['message', 'clients']
+        fields = ['message', 'clients', 'start_time', 'end_time']
         widgets = {
             'message': forms.Select(attrs={'class': 'form-control'}),
+            'start_time': forms.DateTimeInput(attrs={'type': 'datetime-local'}, format='%Y-%m-%dT%H:%M'),
+            'end_time': forms.DateTimeInput(attrs={'type': 'datetime-local'}, format='%Y-%m-%dT%H:%M'),
             'clients': forms.SelectMultiple(attrs={
                 'class': 'form-control',
                 'size': '10'
@@ -46,3 +85,12 @@ class MailingForm(forms.ModelForm):
         if user:
             self.fields['message'].queryset = Message.objects.filter(owner=user)
             self.fields['clients'].queryset = Client.objects.filter(owner=user)
+
+    def clean(self):
+        """Проверка, что окончание отправки позже начала"""
+        cleaned_data = super().clean()
+        start_time = cleaned_data.get('start_time')
+        end_time = cleaned_data.get('end_time')
+        if start_time and end_time and end_time <= start_time:
+            raise forms.ValidationError('Время окончания должно быть позже времени начала')
+        return cleaned_data
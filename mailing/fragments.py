@@ -0,0 +1,55 @@
+import uuid
+
+from django.core.cache import cache
+from django.db import transaction
+
+FRAGMENT_CACHE_TIMEOUT = 60 * 60 * 24
+FRAGMENT_PARTS = ('recipients', 'attempts')
+
+
+def fragment_version_key(mailing_id, part):
+    return f'mailing:fragments:{mailing_id}:{part}'
+
+
+def _new_version():
+    return uuid.uuid4().hex[:12]
+
+
+def _collect_versions(mailing_id, cached):
+    versions = {}
+    missing = {}
+    for part in FRAGMENT_PARTS:
+        key = fragment_version_key(mailing_id, part)
+        versions[part] = cached.get(key)
+        if versions[part] is None:
+            versions[part] = missing[key] = _new_version()
+    return versions, missing
+
+
+def get_fragment_versions(mailing_id):
+    """Версии фрагментов страницы рассылки; истекшая или вытесненная версия заменяется новой"""
+    keys = [fragment_version_key(mailing_id, part) for part in FRAGMENT_PARTS]
+    versions, missing = _collect_versions(mailing_id, cache.get_many(keys))
+    if missing:
+        cache.set_many(missing, FRAGMENT_CACHE_TIMEOUT)
+    return versions
+
+
+async def aget_fragment_versions(mailing_id):
+    keys = [fragment_version_key(mailing_id, part) for part in FRAGMENT_PARTS]
+    versions, missing = _collect_versions(mailing_id, await cache.aget_many(keys))
+    if missing:
+        await cache.aset_many(missing, FRAGMENT_CACHE_TIMEOUT)
+    return versions
+
+
+def invalidate_fragments(mailing_ids, part):
+    """Меняет версию фрагмента рассылок после фиксации транзакции
+
+    До фиксации другой запрос мог бы закешировать под новой версией еще старые данные.
+    """
+    keys = [fragment_version_key(mailing_id, part) for mailing_id in set(mailing_ids) if mailing_id]
+    if keys:
+        transaction.on_commit(
+            lambda: cache.set_many({key: _new_version() for key in keys}, FRAGMENT_CACHE_TIMEOUT)
+        )
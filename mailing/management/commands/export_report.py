@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand
+from mailing.reports import EXPORT_FORMATS, REPORTS, export_report
+
+
+class Command(BaseCommand):
+    help = 'Потоковая выгрузка отчета о доставке рассылок в CSV или JSONL'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--kind',
+            choices=list(REPORTS),
+            default='attempts',
+            help='attempts — попытки отправки, recipients — состояние по получателям (по умолчанию attempts)',
+        )
+        parser.add_argument(
+            '--format',
+            choices=list(EXPORT_FORMATS),
+            default='csv',
+            help='Формат выгрузки (по умолчанию csv)',
+        )
+        parser.add_argument(
+            '--mailing',
+            type=int,
+            action='append',
+            help='id рассылки; можно указать несколько раз, без параметра выгружаются все рассылки',
+        )
+        parser.add_argument(
+            '--output',
+            help='Файл для записи отчета (по умолчанию стандартный вывод)',
+        )
+
+    def handle(self, *args, **options):
+        rows = export_report(options['kind'], options['format'], options['mailing'])
+        if not options['output']:
+            for chunk in rows:
+                self.stdout.write(chunk, ending='')
+            return
+
+        with open(options['output'], 'w', encoding='utf-8', newline='') as output:
+            output.writelines(rows)
+        self.stdout.write(self.style.SUCCESS(f'Отчет записан в {options["output"]}'))
@@ -1,20 +1,106 @@
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from mailing.notifications import SCHEDULE_CHANNEL, listen, refresh_connection, wait_for_notification
 from mailing.models import Mailing
-from mailing.services import send_mailing
+from mailing.services import (
+    claim_mailing,
+    close_expired_mailings,
+    get_due_mailings,
+    get_next_schedule_event,
+    send_mailing,
+)
+from mailing.simulation import SmtpSimulator, simulate_mailings
 
 
 class Command(BaseCommand):
-    help = 'Автоматическая отправка активных рассылок'
+    help = 'Автоматическая отправка рассылок, время начала которых наступило'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--daemon',
+            action='store_true',
+            help='Работать постоянно, просыпаясь к ближайшему времени начала или окончания рассылки',
+        )
+        parser.add_argument(
+            '--max-sleep',
+            type=int,
+            default=3600,
+            help='Максимальная пауза между проверками расписания в секундах (по умолчанию 3600)',
+        )
+        simulation = parser.add_argument_group('Пробный прогон без отправки писем')
+        simulation.add_argument(
+            '--simulate',
+            action='store_true',
+            help='Прогнать рассылки через весь конвейер с имитацией SMTP-сервера и оценить длительность, '
+                 'запись в базу и пик памяти; изменения в базе откатываются',
+        )
+        simulation.add_argument(
+            '--mailing',
+            type=int,
+            action='append',
+            help='id рассылки для прогона; можно указать несколько раз (по умолчанию — рассылки, готовые к отправке)',
+        )
+        simulation.add_argument(
+            '--latency',
+            type=float,
+            default=200,
+            help='Средняя длительность SMTP-транзакции в миллисекундах (по умолчанию 200)',
+        )
+        simulation.add_argument(
+            '--error-rate',
+            type=float,
+            default=0.0,
+            help='Доля адресов, отклоняемых сервером, от 0 до 1 (по умолчанию 0)',
+        )
+        simulation.add_argument(
+            '--throttle',
+            type=float,
+            default=0,
+            help='Ограничение сервера, писем в секунду (по умолчанию без ограничения)',
+        )
+        simulation.add_argument(
+            '--batch-size',
+            type=int,
+            default=100,
+            help='Размер пачки отправки (по умолчанию 100)',
+        )
+        simulation.add_argument(
+            '--seed',
+            type=int,
+            help='Начальное значение генератора случайных чисел для воспроизводимого прогона',
+        )
+        simulation.add_argument(
+            '--trace-memory',
+            action='store_true',
+            help='Измерять пик памяти через tracemalloc: точнее, но прогон идет в несколько раз медленнее',
+        )
+        simulation.add_argument(
+            '--keep-attempts',
+            action='store_true',
+            help='Сохранить попытки рассылок из прогона (с пометкой "Симуляция")',
+        )
 
     def handle(self, *args, **options):
+        if options['simulate']:
+            self.simulate(options)
+        elif options['daemon']:
+            self.run_daemon(options['max_sleep'])
+        else:
+            self.dispatch_due_mailings()
 
-        active_mailings = Mailing.objects.filter(
-            status__in=['created', 'started']
-        )
+    def dispatch_due_mailings(self):
+        closed = close_expired_mailings()
+        if closed:
+            self.stdout.write(f'Завершено рассылок по времени окончания: {closed}')
+
+        due_mailings = list(get_due_mailings())
 
-        self.stdout.write(f'Найдено рассылок для отправки: {active_mailings.count()}')
+        self.stdout.write(f'Найдено рассылок для отправки: {len(due_mailings)}')
+
+        for mailing in due_mailings:
+            if not claim_mailing(mailing):
+                continue
 
-        for mailing in active_mailings:
             self.stdout.write(f'Отправка рассылки #{mailing.id} "{mailing.message.subject}"...')
 
             sent, failed = send_mailing(mailing)
@@ -24,3 +110,60 @@ class Command(BaseCommand):
                     f'Рассылка #{mailing.id}: отправлено {sent}, ошибок {failed}'
                 )
             )
+
+    def run_daemon(self, max_sleep):
+        listening = listen(SCHEDULE_CHANNEL)
+
+        while True:
+            listening = refresh_connection(SCHEDULE_CHANNEL, listening)
+            self.dispatch_due_mailings()
+
+            timeout = max_sleep
+            next_event = get_next_schedule_event()
+            if next_event:
+                seconds_left = (next_event - timezone.now()).total_seconds()
+                timeout = min(max(seconds_left, 0), max_sleep)
+
+            self.stdout.write(f'Следующая проверка расписания через {timeout:.0f} с')
+            wait_for_notification(timeout, listening)
+
+    def simulate(self, options):
+        if options['mailing']:
+            mailings = list(Mailing.objects.filter(pk__in=options['mailing']).select_related('message'))
+        else:
+            mailings = list(get_due_mailings())
+        if not mailings:
+            raise CommandError('Нет рассылок для пробного прогона')
+
+        simulator = SmtpSimulator(
+            latency=options['latency'] / 1000,
+            error_rate=options['error_rate'],
+            throttle=options['throttle'],
+            seed=options['seed'],
+        )
+        results, stats = simulate_mailings(
+            mailings, simulator, options['batch_size'], options['keep_attempts'], options['trace_memory'],
+        )
+
+        for mailing, sent, failed in results:
+            self.stdout.write(f'Рассылка #{mailing.id}: было бы отправлено {sent}, ошибок {failed}')
+        self.stdout.write(
+            f'Прогнозируемая длительность: {stats["duration"]:.1f} с '
+            f'(ожидание SMTP {stats["smtp_wait"]:.1f} с, обработка {stats["duration"] - stats["smtp_wait"]:.1f} с)'
+        )
+        self.stdout.write(
+            f'SMTP: транзакций {stats["transactions"]}, адресов {stats["recipients"]}, '
+            f'отклонено {stats["refused"]}, передано {stats["bytes"] / 1024 / 1024:.1f} МБ'
+        )
+        writes = ', '.join(
+            f'{statement} {count} запросов / {stats["rows"][statement]} строк'
+            for statement, count in stats['statements'].items()
+        )
+        self.stdout.write(f'База данных: чтений {stats["reads"]}; {writes}')
+        memory = 'Пик памяти Python (tracemalloc)' if options['trace_memory'] else 'Прирост пиковой памяти процесса'
+        self.stdout.write(f'{memory}: {stats["peak_memory"] / 1024 / 1024:.1f} МБ')
+        if stats['unchecked_domains']:
+            self.stdout.write(f'Доменов без ответа в кеше MX (считаются рабочими): {stats["unchecked_domains"]}')
+        if stats['kept_attempts']:
+            self.stdout.write(f'Сохранено попыток рассылок: {stats["kept_attempts"]}')
+        self.stdout.write(self.style.SUCCESS('Пробный прогон завершен, изменения в базе отменены'))
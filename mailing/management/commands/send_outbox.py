@@ -0,0 +1,48 @@
+from django.core.management.base import BaseCommand
+from mailing.notifications import OUTBOX_CHANNEL, listen, refresh_connection, wait_for_notification
+from mailing.outbox import drain_outbox
+from mailing.smtp_pool import SmtpPool
+
+
+class Command(BaseCommand):
+    help = 'Отправка писем из очереди через пул переиспользуемых SMTP-соединений'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--daemon',
+            action='store_true',
+            help='Работать постоянно, отправляя письма по мере появления в очереди',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=100,
+            help='Количество писем, отправляемых за один проход (по умолчанию 100)',
+        )
+        parser.add_argument(
+            '--interval',
+            type=int,
+            default=5,
+            help='Пауза между проверками пустой очереди в секундах (по умолчанию 5)',
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        listening = listen(OUTBOX_CHANNEL) if options['daemon'] else False
+        pool = SmtpPool()
+
+        try:
+            while True:
+                listening = refresh_connection(OUTBOX_CHANNEL, listening)
+                sent, failed, claimed = drain_outbox(pool, batch_size)
+                if sent or failed:
+                    self.stdout.write(
+                        self.style.SUCCESS(f'Очередь писем: отправлено {sent}, ошибок {failed}')
+                    )
+                if claimed == batch_size:
+                    continue
+                if not options['daemon']:
+                    break
+                wait_for_notification(options['interval'], listening)
+        finally:
+            pool.close()
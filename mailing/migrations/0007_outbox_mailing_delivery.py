@@ -0,0 +1,79 @@
+import hashlib
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def fill_idempotency_keys(apps, schema_editor):
+    OutboxEmail = apps.get_model('mailing', 'OutboxEmail')
+    emails = list(OutboxEmail.objects.all())
+    for email in emails:
+        email.idempotency_key = f'legacy:{email.pk}'
+        email.message_id = f'<{hashlib.sha1(email.idempotency_key.encode()).hexdigest()}@localhost>'
+    OutboxEmail.objects.bulk_update(emails, ['idempotency_key', 'message_id'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mailing', '0006_outboxemail'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='outboxemail',
+            name='idempotency_key',
+            field=models.CharField(max_length=255, null=True, verbose_name='Ключ идемпотентности'),
+        ),
+        migrations.AddField(
+            model_name='outboxemail',
+            name='message_id',
+            field=models.CharField(default='', max_length=255, verbose_name='Message-ID'),
+            preserve_default=False,
+        ),
+        migrations.RunPython(fill_idempotency_keys, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='outboxemail',
+            name='idempotency_key',
+            field=models.CharField(max_length=255, unique=True, verbose_name='Ключ идемпотентности'),
+        ),
+        migrations.AddField(
+            model_name='mailingattempt',
+            name='client',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='mailing.client', verbose_name='Клиент'),
+        ),
+        migrations.AddField(
+            model_name='outboxemail',
+            name='claimed_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Дата и время захвата отправителем'),
+        ),
+        migrations.AddField(
+            model_name='outboxemail',
+            name='client',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='mailing.client', verbose_name='Клиент'),
+        ),
+        migrations.AddField(
+            model_name='outboxemail',
+            name='mailing',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='outbox_emails', to='mailing.mailing', verbose_name='Рассылка'),
+        ),
+        migrations.AlterField(
+            model_name='outboxemail',
+            name='body',
+            field=models.TextField(blank=True, verbose_name='Тело письма'),
+        ),
+        migrations.AlterField(
+            model_name='outboxemail',
+            name='status',
+            field=models.CharField(choices=[('pending', 'В очереди'), ('sending', 'Отправляется'), ('sent', 'Отправлено'), ('failed', 'Не отправлено'), ('cancelled', 'Отменено')], default='pending', max_length=10, verbose_name='Статус'),
+        ),
+        migrations.AlterField(
+            model_name='outboxemail',
+            name='subject',
+            field=models.CharField(blank=True, max_length=255, verbose_name='Тема письма'),
+        ),
+        migrations.AddIndex(
+            model_name='outboxemail',
+            index=models.Index(fields=['mailing', 'status'], name='outbox_mailing_status_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 11:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mailing', '0009_message_html_attachments'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='mailing',
+            name='status',
+            field=models.CharField(choices=[('created', 'Создана'), ('started', 'Запущена'), ('completed', 'Завершена'), ('interrupted', 'Прервана')], default='created', max_length=11, verbose_name='Статус'),
+        ),
+    ]
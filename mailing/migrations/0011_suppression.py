@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-19 11:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mailing', '0010_mailing_interrupted_status'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Suppression',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('email', models.EmailField(max_length=254, unique=True, verbose_name='Электронная почта (в нижнем регистре)')),
+                ('reason', models.CharField(choices=[('bounce', 'Недоставка'), ('unsubscribe', 'Отписка'), ('complaint', 'Жалоба на спам')], max_length=20, verbose_name='Причина')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата и время добавления')),
+            ],
+            options={
+                'verbose_name': 'Подавленный адрес',
+                'verbose_name_plural': 'Список подавления',
+            },
+        ),
+        migrations.AlterField(
+            model_name='client',
+            name='email',
+            field=models.EmailField(max_length=254, verbose_name='Электронная почта'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 11:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mailing', '0011_suppression'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='suppression',
+            name='reason',
+            field=models.CharField(choices=[('bounce', 'Недоставка'), ('unsubscribe', 'Отписка'), ('complaint', 'Жалоба на спам'), ('invalid', 'Недействительный адрес')], max_length=20, verbose_name='Причина'),
+        ),
+    ]
@@ -0,0 +1,41 @@
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.operations import TrigramExtension
+from django.contrib.postgres.search import SearchVector
+from django.db import migrations
+
+SEARCH_INDEXES = [
+    ('client', GinIndex(fields=['email'], opclasses=['gin_trgm_ops'], name='client_email_trgm_idx')),
+    ('client', GinIndex(fields=['full_name'], opclasses=['gin_trgm_ops'], name='client_full_name_trgm_idx')),
+    ('client', GinIndex(SearchVector('comment', config='russian'), name='client_comment_search_idx')),
+    ('message', GinIndex(
+        SearchVector('subject', weight='A', config='russian') + SearchVector('body', weight='B', config='russian'),
+        name='message_search_idx',
+    )),
+]
+
+
+def create_search_indexes(apps, schema_editor):
+    """GIN-индексы поиска создаются только в PostgreSQL; в SQLite поиск работает без них"""
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for model_name, index in SEARCH_INDEXES:
+        schema_editor.add_index(apps.get_model('mailing', model_name), index)
+
+
+def drop_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for model_name, index in SEARCH_INDEXES:
+        schema_editor.remove_index(apps.get_model('mailing', model_name), index)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mailing', '0012_suppression_invalid_reason'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.RunPython(create_search_indexes, drop_search_indexes),
+    ]
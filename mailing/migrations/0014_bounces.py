@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-19 11:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mailing', '0013_search_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='mailingattempt',
+            name='message_id',
+            field=models.CharField(blank=True, db_index=True, max_length=255, verbose_name='Message-ID'),
+        ),
+        migrations.AlterField(
+            model_name='mailingattempt',
+            name='status',
+            field=models.CharField(choices=[('success', 'Успешно'), ('failure', 'Не успешно'), ('bounced', 'Возврат')], max_length=10, verbose_name='Статус попытки'),
+        ),
+        migrations.AlterField(
+            model_name='outboxemail',
+            name='message_id',
+            field=models.CharField(db_index=True, max_length=255, verbose_name='Message-ID'),
+        ),
+        migrations.AlterField(
+            model_name='outboxemail',
+            name='status',
+            field=models.CharField(choices=[('pending', 'В очереди'), ('sending', 'Отправляется'), ('sent', 'Отправлено'), ('failed', 'Не отправлено'), ('bounced', 'Возврат'), ('cancelled', 'Отменено')], default='pending', max_length=10, verbose_name='Статус'),
+        ),
+    ]
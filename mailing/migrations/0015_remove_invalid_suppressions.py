@@ -0,0 +1,22 @@
+from django.db import migrations, models
+
+
+def delete_invalid_suppressions(apps, schema_editor):
+    """Адреса, не прошедшие проверку синтаксиса или DNS, больше не подавляются навсегда"""
+    apps.get_model('mailing', 'Suppression').objects.filter(reason='invalid').delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mailing', '0014_bounces'),
+    ]
+
+    operations = [
+        migrations.RunPython(delete_invalid_suppressions, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='suppression',
+            name='reason',
+            field=models.CharField(choices=[('bounce', 'Недоставка'), ('unsubscribe', 'Отписка'), ('complaint', 'Жалоба на спам')], max_length=20, verbose_name='Причина'),
+        ),
+    ]
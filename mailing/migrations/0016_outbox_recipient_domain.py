@@ -0,0 +1,30 @@
+from django.db import migrations, models
+from django.db.models import Value
+from django.db.models.functions import Lower, StrIndex, Substr
+
+
+def fill_recipient_domains(apps, schema_editor):
+    OutboxEmail = apps.get_model('mailing', 'OutboxEmail')
+    OutboxEmail.objects.update(
+        recipient_domain=Lower(Substr('recipient', StrIndex('recipient', Value('@')) + 1)),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mailing', '0015_remove_invalid_suppressions'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='outboxemail',
+            name='recipient_domain',
+            field=models.CharField(blank=True, editable=False, max_length=255, verbose_name='Домен получателя'),
+        ),
+        migrations.RunPython(fill_recipient_domains, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='outboxemail',
+            index=models.Index(fields=['recipient_domain', 'status', 'id'], name='outbox_domain_status_idx'),
+        ),
+    ]
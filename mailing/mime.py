@@ -0,0 +1,114 @@
+import base64
+import mimetypes
+import mmap
+import os
+import tempfile
+import uuid
+from contextlib import ExitStack, contextmanager
+from email.mime.base import MIMEBase
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives
+from django.core.mail.message import SafeMIMEMultipart
+
+DEFAULT_ATTACHMENT_MIME_TYPE = 'application/octet-stream'
+ENCODED_SUFFIX = '.b64'
+# 57 байт исходных данных — ровно одна строка base64 из 76 символов
+ENCODE_CHUNK_SIZE = 57 * 16 * 1024
+
+
+def encoded_path(path):
+    """Путь к закодированной в base64 копии вложения рядом с исходным файлом"""
+    return f'{path}{ENCODED_SUFFIX}'
+
+
+def encode_to_file(path):
+    """Кодирует вложение в base64 со строками CRLF в файл рядом с ним, если копии еще нет или она устарела
+
+    Файл читается порциями, а готовая копия подменяется атомарно, поэтому процессы,
+    кодирующие одно вложение одновременно, не мешают друг другу.
+    """
+    target = encoded_path(path)
+    if os.path.exists(target) and os.path.getmtime(target) >= os.path.getmtime(path):
+        return target
+
+    handle, temporary = tempfile.mkstemp(dir=os.path.dirname(target), suffix=ENCODED_SUFFIX)
+    try:
+        with open(path, 'rb') as source, os.fdopen(handle, 'wb') as encoded:
+            while chunk := source.read(ENCODE_CHUNK_SIZE):
+                encoded.write(base64.encodebytes(chunk).replace(b'\n', b'\r\n'))
+        os.replace(temporary, target)
+    except BaseException:
+        os.unlink(temporary)
+        raise
+    return target
+
+
+class EncodedAttachment(MIMEBase):
+    """Часть письма со вложением, содержимое которой берется из закодированного файла
+
+    Вместо данных в части хранится маркер; при сериализации письма (SplicedMIMEMultipart.as_bytes)
+    на его место подставляется файл, отображенный в память через mmap.
+    """
+
+    def __init__(self, path, filename):
+        mimetype = mimetypes.guess_type(filename)[0] or DEFAULT_ATTACHMENT_MIME_TYPE
+        super().__init__(*mimetype.split('/', 1))
+        self.encoded_path = encode_to_file(path)
+        self.marker = f'attachment-{uuid.uuid4().hex}'
+        self.set_payload(self.marker)
+        self['Content-Transfer-Encoding'] = 'base64'
+        self.add_header('Content-Disposition', 'attachment', filename=filename)
+
+
+class SplicedMIMEMultipart(SafeMIMEMultipart):
+    """Письмо со вложениями EncodedAttachment: данные вложений подставляются при сериализации"""
+
+    def as_bytes(self, unixfrom=False, linesep='\n'):
+        data = super().as_bytes(unixfrom, linesep)
+        attachments = [part for part in self.get_payload() if isinstance(part, EncodedAttachment)]
+        if not attachments:
+            return data
+        chunks = []
+        start = 0
+        with ExitStack() as stack:
+            for part in attachments:
+                marker = (part.marker + linesep).encode('ascii')
+                index = data.index(marker, start)
+                chunks.append(memoryview(data)[start:index])
+                chunks.append(stack.enter_context(open_encoded(part.encoded_path, linesep)))
+                start = index + len(marker)
+            chunks.append(memoryview(data)[start:])
+            return b''.join(chunks)
+
+
+@contextmanager
+def open_encoded(path, linesep):
+    """Закодированное вложение; со строками CRLF (как для SMTP) файл отображается в память без копирования"""
+    if not os.path.getsize(path):
+        yield b''
+        return
+    with open(path, 'rb') as encoded, mmap.mmap(encoded.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        yield mapped if linesep == '\r\n' else mapped[:].replace(b'\r\n', linesep.encode('ascii'))
+
+
+class AttachmentEmailMessage(EmailMultiAlternatives):
+    """Письмо рассылки, которое собирает вложения в SplicedMIMEMultipart"""
+
+    def _create_attachments(self, msg):
+        if not self.attachments:
+            return msg
+        mixed = SplicedMIMEMultipart(_subtype=self.mixed_subtype, encoding=self.encoding or settings.DEFAULT_CHARSET)
+        if self.body or msg.is_multipart():
+            mixed.attach(msg)
+        for attachment in self.attachments:
+            mixed.attach(attachment)
+        return mixed
+
+
+def encode_message_attachments(message):
+    """Кодирует все вложения сообщения в файлы; части затем переиспользуются для каждого получателя"""
+    return tuple(
+        EncodedAttachment(attachment.file.path, attachment.filename)
+        for attachment in message.attachments.all()
+    )
@@ -1,12 +1,22 @@
+from pathlib import Path
+
+from django.core.cache import cache
 from django.db import models
 from django.urls import reverse
+from django.utils import timezone
 
 from users.models import CustomUser
 
+USER_NUMBER_CACHE_TIMEOUT = 60 * 60 * 24
+
+
+def user_number_key(mailing_id):
+    return f'mailing:user-number:{mailing_id}'
+
 
 class Client(models.Model):
     """Модель клиента (получателя рассылки)"""
-    email = models.EmailField(unique=True, verbose_name='Электронная почта')
+    email = models.EmailField(verbose_name='Электронная почта')
     full_name = models.CharField(max_length=255, verbose_name='Ф. И. О.')
     comment = models.TextField(blank=True, verbose_name='Комментарий')
     owner = models.ForeignKey(
@@ -32,6 +42,8 @@ class Message(models.Model):
     """ Модель сообщение"""
     subject = models.CharField(max_length=255, verbose_name='Тема письма')
     body = models.TextField(verbose_name='Тело письма')
+    html_body = models.TextField(blank=True, verbose_name='HTML-версия письма')
+    version = models.PositiveIntegerField(default=1, editable=False, verbose_name='Версия')
     owner = models.ForeignKey(
         CustomUser,
         on_delete=models.CASCADE,
@@ -46,6 +58,37 @@ class Message(models.Model):
     def __str__(self):
         return self.subject
 
+    def save(self, *args, **kwargs):
+        """Увеличивает версию при каждом изменении, чтобы сбросить скомпилированный шаблон"""
+        if self.pk:
+            self.version += 1
+            update_fields = kwargs.get('update_fields')
+            if update_fields is not None:
+                kwargs['update_fields'] = {*update_fields, 'version'}
+        super().save(*args, **kwargs)
+
+
+class MessageAttachment(models.Model):
+    """Модель вложение сообщения"""
+    message = models.ForeignKey(
+        Message,
+        on_delete=models.CASCADE,
+        verbose_name='Сообщение',
+        related_name='attachments'
+    )
+    file = models.FileField(upload_to='attachments/', verbose_name='Файл')
+
+    class Meta:
+        verbose_name = 'Вложение'
+        verbose_name_plural = 'Вложения'
+
+    def __str__(self):
+        return self.filename
+
+    @property
+    def filename(self):
+        return Path(self.file.name).name
+
 
 class Mailing(models.Model):
     """ Модель рассылка"""
@@ -53,12 +96,13 @@ class Mailing(models.Model):
         ('created', 'Создана'),
         ('started', 'Запущена'),
         ('completed', 'Завершена'),
+        ('interrupted', 'Прервана'),
     ]
 
     start_time = models.DateTimeField(verbose_name='Дата и время начала отправки', null=True, blank=True)
     end_time = models.DateTimeField(verbose_name='Дата и время окончания отправки', null=True, blank=True)
     status = models.CharField(
-        max_length=10,
+        max_length=11,
         choices=STATUS_CHOICES,
         default='created',
         verbose_name='Статус'
@@ -78,17 +122,24 @@ class Mailing(models.Model):
         permissions = [
             ("can_disable_mailings", "Может отключать рассылки"),
         ]
+        indexes = [
+            models.Index(fields=['status', 'start_time'], name='mailing_status_start_idx'),
+            models.Index(fields=['status', 'end_time'], name='mailing_status_end_idx'),
+        ]
 
     def __str__(self):
         return f'Рассылка {self.id} от {self.start_time}'
 
     def get_user_mailing_number(self):
-        """Возвращает номер рассылки в рамках пользователя"""
-        user_mailings = Mailing.objects.filter(owner=self.owner).order_by('id')
-        for index, mailing in enumerate(user_mailings, 1):
-            if mailing.id == self.id:
-                return index
-        return None
+        """Возвращает номер рассылки в рамках пользователя
+
+        Номер кешируется: он меняется, только когда удаляется более ранняя рассылка владельца.
+        """
+        return cache.get_or_set(
+            user_number_key(self.pk),
+            lambda: Mailing.objects.filter(owner_id=self.owner_id, id__lte=self.id).count(),
+            USER_NUMBER_CACHE_TIMEOUT,
+        )
 
 
 class MailingAttempt(models.Model):
@@ -96,12 +147,21 @@ class MailingAttempt(models.Model):
     STATUS_CHOICES = [
         ('success', 'Успешно'),
         ('failure', 'Не успешно'),
+        ('bounced', 'Возврат'),
     ]
 
     attempt_time = models.DateTimeField(auto_now_add=True, verbose_name='Дата и время попытки')
     status = models.CharField(max_length=10, choices=STATUS_CHOICES, verbose_name='Статус попытки')
     server_response = models.TextField(blank=True, verbose_name='Ответ почтового сервера')
+    message_id = models.CharField(max_length=255, blank=True, db_index=True, verbose_name='Message-ID')
     mailing = models.ForeignKey(Mailing, on_delete=models.CASCADE, verbose_name='Рассылка')
+    client = models.ForeignKey(
+        Client,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        verbose_name='Клиент'
+    )
     owner = models.ForeignKey(
         CustomUser,
         on_delete=models.CASCADE,
@@ -116,3 +176,101 @@ class MailingAttempt(models.Model):
 
     def __str__(self):
         return f'Попытка {self.id} для рассылки {self.mailing.id}'
+
+
+class OutboxEmail(models.Model):
+    """Модель письмо в очереди на отправку"""
+    STATUS_CHOICES = [
+        ('pending', 'В очереди'),
+        ('sending', 'Отправляется'),
+        ('sent', 'Отправлено'),
+        ('failed', 'Не отправлено'),
+        ('bounced', 'Возврат'),
+        ('cancelled', 'Отменено'),
+    ]
+
+    idempotency_key = models.CharField(max_length=255, unique=True, verbose_name='Ключ идемпотентности')
+    message_id = models.CharField(max_length=255, db_index=True, verbose_name='Message-ID')
+    mailing = models.ForeignKey(
+        Mailing,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        verbose_name='Рассылка',
+        related_name='outbox_emails'
+    )
+    client = models.ForeignKey(
+        Client,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        verbose_name='Клиент'
+    )
+    subject = models.CharField(max_length=255, blank=True, verbose_name='Тема письма')
+    body = models.TextField(blank=True, verbose_name='Тело письма')
+    from_email = models.EmailField(blank=True, verbose_name='Отправитель')
+    recipient = models.EmailField(verbose_name='Получатель')
+    recipient_domain = models.CharField(max_length=255, blank=True, editable=False, verbose_name='Домен получателя')
+    status = models.CharField(
+        max_length=10,
+        choices=STATUS_CHOICES,
+        default='pending',
+        verbose_name='Статус'
+    )
+    attempts = models.PositiveSmallIntegerField(default=0, verbose_name='Количество попыток')
+    last_error = models.TextField(blank=True, verbose_name='Последняя ошибка')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='Дата и время постановки в очередь')
+    next_attempt_at = models.DateTimeField(default=timezone.now, verbose_name='Дата и время следующей попытки')
+    claimed_at = models.DateTimeField(null=True, blank=True, verbose_name='Дата и время захвата отправителем')
+    sent_at = models.DateTimeField(null=True, blank=True, verbose_name='Дата и время отправки')
+
+    class Meta:
+        verbose_name = 'Письмо в очереди'
+        verbose_name_plural = 'Очередь писем'
+        ordering = ['id']
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='outbox_status_next_idx'),
+            models.Index(fields=['mailing', 'status'], name='outbox_mailing_status_idx'),
+            models.Index(fields=['recipient_domain', 'status', 'id'], name='outbox_domain_status_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.subject} → {self.recipient}'
+
+    def save(self, *args, **kwargs):
+        self.recipient_domain = email_domain(self.recipient)
+        super().save(*args, **kwargs)
+
+
+class Suppression(models.Model):
+    """Модель адрес в списке подавления (недоставки и отписки)"""
+    REASON_CHOICES = [
+        ('bounce', 'Недоставка'),
+        ('unsubscribe', 'Отписка'),
+        ('complaint', 'Жалоба на спам'),
+    ]
+
+    email = models.EmailField(unique=True, verbose_name='Электронная почта (в нижнем регистре)')
+    reason = models.CharField(max_length=20, choices=REASON_CHOICES, verbose_name='Причина')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='Дата и время добавления')
+
+    class Meta:
+        verbose_name = 'Подавленный адрес'
+        verbose_name_plural = 'Список подавления'
+
+    def __str__(self):
+        return f'{self.email} ({self.get_reason_display()})'
+
+    def save(self, *args, **kwargs):
+        self.email = normalize_email(self.email)
+        super().save(*args, **kwargs)
+
+
+def email_domain(email):
+    """Домен адреса в нижнем регистре: по нему письма группируются в маршруты доставки"""
+    return email.rpartition('@')[2].lower()
+
+
+def normalize_email(email):
+    """Приводит адрес к виду, в котором он хранится в списке подавления"""
+    return email.strip().lower()
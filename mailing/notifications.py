@@ -0,0 +1,50 @@
+import select
+
+from django.db import close_old_connections, connection
+
+SCHEDULE_CHANNEL = 'mailing_schedule'
+OUTBOX_CHANNEL = 'mailing_outbox'
+
+
+def notify(channel):
+    """Отправляет уведомление фоновым процессам (только PostgreSQL)"""
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute(f'NOTIFY {channel}')
+
+
+def listen(channel):
+    """Подписывает текущее соединение на уведомления канала"""
+    if connection.vendor != 'postgresql':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute(f'LISTEN {channel}')
+    return True
+
+
+def wait_for_notification(timeout, listening):
+    """Ждет уведомления по подписанным каналам или истечения таймаута"""
+    if not listening:
+        select.select([], [], [], timeout)
+        return
+
+    raw_connection = connection.connection
+    if select.select([raw_connection], [], [], timeout)[0]:
+        if hasattr(raw_connection, 'poll'):
+            raw_connection.poll()
+            raw_connection.notifies.clear()
+        else:
+            for _ in raw_connection.notifies(timeout=0):
+                pass
+
+
+def refresh_connection(channel, listening):
+    """Закрывает сбойное соединение и при необходимости заново подписывается на канал
+
+    Фоновые процессы не получают сигналов начала и конца запроса, поэтому проверяют
+    соединение сами; подписка LISTEN живет только на закрытом соединении.
+    """
+    close_old_connections()
+    if listening and connection.connection is None:
+        return listen(channel)
+    return listening
@@ -0,0 +1,417 @@
+import hashlib
+import uuid
+from datetime import timedelta
+from itertools import groupby
+from operator import attrgetter
+from smtplib import SMTPServerDisconnected
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.mail import EmailMessage
+from django.core.mail.message import sanitize_address
+from django.core.mail.utils import DNS_NAME
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Q
+from django.utils import timezone
+
+from .fragments import invalidate_fragments
+from .mime import AttachmentEmailMessage
+from .models import Client, Mailing, MailingAttempt, OutboxEmail, email_domain
+from .notifications import OUTBOX_CHANNEL, notify
+from .progress import record_progress, set_progress_status
+from .smtp_pool import PoolExhausted, SmtpPool, is_account_error
+from .suppression import suppressed
+from .templating import TEMPLATE_FIELDS, compile_message
+
+MAX_ATTEMPTS = 5
+RETRY_DELAY = timedelta(minutes=1)
+LEASE_TIMEOUT = timedelta(minutes=10)
+ENQUEUE_CHUNK_SIZE = 2000
+CANCEL_CHECK_EVERY = 20
+CANCEL_FLAG_TIMEOUT = 60 * 60 * 24
+
+
+def cancellation_key(mailing_id):
+    return f'mailing:cancelled:{mailing_id}'
+
+
+def request_cancellation(mailing_ids):
+    """Выставляет в кеше флаг отмены, который проверяют работающие отправители"""
+    cache.set_many({cancellation_key(mailing_id): True for mailing_id in mailing_ids}, CANCEL_FLAG_TIMEOUT)
+
+
+def get_cancelled_mailings(mailing_ids):
+    """Возвращает id рассылок из списка, для которых запрошена отмена"""
+    keys = {cancellation_key(mailing_id): mailing_id for mailing_id in mailing_ids}
+    return {keys[key] for key in cache.get_many(keys)}
+
+
+def make_message_id(idempotency_key):
+    """Строит постоянный Message-ID по ключу идемпотентности"""
+    digest = hashlib.sha1(idempotency_key.encode()).hexdigest()
+    return f'<{digest}@{DNS_NAME}>'
+
+
+def enqueue_email(subject, body, recipient, from_email=None, idempotency_key=None):
+    """Ставит письмо в очередь; повторная постановка с тем же ключом ничего не делает"""
+    idempotency_key = idempotency_key or f'email:{uuid.uuid4().hex}'
+    email, created = OutboxEmail.objects.get_or_create(
+        idempotency_key=idempotency_key,
+        defaults={
+            'message_id': make_message_id(idempotency_key),
+            'subject': subject,
+            'body': body,
+            'recipient': recipient,
+            'from_email': from_email or '',
+        },
+    )
+    if created:
+        transaction.on_commit(lambda: notify(OUTBOX_CHANNEL))
+    return email
+
+
+def enqueue_mailing(mailing, exclude_clients=()):
+    """Ставит в очередь письма рассылки всем получателям, которым они еще не ставились
+
+    Адреса из списка подавления отсекаются в том же запросе через anti-join;
+    клиенты из exclude_clients (не прошедшие проверку адреса) пропускаются.
+    """
+    recipients = mailing.clients.filter(~suppressed()).values_list('id', 'email').iterator(
+        chunk_size=ENQUEUE_CHUNK_SIZE
+    )
+    chunk = []
+    for client_id, email in recipients:
+        if client_id in exclude_clients:
+            continue
+        idempotency_key = f'mailing:{mailing.pk}:client:{client_id}'
+        chunk.append(OutboxEmail(
+            idempotency_key=idempotency_key,
+            message_id=make_message_id(idempotency_key),
+            mailing=mailing,
+            client_id=client_id,
+            recipient=email,
+            recipient_domain=email_domain(email),
+        ))
+        if len(chunk) == ENQUEUE_CHUNK_SIZE:
+            OutboxEmail.objects.bulk_create(chunk, ignore_conflicts=True)
+            chunk = []
+    if chunk:
+        OutboxEmail.objects.bulk_create(chunk, ignore_conflicts=True)
+    transaction.on_commit(lambda: notify(OUTBOX_CHANNEL))
+
+
+def claim_batch(batch_size, mailing=None):
+    """Захватывает пачку писем, чтобы ее не отправил другой процесс
+
+    Пачка собирается по маршрутам: сначала письма на домен самого старого письма очереди,
+    остаток — письма на другие домены подряд по домену. Так письма одного домена уходят
+    одной серией через закрепленное за доменом соединение, а старые письма не ждут.
+    Письма, захваченные упавшим процессом, возвращаются в работу по истечении LEASE_TIMEOUT.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        queryset = OutboxEmail.objects.select_for_update(skip_locked=True, of=('self',)).filter(
+            Q(status='pending', next_attempt_at__lte=now)
+            | Q(status='sending', claimed_at__lt=now - LEASE_TIMEOUT),
+            Q(mailing__isnull=True) | Q(mailing__status='started'),
+        )
+        if mailing is not None:
+            queryset = queryset.filter(mailing=mailing)
+        head = queryset.order_by('id').values_list('recipient_domain', flat=True).first()
+        if head is None:
+            return []
+        ids = list(queryset.filter(recipient_domain=head).order_by('id').values_list('id', flat=True)[:batch_size])
+        if len(ids) < batch_size:
+            ids += queryset.exclude(recipient_domain=head).order_by('recipient_domain', 'id').values_list(
+                'id', flat=True,
+            )[:batch_size - len(ids)]
+        OutboxEmail.objects.filter(id__in=ids).update(status='sending', claimed_at=now)
+
+    emails = OutboxEmail.objects.filter(id__in=ids).select_related('mailing__message').in_bulk()
+    return [emails[pk] for pk in ids]
+
+
+def load_recipient_contexts(batch):
+    """Загружает поля клиентов пачки одним запросом для подстановки в шаблон"""
+    client_ids = [email.client_id for email in batch if email.client_id]
+    recipients = Client.objects.filter(pk__in=client_ids).values('id', *TEMPLATE_FIELDS)
+    return {recipient['id']: recipient for recipient in recipients.iterator()}
+
+
+def build_message(email, smtp_connection, contexts, from_email=None):
+    """Собирает письмо для отправки из записи очереди"""
+    from_email = email.from_email or from_email or settings.DEFAULT_FROM_EMAIL
+    headers = {'Message-ID': email.message_id}
+
+    if not email.mailing_id:
+        return EmailMessage(
+            subject=email.subject,
+            body=email.body,
+            from_email=from_email,
+            to=[email.recipient],
+            connection=smtp_connection,
+            headers=headers,
+        )
+
+    compiled = compile_message(email.mailing.message)
+    context = contexts.get(email.client_id) or {'email': email.recipient, 'full_name': '', 'comment': ''}
+    message = AttachmentEmailMessage(
+        subject=compiled.subject.render(context),
+        body=compiled.body.render(context),
+        from_email=from_email,
+        to=[email.recipient],
+        connection=smtp_connection,
+        headers=headers,
+        attachments=list(compiled.attachments),
+    )
+    if compiled.html_body is not None:
+        message.attach_alternative(compiled.html_body.render(context), 'text/html')
+    if compiled.has_static_body:
+        message.dkim_body_key = (email.mailing.message_id, email.mailing.message.version)
+    return message
+
+
+def plan_delivery(batch, max_recipients=1):
+    """Раскладывает пачку на SMTP-транзакции, сгруппировав получателей по домену
+
+    Письма одной рассылки без персонализации на один домен объединяются
+    до max_recipients адресов RCPT TO в одной транзакции.
+    """
+    transactions = []
+    ordered = sorted(batch, key=lambda email: (email.recipient_domain, email.mailing_id or 0, email.id))
+    for (domain, mailing_id), emails in groupby(ordered, key=attrgetter('recipient_domain', 'mailing_id')):
+        emails = list(emails)
+        if max_recipients > 1 and mailing_id and compile_message(emails[0].mailing.message).is_static:
+            transactions.extend(
+                emails[start:start + max_recipients] for start in range(0, len(emails), max_recipients)
+            )
+        else:
+            transactions.extend([email] for email in emails)
+    return transactions
+
+
+def send_transaction(group, smtp_connection, contexts, from_email=None):
+    """Отправляет группу писем одной SMTP-транзакцией; возвращает отклоненные сервером адреса
+
+    Одиночное письмо уходит с адресом получателя в To. У письма на несколько адресов заголовок To
+    заменяется на "undisclosed-recipients:;", а адреса передаются только в RCPT TO, чтобы получатели
+    не видели друг друга.
+    """
+    message = build_message(group[0], smtp_connection, contexts, from_email)
+    if len(group) == 1:
+        message.send(fail_silently=False)
+        return set()
+
+    message.to = []
+    message.bcc = [email.recipient for email in group]
+    message.extra_headers['To'] = 'undisclosed-recipients:;'
+
+    raw_connection = getattr(smtp_connection, 'connection', None)
+    if raw_connection is None:
+        smtp_connection.send_messages([message])
+        return set()
+
+    encoding = message.encoding or settings.DEFAULT_CHARSET
+    message_bytes = getattr(smtp_connection, 'message_bytes', None)
+    refused = raw_connection.sendmail(
+        sanitize_address(message.from_email, encoding),
+        [sanitize_address(recipient, encoding) for recipient in message.recipients()],
+        message_bytes(message) if message_bytes else message.message().as_bytes(linesep='\r\n'),
+    )
+    return {recipient.lower() for recipient in refused}
+
+
+def send_via_pool(group, pool, contexts):
+    """Отправляет транзакцию через аккаунт пула, переключаясь на другой при ошибке аккаунта
+
+    Домен получателей — маршрут: письма домена идут через закрепленный за ним аккаунт пула.
+    Если сервер закрыл соединение, аккаунт получает новое соединение и еще одну попытку:
+    исключается он только при повторной ошибке.
+    """
+    tried = set()
+    reconnected = set()
+    account = None
+    while True:
+        if account is None:
+            account = pool.choose(len(group), exclude=tried, route=group[0].recipient_domain)
+        try:
+            return send_transaction(group, pool.connection(account), contexts, account.from_email)
+        except Exception as e:
+            if not is_account_error(e):
+                pool.release(account, len(group))
+                raise
+            pool.fail(account, e)
+            if isinstance(e, SMTPServerDisconnected) and account.name not in reconnected:
+                # Лимит аккаунта уже зарезервирован, повторяем тем же аккаунтом через новое соединение
+                reconnected.add(account.name)
+                continue
+            pool.release(account, len(group))
+            tried.add(account.name)
+            account = None
+
+
+def deliver_batch(batch, pool):
+    """Отправляет захваченные письма и возвращает попытки рассылок для записи
+
+    Каждые CANCEL_CHECK_EVERY писем проверяется флаг отмены: письма отмененных
+    рассылок помечаются отмененными и не отправляются.
+    """
+    now = timezone.now()
+    attempts = []
+    contexts = load_recipient_contexts(batch)
+    mailing_ids = {email.mailing_id for email in batch if email.mailing_id}
+    cancelled = set()
+    processed = 0
+    next_check = 0
+
+    transactions = plan_delivery(batch, settings.MAILING_MAX_RECIPIENTS_PER_MESSAGE)
+
+    for index, group in enumerate(transactions):
+        if mailing_ids and processed >= next_check:
+            cancelled = get_cancelled_mailings(mailing_ids)
+            next_check = processed + CANCEL_CHECK_EVERY
+        processed += len(group)
+        if group[0].mailing_id in cancelled:
+            for email in group:
+                email.status = 'cancelled'
+            continue
+
+        if len(group) > 1:
+            for email in group[1:]:
+                email.message_id = group[0].message_id
+
+        try:
+            refused = send_via_pool(group, pool, contexts)
+        except PoolExhausted:
+            for email in (email for group in transactions[index:] for email in group):
+                email.status = 'pending'
+                email.last_error = 'Нет доступных SMTP-аккаунтов'
+                email.next_attempt_at = now + RETRY_DELAY
+            break
+        except Exception as e:
+            for email in group:
+                email.attempts += 1
+                mark_failed(email, f'Ошибка: {str(e)}', now)
+        else:
+            for email in group:
+                email.attempts += 1
+                if email.recipient.lower() in refused:
+                    mark_failed(email, 'Ошибка: адрес отклонен почтовым сервером', now)
+                else:
+                    email.status = 'sent'
+                    email.sent_at = timezone.now()
+
+        attempts.extend(
+            MailingAttempt(
+                mailing_id=email.mailing_id,
+                client_id=email.client_id,
+                owner_id=email.mailing.owner_id,
+                status='success' if email.status == 'sent' else 'failure',
+                server_response='Письмо успешно отправлено' if email.status == 'sent' else email.last_error,
+                message_id=email.message_id,
+            )
+            for email in group
+            if email.mailing_id
+        )
+
+    return attempts
+
+
+def mark_failed(email, error, now):
+    """Помечает письмо неотправленным или откладывает повторную попытку"""
+    email.last_error = error
+    if email.mailing_id or email.attempts >= MAX_ATTEMPTS:
+        email.status = 'failed'
+    else:
+        email.status = 'pending'
+        email.next_attempt_at = now + RETRY_DELAY * email.attempts
+
+
+def finalize_batch(batch, attempts):
+    """Одной транзакцией фиксирует результаты отправки пачки"""
+    cancelled = {email.mailing_id for email in batch if email.status == 'cancelled'}
+    with transaction.atomic():
+        OutboxEmail.objects.bulk_update(
+            batch,
+            ['status', 'attempts', 'last_error', 'next_attempt_at', 'sent_at', 'message_id'],
+        )
+        MailingAttempt.objects.bulk_create(attempts)
+        invalidate_fragments({attempt.mailing_id for attempt in attempts}, 'attempts')
+        if cancelled:
+            interrupt_mailings(cancelled)
+        complete_finished_mailings({email.mailing_id for email in batch if email.mailing_id})
+
+
+def complete_finished_mailings(mailing_ids):
+    """Завершает рассылки, у которых не осталось писем в очереди"""
+    if not mailing_ids:
+        return 0
+    unfinished = OutboxEmail.objects.filter(
+        mailing=OuterRef('pk'),
+        status__in=['pending', 'sending'],
+    )
+    finished = list(
+        Mailing.objects.filter(pk__in=mailing_ids, status='started').exclude(
+            Exists(unfinished)
+        ).values_list('pk', flat=True)
+    )
+    if not finished:
+        return 0
+    transaction.on_commit(lambda: set_progress_status(finished, 'completed'))
+    return Mailing.objects.filter(pk__in=finished, status='started').update(
+        status='completed',
+        end_time=timezone.now(),
+    )
+
+
+def interrupt_mailings(mailing_ids):
+    """Отменяет оставшиеся письма и помечает запущенные рассылки как прерванные"""
+    OutboxEmail.objects.filter(mailing_id__in=mailing_ids, status='pending').update(status='cancelled')
+    transaction.on_commit(lambda: set_progress_status(mailing_ids, 'interrupted'))
+    return Mailing.objects.filter(pk__in=mailing_ids, status='started').update(
+        status='interrupted',
+        end_time=timezone.now(),
+    )
+
+
+def cancel_pending(mailing):
+    """Отменяет неотправленные письма рассылки"""
+    return OutboxEmail.objects.filter(mailing=mailing, status='pending').update(status='cancelled')
+
+
+def drain_outbox(pool, batch_size=100, mailing=None):
+    """Отправляет одну пачку писем из очереди; возвращает (отправлено, ошибок, захвачено)"""
+    batch = claim_batch(batch_size, mailing)
+    if not batch:
+        return 0, 0, 0
+
+    attempts = deliver_batch(batch, pool)
+    finalize_batch(batch, attempts)
+    record_progress(batch)
+
+    sent = sum(1 for email in batch if email.status == 'sent')
+    failed = sum(1 for email in batch if email.status == 'failed')
+    return sent, failed, len(batch)
+
+
+def deliver_mailing(mailing, batch_size=100, pool=None):
+    """Отправляет письма рассылки из очереди, пока они не закончатся или не истечет время"""
+    total_sent = total_failed = 0
+    pool = pool or SmtpPool()
+
+    try:
+        while True:
+            if mailing.end_time and timezone.now() >= mailing.end_time:
+                cancel_pending(mailing)
+                break
+
+            sent, failed, claimed = drain_outbox(pool, batch_size, mailing)
+            total_sent += sent
+            total_failed += failed
+            if not claimed:
+                break
+    finally:
+        pool.close()
+
+    complete_finished_mailings([mailing.pk])
+    return total_sent, total_failed
@@ -0,0 +1,113 @@
+import asyncio
+import json
+import time
+
+from django.core.cache import cache
+from django.db.models import Count, Q
+
+PROGRESS_TIMEOUT = 60 * 60 * 24 * 7
+PROGRESS_FIELDS = ('owner', 'status', 'total', 'sent', 'failed')
+STREAM_INTERVAL = 1
+STREAM_HEARTBEAT = 15
+
+
+def progress_key(mailing_id, field):
+    return f'mailing:progress:{mailing_id}:{field}'
+
+
+def start_progress(mailing, invalid=0):
+    """Записывает в кеш начальные счетчики рассылки одним агрегирующим запросом к очереди"""
+    counts = mailing.outbox_emails.aggregate(
+        total=Count('id'),
+        sent=Count('id', filter=Q(status='sent')),
+        failed=Count('id', filter=Q(status='failed')),
+    )
+    cache.set_many({
+        progress_key(mailing.pk, 'owner'): mailing.owner_id,
+        progress_key(mailing.pk, 'status'): mailing.status,
+        progress_key(mailing.pk, 'total'): counts['total'] + invalid,
+        progress_key(mailing.pk, 'sent'): counts['sent'],
+        progress_key(mailing.pk, 'failed'): counts['failed'] + invalid,
+    }, PROGRESS_TIMEOUT)
+
+
+def record_progress(batch):
+    """Увеличивает счетчики отправленных и неотправленных писем по итогам пачки"""
+    counters = {}
+    for email in batch:
+        if email.mailing_id and email.status in ('sent', 'failed'):
+            key = progress_key(email.mailing_id, email.status)
+            counters[key] = counters.get(key, 0) + 1
+    for key, delta in counters.items():
+        try:
+            cache.incr(key, delta)
+        except ValueError:
+            pass
+
+
+def set_progress_status(mailing_ids, status):
+    cache.set_many(
+        {progress_key(mailing_id, 'status'): status for mailing_id in mailing_ids},
+        PROGRESS_TIMEOUT,
+    )
+
+
+def _collect_progress(keys, cached):
+    values = {keys[key]: value for key, value in cached.items()}
+    if 'total' not in values:
+        return None
+    return values
+
+
+def get_progress(mailing_id):
+    """Возвращает счетчики рассылки из кеша или None, если рассылка не отправлялась"""
+    keys = {progress_key(mailing_id, field): field for field in PROGRESS_FIELDS}
+    return _collect_progress(keys, cache.get_many(keys))
+
+
+async def aget_progress(mailing_id):
+    keys = {progress_key(mailing_id, field): field for field in PROGRESS_FIELDS}
+    return _collect_progress(keys, await cache.aget_many(keys))
+
+
+def _progress_event(progress):
+    public = {field: value for field, value in (progress or {}).items() if field != 'owner'}
+    return f'data: {json.dumps(public)}\n\n'
+
+
+def stream_progress(mailing_id):
+    """Генерирует события Server-Sent Events при изменении счетчиков, пока рассылка идет"""
+    last = None
+    idle = 0
+    while True:
+        progress = get_progress(mailing_id)
+        if progress != last:
+            yield _progress_event(progress)
+            last = progress
+            idle = 0
+        elif idle >= STREAM_HEARTBEAT:
+            yield ': ping\n\n'
+            idle = 0
+        if progress is None or progress['status'] != 'started':
+            return
+        time.sleep(STREAM_INTERVAL)
+        idle += STREAM_INTERVAL
+
+
+async def astream_progress(mailing_id):
+    """Асинхронный вариант stream_progress: ожидание не занимает поток сервера"""
+    last = None
+    idle = 0
+    while True:
+        progress = await aget_progress(mailing_id)
+        if progress != last:
+            yield _progress_event(progress)
+            last = progress
+            idle = 0
+        elif idle >= STREAM_HEARTBEAT:
+            yield ': ping\n\n'
+            idle = 0
+        if progress is None or progress['status'] != 'started':
+            return
+        await asyncio.sleep(STREAM_INTERVAL)
+        idle += STREAM_INTERVAL
@@ -0,0 +1,69 @@
+import csv
+import json
+from itertools import islice
+
+from asgiref.sync import sync_to_async
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .models import MailingAttempt, OutboxEmail
+
+EXPORT_CHUNK_SIZE = 2000
+EXPORT_FORMATS = {
+    'csv': 'text/csv; charset=utf-8',
+    'jsonl': 'application/x-ndjson; charset=utf-8',
+}
+REPORTS = {
+    'attempts': (
+        MailingAttempt,
+        ('id', 'mailing_id', 'client_id', 'client__email', 'attempt_time', 'status', 'server_response'),
+    ),
+    'recipients': (
+        OutboxEmail,
+        ('id', 'mailing_id', 'client_id', 'recipient', 'status', 'attempts', 'last_error', 'created_at', 'sent_at',
+         'message_id'),
+    ),
+}
+
+
+class _Echo:
+    """Файлоподобный объект для csv.writer, который возвращает строку вместо записи"""
+
+    def write(self, value):
+        return value
+
+
+def get_report_rows(kind, mailing_ids=None):
+    """Возвращает заголовок и запрос строк отчета; строки читаются курсором на сервере БД"""
+    model, fields = REPORTS[kind]
+    queryset = model.objects.all()
+    if mailing_ids is not None:
+        queryset = queryset.filter(mailing_id__in=mailing_ids)
+    return fields, queryset.order_by('id').values_list(*fields)
+
+
+def format_row(fields, row, export_format, writer=None):
+    if export_format == 'csv':
+        return writer.writerow(row)
+    return json.dumps(dict(zip(fields, row)), cls=DjangoJSONEncoder, ensure_ascii=False) + '\n'
+
+
+def export_report(kind, export_format, mailing_ids=None):
+    """Генерирует отчет построчно, не загружая его в память целиком"""
+    fields, rows = get_report_rows(kind, mailing_ids)
+    writer = csv.writer(_Echo())
+    if export_format == 'csv':
+        yield writer.writerow(fields)
+    for row in rows.iterator(chunk_size=EXPORT_CHUNK_SIZE):
+        yield format_row(fields, row, export_format, writer)
+
+
+async def aexport_report(kind, export_format, mailing_ids=None):
+    """Асинхронный вариант export_report для ASGI
+
+    Синхронный генератор продвигается в потоке порциями по EXPORT_CHUNK_SIZE строк:
+    курсор на сервере БД остается в одном потоке, а цикл событий не блокируется.
+    """
+    rows = export_report(kind, export_format, mailing_ids)
+    next_chunk = sync_to_async(lambda: ''.join(islice(rows, EXPORT_CHUNK_SIZE)))
+    while chunk := await next_chunk():
+        yield chunk
@@ -0,0 +1,70 @@
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector, TrigramWordSimilarity
+from django.db import connection
+from django.db.models import Case, FloatField, IntegerField, Q, Value, When
+from django.db.models.functions import Greatest
+
+SEARCH_CONFIG = 'russian'
+
+
+def client_comment_vector():
+    """Выражение совпадает с индексом client_comment_search_idx, иначе PostgreSQL его не использует"""
+    return SearchVector('comment', config=SEARCH_CONFIG)
+
+
+def message_vector():
+    """Выражение совпадает с индексом message_search_idx"""
+    return SearchVector('subject', weight='A', config=SEARCH_CONFIG) + SearchVector(
+        'body', weight='B', config=SEARCH_CONFIG
+    )
+
+
+def search_clients(queryset, query):
+    """Ищет клиентов по email, Ф. И. О. и комментарию, самые похожие — первыми
+
+    В PostgreSQL email и Ф. И. О. сравниваются по триграммам (опечатки, части слов),
+    комментарий — полнотекстовым поиском; оба пути используют GIN-индексы.
+    """
+    if connection.vendor != 'postgresql':
+        return _simple_search(queryset, query, ('email', 'full_name', 'comment'))
+
+    search_query = SearchQuery(query, config=SEARCH_CONFIG, search_type='websearch')
+    return queryset.annotate(
+        search=client_comment_vector(),
+        rank=Greatest(
+            TrigramWordSimilarity(query, 'email'),
+            TrigramWordSimilarity(query, 'full_name'),
+            SearchRank(client_comment_vector(), search_query),
+            output_field=FloatField(),
+        ),
+    ).filter(
+        Q(email__trigram_word_similar=query)
+        | Q(full_name__trigram_word_similar=query)
+        | Q(search=search_query)
+    ).order_by('-rank', 'id')
+
+
+def search_messages(queryset, query):
+    """Ищет сообщения полнотекстовым поиском по теме и телу; совпадение в теме весит больше"""
+    if connection.vendor != 'postgresql':
+        return _simple_search(queryset, query, ('subject', 'body'))
+
+    search_query = SearchQuery(query, config=SEARCH_CONFIG, search_type='websearch')
+    return queryset.annotate(
+        search=message_vector(),
+        rank=SearchRank(message_vector(), search_query),
+    ).filter(search=search_query).order_by('-rank', 'id')
+
+
+def _simple_search(queryset, query, fields):
+    """Поиск без индексов для SQLite: подстрока в любом поле, точные совпадения и совпадения в первом поле выше"""
+    matches = Q()
+    for field in fields:
+        matches |= Q(**{f'{field}__icontains': query})
+    return queryset.filter(matches).annotate(
+        rank=Case(
+            When(**{f'{fields[0]}__iexact': query}, then=Value(3)),
+            When(**{f'{fields[0]}__istartswith': query}, then=Value(2)),
+            default=Value(1),
+            output_field=IntegerField(),
+        ),
+    ).order_by('-rank', 'id')
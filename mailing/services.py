@@ -1,57 +1,108 @@
-from django.core.mail import send_mail
-from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
 from django.utils import timezone
-from .models import MailingAttempt
+from users.models import CustomUser
+from .models import Mailing
+from .outbox import deliver_mailing, enqueue_mailing, interrupt_mailings, request_cancellation
+from .progress import start_progress
+from .validation import validate_mailing_recipients
 
 
-def send_mailing(mailing):
-    """Отправляет рассылку всем клиентам и создает записи о попытках"""
-    if not mailing.start_time:
-        mailing.start_time = timezone.now()
+def send_mailing(mailing, batch_size=100, pool=None, resolver=None):
+    """Ставит письма рассылки в очередь и отправляет их, создавая записи о попытках
+
+    resolver — резолвер для проверки доменов получателей; по умолчанию EMAIL_MX_RESOLVER.
+    """
+    now = timezone.now()
+    if mailing.end_time and mailing.end_time <= now:
+        mailing.status = 'completed'
+        mailing.save(update_fields=['status'])
+        return 0, 0
+
+    if not mailing.start_time or mailing.start_time > now:
+        mailing.start_time = now
+    mailing.status = 'started'
+
+    invalid_clients = validate_mailing_recipients(mailing, resolver)
+
+    with transaction.atomic():
+        mailing.save(update_fields=['start_time', 'status'])
+        enqueue_mailing(mailing, exclude_clients=invalid_clients)
+    start_progress(mailing, len(invalid_clients))
+
+    sent, failed = deliver_mailing(mailing, batch_size, pool)
+    return sent, failed + len(invalid_clients)
+
+
+def get_due_mailings(now=None):
+    """Возвращает рассылки, время начала которых уже наступило"""
+    now = now or timezone.now()
+    return Mailing.objects.filter(
+        Q(start_time__isnull=True) | Q(start_time__lte=now),
+        status='created',
+    ).exclude(
+        end_time__lte=now
+    ).select_related('message').order_by('start_time', 'id')
+
+
+def claim_mailing(mailing):
+    """Атомарно переводит рассылку в статус "Запущена", чтобы ее не взял другой процесс"""
+    claimed = Mailing.objects.filter(pk=mailing.pk, status='created').update(status='started')
+    if claimed:
         mailing.status = 'started'
-        mailing.save()
-
-    clients = mailing.clients.all()
-    total_sent = 0
-    total_failed = 0
-
-    for client in clients:
-        try:
-            result = send_mail(
-                subject=mailing.message.subject,
-                message=mailing.message.body,
-                from_email=settings.DEFAULT_FROM_EMAIL,
-                recipient_list=[client.email],
-                fail_silently=False,
-            )
-
-            if result == 1:
-                MailingAttempt.objects.create(
-                    mailing=mailing,
-                    status='success',
-                    server_response='Письмо успешно отправлено',
-                    owner=mailing.owner
-                )
-                total_sent += 1
-            else:
-                MailingAttempt.objects.create(
-                    mailing=mailing,
-                    status='failure',
-                    server_response='Ошибка отправки'
-                )
-                total_failed += 1
-
-        except Exception as e:
-            MailingAttempt.objects.create(
-                mailing=mailing,
-                status='failure',
-                server_response=f'Ошибка: {str(e)}',
-                owner=mailing.owner
-            )
-            total_failed += 1
-
-    mailing.end_time = timezone.now()
-    mailing.status = 'completed'
-    mailing.save()
-
-    return total_sent, total_failed
+    return bool(claimed)
+
+
+def close_expired_mailings(now=None):
+    """Завершает рассылки, у которых истекло время окончания отправки"""
+    now = now or timezone.now()
+    return Mailing.objects.filter(
+        status__in=['created', 'started'],
+        end_time__lte=now,
+    ).update(status='completed')
+
+
+def get_next_schedule_event(now=None):
+    """Возвращает ближайший момент, когда планировщику нужно проснуться"""
+    now = now or timezone.now()
+    next_start = Mailing.objects.filter(
+        status='created',
+        start_time__gt=now,
+    ).order_by('start_time').values_list('start_time', flat=True).first()
+    next_end = Mailing.objects.filter(
+        status__in=['created', 'started'],
+        end_time__gt=now,
+    ).order_by('end_time').values_list('end_time', flat=True).first()
+    events = [event for event in (next_start, next_end) if event]
+    return min(events) if events else None
+
+
+def disable_mailings(mailings):
+    """Отключает рассылки и выставляет флаг отмены для работающих отправителей
+
+    Еще не начатые рассылки завершаются, а запущенные помечаются как прерванные.
+    Работающий send_mailing замечает флаг в течение CANCEL_CHECK_EVERY писем.
+    """
+    mailing_ids = list(
+        mailings.filter(status__in=['created', 'started']).values_list('pk', flat=True)
+    )
+    if not mailing_ids:
+        return 0
+    request_cancellation(mailing_ids)
+    with transaction.atomic():
+        disabled = interrupt_mailings(mailing_ids)
+        disabled += Mailing.objects.filter(pk__in=mailing_ids, status='created').update(
+            status='completed',
+            end_time=timezone.now(),
+        )
+    return disabled
+
+
+def set_users_active(users, is_active):
+    """Блокирует или разблокирует пользователей одним UPDATE; рассылки заблокированных отключаются"""
+    with transaction.atomic():
+        user_ids = list(users.exclude(is_active=is_active).values_list('pk', flat=True))
+        changed = CustomUser.objects.filter(pk__in=user_ids).update(is_active=is_active)
+        if not is_active and user_ids:
+            disable_mailings(Mailing.objects.filter(owner_id__in=user_ids))
+    return changed
@@ -0,0 +1,66 @@
+from pathlib import Path
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from .fragments import invalidate_fragments
+from .mime import encoded_path
+from .models import Client, Mailing, Message, MessageAttachment, user_number_key
+from .notifications import SCHEDULE_CHANNEL, notify
+
+
+@receiver(post_save, sender=Mailing)
+def mailing_schedule_changed(sender, instance, **kwargs):
+    """Сообщает планировщику об изменении расписания рассылки"""
+    if instance.status == 'created':
+        transaction.on_commit(lambda: notify(SCHEDULE_CHANNEL))
+
+
+@receiver(post_delete, sender=Mailing)
+def mailing_deleted(sender, instance, **kwargs):
+    """Сбрасывает номера более поздних рассылок владельца: после удаления они сдвигаются"""
+    later = Mailing.objects.filter(owner_id=instance.owner_id, id__gt=instance.pk).values_list('pk', flat=True)
+    keys = [user_number_key(mailing_id) for mailing_id in [instance.pk, *later]]
+    transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+@receiver(post_save, sender=MessageAttachment)
+@receiver(post_delete, sender=MessageAttachment)
+def message_attachments_changed(sender, instance, **kwargs):
+    """Увеличивает версию сообщения, чтобы вложения были закодированы заново"""
+    Message.objects.filter(pk=instance.message_id).update(version=F('version') + 1)
+
+
+@receiver(post_delete, sender=MessageAttachment)
+def delete_attachment_file(sender, instance, **kwargs):
+    """Удаляет файл вложения и его закодированную копию с диска после удаления записи"""
+    def delete_files():
+        if instance.file:
+            Path(encoded_path(instance.file.path)).unlink(missing_ok=True)
+        instance.file.delete(save=False)
+
+    transaction.on_commit(delete_files)
+
+
+@receiver(m2m_changed, sender=Mailing.clients.through)
+def mailing_recipients_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    """Сбрасывает кешированный список получателей рассылки"""
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            invalidate_fragments([instance.pk], 'recipients')
+    elif action in ('post_add', 'post_remove'):
+        invalidate_fragments(pk_set, 'recipients')
+    elif action == 'pre_clear':
+        invalidate_fragments(instance.mailing_set.values_list('pk', flat=True), 'recipients')
+
+
+@receiver(pre_delete, sender=Client)
+@receiver(post_save, sender=Client)
+def client_changed(sender, instance, created=False, **kwargs):
+    """Сбрасывает списки получателей рассылок, в которые входит клиент"""
+    if created:
+        return
+    invalidate_fragments(instance.mailing_set.values_list('pk', flat=True), 'recipients')
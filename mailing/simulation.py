@@ -0,0 +1,241 @@
+import random
+import sys
+import time
+import tracemalloc
+from smtplib import SMTPRecipientsRefused
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.utils.module_loading import import_string
+
+from .dkim import DkimEmailBackend
+from .fragments import invalidate_fragments
+from .models import MailingAttempt
+from .progress import PROGRESS_FIELDS, PROGRESS_TIMEOUT, progress_key
+from .services import send_mailing
+from .smtp_pool import SmtpAccount, SmtpPool, get_accounts
+from .validation import mx_cache_key
+
+WRITE_STATEMENTS = ('INSERT', 'UPDATE', 'DELETE')
+SIMULATED_REFUSAL = (550, b'5.1.1 Simulated recipient rejection')
+DKIM_OPTIONS = ('dkim_domain', 'dkim_selector', 'dkim_private_key_path')
+
+
+class SimulationRollback(Exception):
+    pass
+
+
+class SimulatedClock:
+    """Виртуальные часы: реальное время работы плюс смоделированные ожидания SMTP"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.waited = 0.0
+
+    def now(self):
+        return time.perf_counter() - self.started + self.waited
+
+    def sleep(self, seconds):
+        self.waited += seconds
+
+
+class SmtpSimulator:
+    """Модель SMTP-сервера: задержка транзакции, доля отклоненных адресов и ограничение скорости"""
+
+    def __init__(self, latency=0.2, error_rate=0.0, throttle=0, seed=None):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.throttle = throttle
+        self.random = random.Random(seed)
+        self.clock = SimulatedClock()
+        self.next_slot = 0.0
+        self.transactions = 0
+        self.recipients = 0
+        self.refused = 0
+        self.bytes = 0
+
+    def sendmail(self, from_addr, to_addrs, msg, *args, **kwargs):
+        if self.throttle:
+            # Сервер принимает не больше throttle писем в секунду: ждем свободного окна
+            self.clock.sleep(max(0.0, self.next_slot - self.clock.now()))
+            self.next_slot = self.clock.now() + len(to_addrs) / self.throttle
+        self.clock.sleep(self.latency * self.random.uniform(0.5, 1.5))
+        self.transactions += 1
+        self.recipients += len(to_addrs)
+        self.bytes += len(msg)
+
+        refused = {
+            address: SIMULATED_REFUSAL
+            for address in to_addrs
+            if self.random.random() < self.error_rate
+        }
+        self.refused += len(refused)
+        if refused and len(refused) == len(to_addrs):
+            raise SMTPRecipientsRefused(refused)
+        return refused
+
+
+class SimulatedEmailBackend(DkimEmailBackend):
+    """Бэкенд, который собирает и подписывает письма как при отправке, но передает их в SmtpSimulator
+
+    Соединение — сам симулятор: open и close к сети не обращаются. С signed=False письма
+    не подписываются, как при бэкенде отправки без DKIM.
+    """
+
+    def __init__(self, simulator=None, signed=True, **kwargs):
+        super().__init__(**kwargs)
+        self.connection = simulator
+        if not signed:
+            self.dkim_selector = None
+
+    def open(self):
+        return False
+
+    def close(self):
+        pass
+
+
+class SimulatedResolver:
+    """Резолвер прогона: не обращается к DNS и считает рабочими домены, которых еще нет в кеше MX
+
+    Резолвер спрашивают только о доменах без ответа в кеше, поэтому записанные
+    для них ответы после прогона удаляются.
+    """
+
+    def __init__(self):
+        self.queried = set()
+
+    def has_mail_exchanger(self, domain):
+        self.queried.add(domain)
+        return True
+
+
+def signing_options():
+    """Параметры подписи DKIM основного аккаунта, чтобы прогон подписывал письма так же, как отправка"""
+    options = get_accounts()[0].connection_options
+    if not issubclass(import_string(options.get('backend') or settings.EMAIL_BACKEND), DkimEmailBackend):
+        return {'signed': False}
+    return {name: options[name] for name in DKIM_OPTIONS if name in options}
+
+
+class WriteCounter:
+    """Обертка выполнения запросов: считает изменяющие запросы и затронутые строки"""
+
+    def __init__(self):
+        self.statements = {statement: 0 for statement in WRITE_STATEMENTS}
+        self.rows = {statement: 0 for statement in WRITE_STATEMENTS}
+        self.reads = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        result = execute(sql, params, many, context)
+        statement = sql.lstrip().split(None, 1)[0].upper()
+        if statement in self.statements:
+            self.statements[statement] += 1
+            self.rows[statement] += self.affected_rows(sql, params, many, context['cursor'])
+        else:
+            self.reads += 1
+        return result
+
+    @staticmethod
+    def affected_rows(sql, params, many, cursor):
+        if cursor.rowcount > 0 or not params:
+            return max(cursor.rowcount, 0)
+        if many:
+            return len(params)
+        # SQLite сообщает число строк INSERT ... RETURNING только после чтения результата:
+        # считаем строки по параметрам и числу столбцов в списке полей
+        columns = sql.partition('(')[2].partition(')')[0].count(',') + 1
+        return len(params) // columns
+
+
+def peak_rss():
+    """Пиковый размер резидентной памяти процесса в байтах"""
+    if resource is None:
+        return 0
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # В macOS ru_maxrss в байтах, в Linux — в килобайтах
+    return rss if sys.platform == 'darwin' else rss * 1024
+
+
+def simulate_mailings(mailings, simulator, batch_size=100, keep_attempts=False, trace_memory=False):
+    """Прогоняет рассылки через весь конвейер отправки с имитацией SMTP
+
+    Все изменения в базе выполняются в одной транзакции и откатываются; с keep_attempts
+    после отката сохраняются только попытки рассылок. Счетчики хода отправки в кеше
+    восстанавливаются. Письма подписываются DKIM, как при отправке; к DNS прогон не обращается:
+    адреса проверяются по кешу MX, а домены без ответа в кеше считаются рабочими. Пик памяти — прирост
+    пикового RSS процесса, с trace_memory — пик выделений Python по tracemalloc (точнее, но замедляет
+    прогон и завышает прогноз длительности).
+    Возвращает результаты по рассылкам и общую статистику прогона.
+    """
+    pool = SmtpPool([SmtpAccount(
+        'simulated',
+        from_email='simulation@localhost',
+        backend='mailing.simulation.SimulatedEmailBackend',
+        simulator=simulator,
+        **signing_options(),
+    )])
+    resolver = SimulatedResolver()
+    counter = WriteCounter()
+    progress_keys = [progress_key(mailing.pk, field) for mailing in mailings for field in PROGRESS_FIELDS]
+    saved_progress = cache.get_many(progress_keys)
+    results = []
+    attempts = []
+
+    rss_before = peak_rss()
+    if trace_memory:
+        tracemalloc.start()
+    simulator.clock = SimulatedClock()
+    try:
+        with connection.execute_wrapper(counter):
+            try:
+                with transaction.atomic():
+                    last_attempt_id = MailingAttempt.objects.order_by('-id').values_list('id', flat=True).first() or 0
+                    for mailing in mailings:
+                        sent, failed = send_mailing(mailing, batch_size, pool, resolver)
+                        results.append((mailing, sent, failed))
+                    if keep_attempts:
+                        attempts = list(MailingAttempt.objects.filter(
+                            id__gt=last_attempt_id, mailing__in=mailings,
+                        ))
+                    raise SimulationRollback
+            except SimulationRollback:
+                pass
+        duration = simulator.clock.now()
+        if trace_memory:
+            peak_memory = tracemalloc.get_traced_memory()[1]
+        else:
+            peak_memory = peak_rss() - rss_before
+    finally:
+        if trace_memory:
+            tracemalloc.stop()
+        cache.delete_many(progress_keys + [mx_cache_key(domain) for domain in resolver.queried])
+        if saved_progress:
+            cache.set_many(saved_progress, PROGRESS_TIMEOUT)
+
+    for attempt in attempts:
+        attempt.pk = None
+        attempt.server_response = f'Симуляция: {attempt.server_response}'
+    MailingAttempt.objects.bulk_create(attempts)
+    invalidate_fragments({attempt.mailing_id for attempt in attempts}, 'attempts')
+
+    return results, {
+        'duration': duration,
+        'smtp_wait': simulator.clock.waited,
+        'transactions': simulator.transactions,
+        'recipients': simulator.recipients,
+        'refused': simulator.refused,
+        'bytes': simulator.bytes,
+        'reads': counter.reads,
+        'statements': counter.statements,
+        'rows': counter.rows,
+        'peak_memory': peak_memory,
+        'kept_attempts': len(attempts),
+        'unchecked_domains': len(resolver.queried),
+    }
@@ -0,0 +1,186 @@
+import random
+import re
+import time
+from smtplib import (
+    SMTPAuthenticationError,
+    SMTPException,
+    SMTPResponseException,
+    SMTPSenderRefused,
+    SMTPServerDisconnected,
+)
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.mail import get_connection
+from django.utils import timezone
+
+AUTH_COOLDOWN = 60 * 60
+QUOTA_COOLDOWN = 15 * 60
+CONNECTION_COOLDOWN = 60
+STATE_REFRESH_INTERVAL = 5
+# Постоянные (5xx) ответы о превышении квоты отправителя: расширенный код 5.4.5 или известные формулировки.
+# Границы слов не дают сработать на "moderated" или "generate", "size limit" относится к письму, а не к аккаунту
+QUOTA_ERROR_RE = re.compile(
+    r'\b(?:5\.4\.5|quota|throttl\w*|rate[ -]?limit\w*|(?:message|sending) rate|(?:daily|hourly|sending) limit'
+    r'|too many (?:messages|mails|emails|recipients|connections))\b',
+    re.IGNORECASE,
+)
+
+
+class PoolExhausted(Exception):
+    """Нет ни одного SMTP-аккаунта, через который сейчас можно отправить письмо"""
+
+
+class SmtpAccount:
+    """SMTP-аккаунт пула со своими лимитами и весом"""
+
+    def __init__(self, name, from_email=None, weight=1, daily_limit=0, hourly_limit=0, **connection_options):
+        self.name = name
+        self.from_email = from_email or connection_options.get('username') or settings.DEFAULT_FROM_EMAIL
+        self.weight = weight
+        self.daily_limit = daily_limit
+        self.hourly_limit = hourly_limit
+        self.connection_options = connection_options
+
+    def __repr__(self):
+        return f'<SmtpAccount {self.name}>'
+
+    def cooldown_key(self):
+        return f'mailing:smtp:{self.name}:cooldown'
+
+    def usage_keys(self, now=None):
+        """Ключи счетчиков отправленных писем за текущие сутки и час"""
+        now = now or timezone.now()
+        keys = {}
+        if self.daily_limit:
+            keys[f'mailing:smtp:{self.name}:day:{now:%Y%m%d}'] = (self.daily_limit, 60 * 60 * 24)
+        if self.hourly_limit:
+            keys[f'mailing:smtp:{self.name}:hour:{now:%Y%m%d%H}'] = (self.hourly_limit, 60 * 60)
+        return keys
+
+    def open_connection(self):
+        connection = get_connection(fail_silently=False, **self.connection_options)
+        connection.open()
+        return connection
+
+
+def get_accounts():
+    """Аккаунты из EMAIL_ACCOUNTS; без них пул состоит из аккаунта по настройкам EMAIL_*"""
+    if settings.EMAIL_ACCOUNTS:
+        return [SmtpAccount(**options) for options in settings.EMAIL_ACCOUNTS]
+    return [SmtpAccount('default', from_email=settings.DEFAULT_FROM_EMAIL)]
+
+
+def is_account_error(error):
+    """Ошибка относится к аккаунту (авторизация, лимиты, соединение), а не к конкретному письму"""
+    if isinstance(error, (SMTPAuthenticationError, SMTPSenderRefused, SMTPServerDisconnected)):
+        return True
+    if isinstance(error, SMTPResponseException):
+        message = error.smtp_error.decode(errors='replace') if isinstance(error.smtp_error, bytes) else ''
+        return 400 <= error.smtp_code < 500 or bool(QUOTA_ERROR_RE.search(message))
+    return isinstance(error, OSError) and not isinstance(error, SMTPException)
+
+
+class SmtpPool:
+    """Пул SMTP-аккаунтов с выбором по весу, учетом лимитов и переключением при сбоях
+
+    Лимиты и паузы аккаунтов хранятся в общем кеше, поэтому учитываются всеми
+    процессами-отправителями; соединения открываются лениво и переиспользуются.
+    """
+
+    def __init__(self, accounts=None):
+        self.accounts = accounts or get_accounts()
+        self.connections = {}
+        self.routes = {}
+        self.unavailable = set()
+        self.refreshed_at = None
+
+    def refresh(self):
+        """Перечитывает из кеша паузы и израсходованные лимиты аккаунтов"""
+        now = timezone.now()
+        keys = {}
+        for account in self.accounts:
+            keys[account.cooldown_key()] = (account, None)
+            for key, (limit, _) in account.usage_keys(now).items():
+                keys[key] = (account, limit)
+
+        self.unavailable = set()
+        for key, value in cache.get_many(keys).items():
+            account, limit = keys[key]
+            if limit is None or value >= limit:
+                self.unavailable.add(account.name)
+        self.refreshed_at = time.monotonic()
+
+    def choose(self, count=1, exclude=(), route=None):
+        """Выбирает аккаунт и резервирует в его лимитах count писем
+
+        Аккаунт маршрута route (домена получателей) закрепляется за ним на все время работы пула,
+        чтобы письма маршрута шли через одно открытое соединение; новый аккаунт выбирается по весу,
+        только если закрепленный недоступен.
+        """
+        if self.refreshed_at is None or time.monotonic() - self.refreshed_at > STATE_REFRESH_INTERVAL:
+            self.refresh()
+
+        candidates = [
+            account for account in self.accounts
+            if account.name not in self.unavailable and account.name not in exclude
+        ]
+        pinned = next((account for account in candidates if account.name == self.routes.get(route)), None)
+        while candidates:
+            if pinned is not None:
+                account, pinned = pinned, None
+            else:
+                account = random.choices(candidates, weights=[account.weight for account in candidates])[0]
+            if self.reserve(account, count):
+                if route is not None:
+                    self.routes[route] = account.name
+                return account
+            self.unavailable.add(account.name)
+            candidates.remove(account)
+        raise PoolExhausted('Нет доступных SMTP-аккаунтов')
+
+    def reserve(self, account, count):
+        reserved = []
+        for key, (limit, timeout) in account.usage_keys().items():
+            cache.add(key, 0, timeout)
+            reserved.append(key)
+            if cache.incr(key, count) > limit:
+                for reserved_key in reserved:
+                    cache.decr(reserved_key, count)
+                return False
+        return True
+
+    def release(self, account, count):
+        """Возвращает в лимит аккаунта письма, которые не удалось отправить"""
+        for key in account.usage_keys():
+            try:
+                cache.decr(key, count)
+            except ValueError:
+                pass
+
+    def connection(self, account):
+        connection = self.connections.get(account.name)
+        if connection is None:
+            connection = self.connections[account.name] = account.open_connection()
+        return connection
+
+    def fail(self, account, error):
+        """Закрывает соединение аккаунта и ставит его на паузу в зависимости от ошибки"""
+        connection = self.connections.pop(account.name, None)
+        if connection is not None:
+            connection.close()
+        if isinstance(error, SMTPServerDisconnected):
+            return
+        if isinstance(error, (SMTPAuthenticationError, SMTPSenderRefused)):
+            cooldown = AUTH_COOLDOWN
+        elif isinstance(error, SMTPResponseException):
+            cooldown = QUOTA_COOLDOWN
+        else:
+            cooldown = CONNECTION_COOLDOWN
+        cache.set(account.cooldown_key(), str(error)[:255], cooldown)
+        self.unavailable.add(account.name)
+
+    def close(self):
+        for connection in self.connections.values():
+            connection.close()
+        self.connections = {}
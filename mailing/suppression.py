@@ -0,0 +1,27 @@
+from django.db.models import Exists, OuterRef
+from django.db.models.functions import Lower
+
+from .models import OutboxEmail, Suppression, normalize_email
+
+
+def suppressed(email_field='email'):
+    """Условие для anti-join: адрес из поля email_field есть в списке подавления"""
+    return Exists(Suppression.objects.filter(email=Lower(OuterRef(email_field))))
+
+
+def suppress_emails(emails, reason):
+    """Добавляет адреса в список подавления и отменяет неотправленные письма рассылок на них"""
+    normalized = {normalize_email(email) for email in emails}
+    if not normalized:
+        return 0
+    Suppression.objects.bulk_create(
+        [Suppression(email=email, reason=reason) for email in normalized],
+        ignore_conflicts=True,
+    )
+    return OutboxEmail.objects.annotate(
+        normalized_recipient=Lower('recipient')
+    ).filter(
+        normalized_recipient__in=normalized,
+        mailing__isnull=False,
+        status='pending',
+    ).update(status='cancelled')
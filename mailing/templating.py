@@ -0,0 +1,77 @@
+import re
+from html import escape
+
+from .mime import encode_message_attachments
+
+PLACEHOLDER_RE = re.compile(r'{{\s*(\w+)\s*}}')
+TEMPLATE_FIELDS = ('email', 'full_name', 'comment')
+MAX_CACHED_MESSAGES = 256
+
+_compiled_messages = {}
+
+
+class CompiledTemplate:
+    """Шаблон, один раз разобранный в строку формата для str.format_map"""
+
+    __slots__ = ('format_string', 'fields', 'static_text', 'autoescape')
+
+    def __init__(self, text, autoescape=False):
+        parts = PLACEHOLDER_RE.split(text)
+        chunks = []
+        fields = []
+        for index, part in enumerate(parts):
+            if index % 2 == 0:
+                chunks.append(part.replace('{', '{{').replace('}', '}}'))
+            elif part in TEMPLATE_FIELDS:
+                chunks.append(f'{{{part}}}')
+                fields.append(part)
+            else:
+                chunks.append(f'{{{{{{{{ {part} }}}}}}}}')
+        self.format_string = ''.join(chunks)
+        self.fields = tuple(fields)
+        self.static_text = None if fields else self.format_string.format_map({})
+        self.autoescape = autoescape
+
+    @property
+    def is_static(self):
+        return self.static_text is not None
+
+    def render(self, context):
+        if self.static_text is not None:
+            return self.static_text
+        if self.autoescape:
+            context = {field: escape(str(context[field])) for field in self.fields}
+        return self.format_string.format_map(context)
+
+
+class CompiledMessage:
+    """Тема, тело и вложения сообщения, подготовленные к персонализации"""
+
+    __slots__ = ('subject', 'body', 'html_body', 'attachments')
+
+    def __init__(self, message):
+        self.subject = CompiledTemplate(message.subject)
+        self.body = CompiledTemplate(message.body)
+        self.html_body = CompiledTemplate(message.html_body, autoescape=True) if message.html_body else None
+        self.attachments = encode_message_attachments(message)
+
+    @property
+    def is_static(self):
+        templates = (self.subject, self.body, self.html_body)
+        return all(template.is_static for template in templates if template is not None)
+
+    @property
+    def has_static_body(self):
+        """Тело и HTML-версия без подстановок: тело письма одинаково у всех получателей"""
+        return self.body.is_static and (self.html_body is None or self.html_body.is_static)
+
+
+def compile_message(message):
+    """Возвращает скомпилированное сообщение из кеша процесса по id и версии"""
+    key = (message.pk, message.version)
+    compiled = _compiled_messages.get(key)
+    if compiled is None:
+        if len(_compiled_messages) >= MAX_CACHED_MESSAGES:
+            _compiled_messages.clear()
+        compiled = _compiled_messages[key] = CompiledMessage(message)
+    return compiled
@@ -0,0 +1,1080 @@
+import base64
+import csv
+import json
+import mailbox
+import os
+import socket
+import tempfile
+from io import StringIO
+from types import SimpleNamespace
+from datetime import timedelta
+from email import message_from_bytes
+from smtplib import SMTPResponseException, SMTPServerDisconnected
+from unittest import mock, skipIf, skipUnless
+
+from asgiref.sync import async_to_sync, sync_to_async
+from django.contrib.auth.models import Permission
+from django.core import mail
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.mail.backends.locmem import EmailBackend
+from django.db import connection
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from mailing import dkim as dkim_signing, simulation, templating, validation
+from mailing.bounces import MailboxSource, ingest_bounces
+from mailing.forms import ClientForm
+from mailing.fragments import get_fragment_versions, invalidate_fragments
+from mailing.mime import AttachmentEmailMessage, EncodedAttachment, encoded_path
+from mailing.models import Client, Mailing, MailingAttempt, Message, OutboxEmail, Suppression
+from mailing.outbox import (
+    CANCEL_CHECK_EVERY, LEASE_TIMEOUT, cancellation_key, claim_batch, deliver_mailing, drain_outbox, enqueue_email,
+    enqueue_mailing, request_cancellation,
+)
+from mailing.progress import get_progress
+from mailing.search import search_clients, search_messages
+from mailing.services import (
+    claim_mailing, close_expired_mailings, get_due_mailings, get_next_schedule_event, send_mailing,
+)
+from mailing.simulation import SmtpSimulator, simulate_mailings
+from mailing.smtp_pool import SmtpAccount, SmtpPool, is_account_error
+from mailing.suppression import suppress_emails
+from mailing.templating import CompiledTemplate, compile_message
+from mailing.validation import (
+    DnsResolver, find_invalid_emails, mail_domain, mx_cache_key, validate_mailing_recipients,
+)
+from mailing.views import ReportExportView
+from users.models import CustomUser
+
+try:
+    from cryptography.hazmat.primitives import serialization
+    from cryptography.hazmat.primitives.asymmetric import rsa
+except ImportError:
+    rsa = None
+
+try:
+    import dkim
+except ImportError:
+    dkim = None
+
+
+class DisconnectingEmailBackend(EmailBackend):
+    """Бэкенд, у которого первые disconnects отправок обрываются, как у закрытого сервером соединения"""
+    disconnects = 0
+    calls = 0
+
+    def send_messages(self, messages):
+        type(self).calls += 1
+        if type(self).disconnects:
+            type(self).disconnects -= 1
+            raise SMTPServerDisconnected('Connection unexpectedly closed')
+        return super().send_messages(messages)
+
+
+class SendViaPoolTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        DisconnectingEmailBackend.calls = 0
+        self.pool = SmtpPool([SmtpAccount('flaky', backend='mailing.tests.DisconnectingEmailBackend')])
+        for index in range(3):
+            enqueue_email('Тема', 'Текст', f'client{index}@example.com')
+
+    def test_reconnects_after_dropped_connection(self):
+        DisconnectingEmailBackend.disconnects = 1
+
+        self.assertEqual(drain_outbox(self.pool), (3, 0, 3))
+        self.assertEqual(DisconnectingEmailBackend.calls, 4)
+        self.assertFalse(OutboxEmail.objects.exclude(status='sent').exists())
+
+    def test_excludes_account_after_second_disconnect(self):
+        DisconnectingEmailBackend.disconnects = 2
+
+        self.assertEqual(drain_outbox(self.pool), (0, 0, 3))
+        self.assertEqual(DisconnectingEmailBackend.calls, 2)
+        self.assertEqual(OutboxEmail.objects.filter(status='pending').count(), 3)
+
+
+class AccountErrorTests(TestCase):
+    def test_temporary_errors_belong_to_account(self):
+        self.assertTrue(is_account_error(SMTPResponseException(421, b'4.7.0 Try again later')))
+        self.assertTrue(is_account_error(SMTPServerDisconnected('Connection unexpectedly closed')))
+
+    def test_permanent_quota_errors_belong_to_account(self):
+        for response in (
+            b'5.4.5 Daily user sending quota exceeded',
+            b'5.7.1 Rate limit exceeded, try again later',
+            b'Message rate exceeded for this account',
+            b'Too many messages from this sender',
+            b'5.7.1 Sending throttled',
+        ):
+            self.assertTrue(is_account_error(SMTPResponseException(550, response)), response)
+
+    def test_permanent_message_errors_do_not_match_quota_words(self):
+        for response in (
+            b'5.7.1 Message is being moderated',
+            b'5.6.0 Please separate the recipients',
+            b'5.7.1 Unable to generate a response',
+            b'5.3.4 Message size limit exceeded',
+            b'5.1.1 User unknown',
+            b'5.7.1 Relaying denied',
+        ):
+            self.assertFalse(is_account_error(SMTPResponseException(550, response)), response)
+
+
+class RouteDeliveryTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        templating._compiled_messages.clear()
+
+    def test_claim_batch_starts_with_oldest_route(self):
+        for recipient in ('a1@a.example', 'b1@b.example', 'a2@a.example', 'c1@c.example', 'a3@a.example'):
+            enqueue_email('Тема', 'Текст', recipient)
+
+        first = claim_batch(4)
+        second = claim_batch(4)
+
+        self.assertEqual([email.recipient for email in first], ['a1@a.example', 'a2@a.example', 'a3@a.example',
+                                                                'b1@b.example'])
+        self.assertEqual([email.recipient for email in second], ['c1@c.example'])
+
+    def test_route_is_pinned_to_one_account(self):
+        pool = SmtpPool([
+            SmtpAccount(f'account{index}', backend='django.core.mail.backends.locmem.EmailBackend')
+            for index in range(4)
+        ])
+        pinned = pool.choose(route='example.com')
+
+        self.assertEqual({pool.choose(route='example.com').name for _ in range(50)}, {pinned.name})
+
+        pool.unavailable.add(pinned.name)
+        repinned = pool.choose(route='example.com')
+        self.assertNotEqual(repinned, pinned)
+        self.assertEqual(pool.routes['example.com'], repinned.name)
+
+    def make_mailing(self, count):
+        owner = CustomUser.objects.create(username='owner', email='owner@example.com')
+        message = Message.objects.create(subject='Тема', body='Текст', owner=owner)
+        mailing = Mailing.objects.create(message=message, owner=owner, status='started')
+        mailing.clients.set([
+            Client.objects.create(email=f'client{index}@example.com', full_name='Клиент', owner=owner)
+            for index in range(count)
+        ])
+        enqueue_mailing(mailing)
+        return mailing
+
+    def test_each_recipient_is_in_to_by_default(self):
+        self.make_mailing(3)
+
+        drain_outbox(SmtpPool([SmtpAccount('main', backend='django.core.mail.backends.locmem.EmailBackend')]))
+
+        self.assertEqual(sorted(message.to[0] for message in mail.outbox),
+                         [f'client{index}@example.com' for index in range(3)])
+        self.assertTrue(all(len(message.to) == 1 and not message.bcc for message in mail.outbox))
+
+    @override_settings(MAILING_MAX_RECIPIENTS_PER_MESSAGE=50)
+    def test_grouped_recipients_are_hidden(self):
+        self.make_mailing(3)
+
+        drain_outbox(SmtpPool([SmtpAccount('main', backend='django.core.mail.backends.locmem.EmailBackend')]))
+
+        self.assertEqual(len(mail.outbox), 1)
+        message = mail.outbox[0]
+        self.assertEqual(message.to, [])
+        self.assertEqual(sorted(message.bcc), [f'client{index}@example.com' for index in range(3)])
+        self.assertEqual(message.message()['To'], 'undisclosed-recipients:;')
+        self.assertNotIn('client0@example.com', message.message().as_string())
+
+
+class FixedResolver:
+    """Резолвер с заранее заданными ответами; запрошенные домены запоминаются"""
+
+    def __init__(self, answers):
+        self.answers = answers
+        self.queried = []
+
+    def has_mail_exchanger(self, domain):
+        self.queried.append(domain)
+        return self.answers.get(domain, True)
+
+
+class EmailValidationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_mail_domain_accepts_internationalized_domains(self):
+        self.assertEqual(mail_domain('user@пример.рф'), 'xn--e1afmkfd.xn--p1ai')
+        self.assertEqual(mail_domain('user@xn--e1afmkfd.xn--p1ai'), 'xn--e1afmkfd.xn--p1ai')
+        self.assertEqual(mail_domain('User@Example.COM'), 'example.com')
+
+    def test_mail_domain_rejects_malformed_addresses(self):
+        for email in ('user', 'user@', '@example.com', 'user@@example.com', 'user@example'):
+            self.assertIsNone(mail_domain(email), email)
+
+    def test_find_invalid_emails(self):
+        resolver = FixedResolver({'dead.example': False})
+        invalid = find_invalid_emails(['bad', 'user@dead.example', 'user@пример.рф', 'user@example.com'], resolver)
+
+        self.assertEqual(set(invalid), {'bad', 'user@dead.example'})
+        self.assertEqual(invalid['bad'], 'Некорректный формат адреса')
+
+    def test_unknown_dns_answer_is_accepted_and_not_cached(self):
+        resolver = FixedResolver({'flaky.example': None})
+
+        self.assertEqual(find_invalid_emails(['user@flaky.example'], resolver), {})
+        find_invalid_emails(['user@flaky.example'], resolver)
+        self.assertEqual(resolver.queried, ['flaky.example', 'flaky.example'])
+
+    def test_dns_answers_are_cached(self):
+        resolver = FixedResolver({'dead.example': False})
+        find_invalid_emails(['a@dead.example', 'b@example.com'], resolver)
+        find_invalid_emails(['c@dead.example', 'd@example.com'], resolver)
+
+        self.assertEqual(sorted(resolver.queried), ['dead.example', 'example.com'])
+
+    def test_resolver_falls_back_to_getaddrinfo_without_dnspython(self):
+        missing = socket.gaierror(socket.EAI_NONAME, 'Name or service not known')
+        with mock.patch.object(validation, 'dns', None):
+            with mock.patch('socket.getaddrinfo', return_value=[]):
+                self.assertIs(DnsResolver().has_mail_exchanger('example.com'), True)
+            with mock.patch('socket.getaddrinfo', side_effect=missing):
+                self.assertIs(DnsResolver().has_mail_exchanger('missing.example'), False)
+            with mock.patch('socket.getaddrinfo', side_effect=socket.gaierror(socket.EAI_AGAIN, 'Try again')):
+                self.assertIsNone(DnsResolver().has_mail_exchanger('example.com'))
+
+    def test_invalid_recipients_are_skipped_but_not_suppressed(self):
+        owner = CustomUser.objects.create(username='owner', email='owner@example.com')
+        message = Message.objects.create(subject='Тема', body='Текст', owner=owner)
+        mailing = Mailing.objects.create(message=message, owner=owner)
+        clients = [
+            Client.objects.create(email=email, full_name='Клиент', owner=owner)
+            for email in ('user@пример.рф', 'user@dead.example')
+        ]
+        mailing.clients.set(clients)
+
+        invalid_clients = validate_mailing_recipients(mailing, FixedResolver({'dead.example': False}))
+        enqueue_mailing(mailing, exclude_clients=invalid_clients)
+
+        self.assertEqual(invalid_clients, {clients[1].pk})
+        self.assertFalse(Suppression.objects.exists())
+        self.assertEqual(MailingAttempt.objects.get(mailing=mailing).client, clients[1])
+        self.assertEqual(list(OutboxEmail.objects.values_list('client_id', flat=True)), [clients[0].pk])
+
+    @override_settings(EMAIL_MX_RESOLVER='mailing.validation.StaticResolver',
+                       EMAIL_MX_STATIC_DOMAINS={'dead.example': False})
+    def test_resending_mailing_does_not_duplicate_validation_failures(self):
+        owner = CustomUser.objects.create(username='owner', email='owner@example.com')
+        message = Message.objects.create(subject='Тема', body='Текст', owner=owner)
+        mailing = Mailing.objects.create(message=message, owner=owner)
+        mailing.clients.set([
+            Client.objects.create(email=email, full_name='Клиент', owner=owner)
+            for email in ('user@example.com', 'user@dead.example')
+        ])
+        pool = SmtpPool([SmtpAccount('main', backend='django.core.mail.backends.locmem.EmailBackend')])
+
+        self.assertEqual(send_mailing(mailing, pool=pool), (1, 1))
+        send_mailing(mailing, pool=pool)
+
+        self.assertEqual(MailingAttempt.objects.filter(mailing=mailing, status='failure').count(), 1)
+        self.assertEqual(len(mail.outbox), 1)
+
+
+DSN_TEMPLATE = """From: MAILER-DAEMON@mx.example.com
+Subject: Undelivered Mail Returned to Sender
+MIME-Version: 1.0
+Content-Type: multipart/report; report-type=delivery-status; boundary="dsn"
+
+--dsn
+Content-Type: message/delivery-status
+
+Reporting-MTA: dns; mx.example.com
+
+Final-Recipient: rfc822; {recipient}
+Action: failed
+Status: 5.1.1
+
+--dsn
+Content-Type: text/rfc822-headers
+
+Message-ID: {message_id}
+
+--dsn--
+"""
+
+
+class IngestBouncesTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = f'{directory.name}/Maildir'
+        self.maildir = mailbox.Maildir(self.path)
+        self.email = enqueue_email('Тема', 'Текст', 'user@example.com')
+
+    def test_delete_removes_only_matched_bounce_notices(self):
+        matched = self.maildir.add(DSN_TEMPLATE.format(recipient='user@example.com', message_id=self.email.message_id))
+        unknown = self.maildir.add(DSN_TEMPLATE.format(recipient='user@example.com', message_id='<other@example.com>'))
+        regular = self.maildir.add('From: friend@example.com\nSubject: Hello\n\nRegular mail\n')
+
+        source = MailboxSource(self.path)
+        stats = ingest_bounces(source, remove=True)
+        source.close()
+
+        self.assertEqual((stats['messages'], stats['bounces'], stats['matched']), (3, 2, 1))
+        self.assertEqual(set(self.maildir.keys()), {unknown, regular})
+        self.assertNotIn(matched, self.maildir.keys())
+        self.email.refresh_from_db()
+        self.assertEqual(self.email.status, 'bounced')
+
+    def test_delete_removes_repeated_notice_for_bounced_delivery(self):
+        OutboxEmail.objects.filter(pk=self.email.pk).update(status='bounced')
+        self.maildir.add(DSN_TEMPLATE.format(recipient='user@example.com', message_id=self.email.message_id))
+
+        source = MailboxSource(self.path)
+        stats = ingest_bounces(source, remove=True)
+        source.close()
+
+        self.assertEqual(stats['matched'], 0)
+        self.assertEqual(self.maildir.keys(), [])
+
+
+class EncodedAttachmentTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'report.pdf')
+        self.content = os.urandom(200 * 1024)
+        with open(self.path, 'wb') as attachment_file:
+            attachment_file.write(self.content)
+
+    def make_message(self, attachment):
+        message = AttachmentEmailMessage('Тема', 'Текст', 'news@example.com', ['client@example.com'])
+        message.attach_alternative('<p>Текст</p>', 'text/html')
+        message.attach(attachment)
+        return message
+
+    def test_payload_is_kept_on_disk(self):
+        attachment = EncodedAttachment(self.path, 'report.pdf')
+
+        self.assertTrue(os.path.exists(encoded_path(self.path)))
+        self.assertLess(len(attachment.get_payload()), 100)
+
+    def test_serialized_message_contains_attachment(self):
+        attachment = EncodedAttachment(self.path, 'report.pdf')
+
+        for linesep in ('\r\n', '\n'):
+            data = self.make_message(attachment).message().as_bytes(linesep=linesep)
+            parsed = message_from_bytes(data)
+            parts = [part for part in parsed.walk() if part.get_filename() == 'report.pdf']
+            self.assertEqual(parts[0].get_payload(decode=True), self.content)
+            self.assertEqual(parts[0].get_content_type(), 'application/pdf')
+            self.assertNotIn(attachment.marker.encode(), data)
+
+
+class ReportExportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = CustomUser.objects.create(username='owner', email='owner@example.com')
+        cls.other = CustomUser.objects.create(username='other', email='other@example.com')
+        cls.manager = CustomUser.objects.create(username='manager', email='manager@example.com')
+        cls.manager.user_permissions.add(Permission.objects.get(codename='can_block_users'))
+        cls.mailings = {}
+        for user in (cls.owner, cls.other):
+            message = Message.objects.create(subject='Тема', body='Текст', owner=user)
+            mailing = Mailing.objects.create(message=message, owner=user)
+            client = Client.objects.create(email=f'client@{user.username}.example', full_name='Клиент', owner=user)
+            MailingAttempt.objects.create(mailing=mailing, client=client, owner=user, status='success',
+                                          server_response='250 OK, "принято"')
+            cls.mailings[user.pk] = mailing
+
+    def setUp(self):
+        cache.clear()
+
+    def test_sync_request_streams_csv(self):
+        self.client.force_login(self.owner)
+        mailing = self.mailings[self.owner.pk]
+
+        response = self.client.get(reverse('mailing:mailing_report', args=[mailing.pk]))
+
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Disposition'], f'attachment; filename="mailing-{mailing.pk}-attempts.csv"')
+        rows = list(csv.reader(b''.join(response.streaming_content).decode().splitlines()))
+        self.assertEqual(rows[0][:2], ['id', 'mailing_id'])
+        self.assertEqual(len(rows), 2)
+        self.assertEqual(rows[1][-1], '250 OK, "принято"')
+
+    async def test_asgi_request_streams_jsonl(self):
+        await self.async_client.aforce_login(self.manager)
+
+        response = await self.async_client.get(reverse('mailing:manager_report'), {'format': 'jsonl'})
+
+        self.assertTrue(response.is_async)
+        content = b''.join([chunk async for chunk in response.streaming_content])
+        rows = [json.loads(line) for line in content.decode().splitlines()]
+        self.assertEqual({row['mailing_id'] for row in rows}, {mailing.pk for mailing in self.mailings.values()})
+
+    def test_foreign_mailing_report_is_not_found(self):
+        self.client.force_login(self.owner)
+
+        response = self.client.get(reverse('mailing:mailing_report', args=[self.mailings[self.other.pk].pk]))
+
+        self.assertEqual(response.status_code, 404)
+
+    def test_default_mailing_ids_are_limited_to_owner(self):
+        view = ReportExportView()
+        view.request = RequestFactory().get('/')
+        view.request.user = self.owner
+
+        mailing_ids = async_to_sync(view.get_mailing_ids)()
+        self.assertEqual([row['id'] for row in mailing_ids], [self.mailings[self.owner.pk].pk])
+
+        view.is_manager = True
+        self.assertIsNone(async_to_sync(view.get_mailing_ids)())
+
+
+class ForbiddenResolver:
+    """Резолвер, обращение к которому означает запрос к DNS"""
+
+    def has_mail_exchanger(self, domain):
+        raise AssertionError(f'DNS-запрос для {domain}')
+
+
+class RecordingSimulator(SmtpSimulator):
+    """Симулятор, который запоминает переданные письма"""
+
+    def sendmail(self, from_addr, to_addrs, msg, *args, **kwargs):
+        self.messages = getattr(self, 'messages', []) + [msg]
+        return super().sendmail(from_addr, to_addrs, msg, *args, **kwargs)
+
+
+@override_settings(EMAIL_MX_RESOLVER='mailing.tests.ForbiddenResolver')
+class SimulationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        owner = CustomUser.objects.create(username='owner', email='owner@example.com')
+        message = Message.objects.create(subject='Тема', body='Текст', owner=owner)
+        self.mailing = Mailing.objects.create(message=message, owner=owner)
+        self.mailing.clients.set([
+            Client.objects.create(email=email, full_name='Клиент', owner=owner)
+            for email in ('user@unknown.example', 'user@dead.example')
+        ])
+        cache.set(mx_cache_key('dead.example'), False)
+
+    def test_simulation_does_not_query_dns_or_keep_mx_answers(self):
+        results, stats = simulate_mailings([self.mailing], SmtpSimulator(latency=0))
+
+        self.assertEqual(results[0][1:], (1, 1))
+        self.assertEqual(stats['unchecked_domains'], 1)
+        self.assertIsNone(cache.get(mx_cache_key('unknown.example')))
+        self.assertIs(cache.get(mx_cache_key('dead.example')), False)
+        self.assertFalse(MailingAttempt.objects.exists())
+
+    @override_settings(EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend')
+    def test_messages_are_not_signed_without_dkim_backend(self):
+        simulator = RecordingSimulator(latency=0)
+        simulate_mailings([self.mailing], simulator)
+
+        self.assertFalse(simulator.messages[0].startswith(b'DKIM-Signature:'))
+
+    @skipIf(rsa is None, 'нужен пакет cryptography')
+    def test_messages_are_signed_like_delivery(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        key_path = os.path.join(directory.name, 'dkim.pem')
+        with open(key_path, 'wb') as key_file:
+            key_file.write(rsa.generate_private_key(public_exponent=65537, key_size=1024).private_bytes(
+                serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption(),
+            ))
+        simulator = RecordingSimulator(latency=0)
+
+        with self.settings(EMAIL_BACKEND='mailing.dkim.DkimEmailBackend', DKIM_SELECTOR='mail',
+                           DKIM_PRIVATE_KEY_PATH=key_path, DKIM_DOMAIN='example.com'):
+            simulate_mailings([self.mailing], simulator)
+
+        self.assertTrue(simulator.messages[0].startswith(b'DKIM-Signature:'))
+        self.assertIn(b'd=example.com; s=mail;', simulator.messages[0])
+
+    def test_peak_rss_units_depend_on_platform(self):
+        usage = SimpleNamespace(ru_maxrss=2048)
+        with mock.patch.object(simulation.resource, 'getrusage', return_value=usage):
+            with mock.patch.object(simulation.sys, 'platform', 'darwin'):
+                self.assertEqual(simulation.peak_rss(), 2048)
+            with mock.patch.object(simulation.sys, 'platform', 'linux'):
+                self.assertEqual(simulation.peak_rss(), 2048 * 1024)
+
+
+class MailingDetailCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.owner = CustomUser.objects.create(username='owner', email='owner@example.com')
+        self.message = Message.objects.create(subject='Тема', body='Текст', owner=self.owner)
+        self.mailings = [Mailing.objects.create(message=self.message, owner=self.owner) for _ in range(3)]
+        self.client.force_login(self.owner)
+
+    def get_detail(self, mailing):
+        return self.client.get(reverse('mailing:mailing_detail', args=[mailing.pk]))
+
+    def test_user_number_is_cached_and_shifts_after_deleting_earlier_mailing(self):
+        self.assertContains(self.get_detail(self.mailings[2]), 'Рассылка #3')
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertContains(self.get_detail(self.mailings[2]), 'Рассылка #3')
+        self.assertFalse([query for query in queries if 'COUNT(' in query['sql'].upper()])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.mailings[0].delete()
+        self.assertContains(self.get_detail(self.mailings[2]), 'Рассылка #2')
+
+    def test_fragment_versions_change_after_commit(self):
+        versions = get_fragment_versions(self.mailings[0].pk)
+        self.assertEqual(get_fragment_versions(self.mailings[0].pk), versions)
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            invalidate_fragments([self.mailings[0].pk], 'attempts')
+        self.assertEqual(get_fragment_versions(self.mailings[0].pk), versions)
+
+        callbacks[0]()
+        changed = get_fragment_versions(self.mailings[0].pk)
+        self.assertNotEqual(changed['attempts'], versions['attempts'])
+        self.assertEqual(changed['recipients'], versions['recipients'])
+
+    def test_recipients_fragment_is_refreshed_when_clients_change(self):
+        mailing = self.mailings[0]
+        client = Client.objects.create(email='client@example.com', full_name='Клиент', owner=self.owner)
+        self.get_detail(mailing)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            mailing.clients.add(client)
+
+        self.assertContains(self.get_detail(mailing), client.email)
+
+
+def create_mailing(owner, emails=(), **fields):
+    """Рассылка владельца с простым сообщением и клиентами по списку адресов"""
+    message = Message.objects.create(subject='Тема', body='Текст', owner=owner)
+    mailing = Mailing.objects.create(message=message, owner=owner, **fields)
+    mailing.clients.set([
+        Client.objects.create(email=email, full_name='Клиент', owner=owner) for email in emails
+    ])
+    return mailing
+
+
+@override_settings(EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend', EMAIL_ACCOUNTS=[],
+                   EMAIL_MX_RESOLVER='mailing.validation.StaticResolver')
+class ScheduleTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.owner = CustomUser.objects.create(username='owner', email='owner@example.com')
+        self.now = timezone.now()
+
+    def test_due_mailings_are_started_and_not_expired(self):
+        due = create_mailing(self.owner, start_time=self.now - timedelta(minutes=1))
+        unscheduled = create_mailing(self.owner)
+        create_mailing(self.owner, start_time=self.now + timedelta(hours=1))
+        create_mailing(self.owner, start_time=self.now - timedelta(hours=2), end_time=self.now - timedelta(hours=1))
+        create_mailing(self.owner, start_time=self.now - timedelta(minutes=1), status='started')
+
+        self.assertEqual(set(get_due_mailings(self.now)), {due, unscheduled})
+
+    def test_mailing_is_claimed_once(self):
+        mailing = create_mailing(self.owner)
+
+        self.assertTrue(claim_mailing(mailing))
+        self.assertFalse(claim_mailing(Mailing.objects.get(pk=mailing.pk)))
+        self.assertEqual(mailing.status, 'started')
+
+    def test_expired_mailings_are_completed(self):
+        expired = create_mailing(self.owner, end_time=self.now - timedelta(minutes=1), status='started')
+        running = create_mailing(self.owner, end_time=self.now + timedelta(hours=1), status='started')
+
+        self.assertEqual(close_expired_mailings(self.now), 1)
+        expired.refresh_from_db()
+        running.refresh_from_db()
+        self.assertEqual((expired.status, running.status), ('completed', 'started'))
+
+    def test_next_schedule_event_is_nearest_start_or_end(self):
+        self.assertIsNone(get_next_schedule_event(self.now))
+
+        create_mailing(self.owner, start_time=self.now + timedelta(hours=2))
+        create_mailing(self.owner, status='started', end_time=self.now + timedelta(hours=1))
+
+        self.assertEqual(get_next_schedule_event(self.now), self.now + timedelta(hours=1))
+
+    def test_dispatcher_sends_only_due_mailings(self):
+        due = create_mailing(self.owner, ['client@example.com'], start_time=self.now - timedelta(minutes=1))
+        later = create_mailing(self.owner, ['later@example.com'], start_time=self.now + timedelta(hours=1))
+
+        call_command('send_mailings', stdout=StringIO())
+
+        self.assertEqual([message.to for message in mail.outbox], [['client@example.com']])
+        due.refresh_from_db()
+        later.refresh_from_db()
+        self.assertEqual((due.status, later.status), ('completed', 'created'))
+
+
+class OutboxTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.owner = CustomUser.objects.create(username='owner', email='owner@example.com')
+        self.pool = SmtpPool([SmtpAccount('main', backend='django.core.mail.backends.locmem.EmailBackend')])
+
+    def test_enqueue_is_idempotent(self):
+        first = enqueue_email('Тема', 'Текст', 'user@example.com', idempotency_key='welcome:1')
+        second = enqueue_email('Другая тема', 'Текст', 'user@example.com', idempotency_key='welcome:1')
+
+        self.assertEqual(first.pk, second.pk)
+        self.assertEqual(OutboxEmail.objects.count(), 1)
+
+        mailing = create_mailing(self.owner, ['a@example.com', 'b@example.com'], status='started')
+        enqueue_mailing(mailing)
+        enqueue_mailing(mailing)
+        self.assertEqual(mailing.outbox_emails.count(), 2)
+
+    def test_claimed_email_is_leased_until_timeout(self):
+        email = enqueue_email('Тема', 'Текст', 'user@example.com')
+
+        self.assertEqual(claim_batch(10), [email])
+        self.assertEqual(claim_batch(10), [])
+
+        OutboxEmail.objects.filter(pk=email.pk).update(claimed_at=timezone.now() - LEASE_TIMEOUT * 2)
+        self.assertEqual(claim_batch(10), [email])
+
+    def test_postponed_and_inactive_mailing_emails_are_not_claimed(self):
+        email = enqueue_email('Тема', 'Текст', 'user@example.com')
+        OutboxEmail.objects.filter(pk=email.pk).update(next_attempt_at=timezone.now() + timedelta(minutes=5))
+        enqueue_mailing(create_mailing(self.owner, ['client@example.com']))
+
+        self.assertEqual(claim_batch(10), [])
+
+    def test_sent_email_keeps_message_id_and_is_not_sent_again(self):
+        mailing = create_mailing(self.owner, ['client@example.com'], status='started')
+        enqueue_mailing(mailing)
+        email = mailing.outbox_emails.get()
+
+        self.assertEqual(drain_outbox(self.pool), (1, 0, 1))
+        self.assertEqual(drain_outbox(self.pool), (0, 0, 0))
+
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].extra_headers['Message-ID'], email.message_id)
+        attempt = MailingAttempt.objects.get(mailing=mailing)
+        self.assertEqual((attempt.status, attempt.message_id), ('success', email.message_id))
+        mailing.refresh_from_db()
+        self.assertEqual(mailing.status, 'completed')
+
+
+class TemplatingTests(TestCase):
+    def setUp(self):
+        # Кеш процесса ключуется по id и версии, а id в откатываемых тестах повторяются
+        templating._compiled_messages.clear()
+
+    def test_placeholders_are_substituted_and_braces_kept(self):
+        template = CompiledTemplate('Здравствуйте, {{ full_name }}! {json: 1} {{email}} {{ unknown }}')
+
+        self.assertEqual(template.fields, ('full_name', 'email'))
+        self.assertEqual(
+            template.render({'full_name': 'Анна', 'email': 'anna@example.com', 'comment': ''}),
+            'Здравствуйте, Анна! {json: 1} anna@example.com {{ unknown }}',
+        )
+
+    def test_static_template_is_detected(self):
+        template = CompiledTemplate('Без подстановок {}')
+
+        self.assertTrue(template.is_static)
+        self.assertEqual(template.render({}), 'Без подстановок {}')
+
+    def test_html_body_escapes_client_fields(self):
+        owner = CustomUser.objects.create(username='owner', email='owner@example.com')
+        message = Message.objects.create(subject='{{ full_name }}', body='{{ full_name }}',
+                                         html_body='<p>{{ full_name }}</p>', owner=owner)
+        compiled = compile_message(message)
+        context = {'full_name': '<b>Анна & Co</b>', 'email': '', 'comment': ''}
+
+        self.assertEqual(compiled.html_body.render(context), '<p>&lt;b&gt;Анна &amp; Co&lt;/b&gt;</p>')
+        self.assertEqual(compiled.body.render(context), '<b>Анна & Co</b>')
+        self.assertFalse(compiled.is_static)
+
+    def test_compiled_message_is_cached_until_message_changes(self):
+        owner = CustomUser.objects.create(username='owner', email='owner@example.com')
+        message = Message.objects.create(subject='Тема', body='Старый текст', owner=owner)
+        compiled = compile_message(message)
+
+        self.assertIs(compile_message(Message.objects.get(pk=message.pk)), compiled)
+
+        message.body = 'Новый текст'
+        message.save()
+
+        recompiled = compile_message(Message.objects.get(pk=message.pk))
+        self.assertIsNot(recompiled, compiled)
+        self.assertEqual(recompiled.body.render({}), 'Новый текст')
+
+
+class BulkManagerOperationsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.manager = CustomUser.objects.create(username='manager', email='manager@example.com')
+        self.manager.user_permissions.add(*Permission.objects.filter(
+            codename__in=['can_block_users', 'can_disable_mailings'],
+        ))
+        self.users = [
+            CustomUser.objects.create(username=f'user{index}', email=f'user{index}@spam.example')
+            for index in range(3)
+        ]
+        self.other = CustomUser.objects.create(username='other', email='other@example.com')
+        self.client.force_login(self.manager)
+
+    def test_block_users_by_domain_disables_their_mailings(self):
+        created = create_mailing(self.users[0])
+        started = create_mailing(self.users[1], ['client@example.com'], status='started')
+        enqueue_mailing(started)
+        foreign = create_mailing(self.other, status='started')
+
+        response = self.client.post(reverse('mailing:user_bulk_block'), {'email_domain': '@spam.example'})
+
+        self.assertRedirects(response, reverse('mailing:user_list'), fetch_redirect_response=False)
+        self.assertEqual(CustomUser.objects.filter(is_active=False).count(), 3)
+        self.assertTrue(CustomUser.objects.get(pk=self.other.pk).is_active)
+        statuses = dict(Mailing.objects.values_list('pk', 'status'))
+        self.assertEqual(
+            (statuses[created.pk], statuses[started.pk], statuses[foreign.pk]),
+            ('completed', 'interrupted', 'started'),
+        )
+        self.assertEqual(started.outbox_emails.get().status, 'cancelled')
+        self.assertIs(cache.get(cancellation_key(started.pk)), True)
+
+    def test_bulk_unblock_by_ids_skips_current_user(self):
+        CustomUser.objects.filter(pk__in=[user.pk for user in self.users]).update(is_active=False)
+
+        self.client.post(reverse('mailing:user_bulk_block'), {
+            'ids': [self.users[0].pk, self.manager.pk, 'x'], 'action': 'unblock',
+        })
+
+        self.assertEqual(list(CustomUser.objects.filter(is_active=True).order_by('pk')),
+                         [self.manager, self.users[0], self.other])
+
+    def test_manager_does_not_block_self(self):
+        self.client.post(reverse('mailing:user_bulk_block'), {'ids': [self.manager.pk]})
+
+        self.assertTrue(CustomUser.objects.get(pk=self.manager.pk).is_active)
+
+    def test_bulk_disable_by_owner(self):
+        mailings = [create_mailing(self.users[0]), create_mailing(self.users[0], status='started')]
+        foreign = create_mailing(self.other)
+
+        self.client.post(reverse('mailing:mailing_bulk_disable'), {'owner': self.users[0].pk})
+
+        self.assertEqual([Mailing.objects.get(pk=mailing.pk).status for mailing in mailings],
+                         ['completed', 'interrupted'])
+        self.assertEqual(Mailing.objects.get(pk=foreign.pk).status, 'created')
+
+    def test_bulk_operations_require_permissions(self):
+        self.client.force_login(self.other)
+
+        self.assertEqual(self.client.post(reverse('mailing:user_bulk_block'), {'ids': [self.users[0].pk]})
+                         .status_code, 403)
+        self.assertEqual(self.client.post(reverse('mailing:mailing_bulk_disable'), {'owner': self.users[0].pk})
+                         .status_code, 403)
+        self.assertTrue(CustomUser.objects.get(pk=self.users[0].pk).is_active)
+
+
+class CancellingEmailBackend(EmailBackend):
+    """Бэкенд, после cancel_after отправок которого менеджер отключает рассылку из другого процесса"""
+    cancel_after = 0
+    mailing_id = None
+    sent = 0
+
+    def send_messages(self, messages):
+        type(self).sent += 1
+        if type(self).sent == type(self).cancel_after:
+            request_cancellation([type(self).mailing_id])
+        return super().send_messages(messages)
+
+
+@override_settings(EMAIL_MX_RESOLVER='mailing.validation.StaticResolver')
+class CooperativeCancellationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        owner = CustomUser.objects.create(username='owner', email='owner@example.com')
+        self.mailing = create_mailing(owner, [f'client{index}@example.com' for index in range(50)])
+        self.pool = SmtpPool([SmtpAccount('main', backend='mailing.tests.CancellingEmailBackend')])
+        CancellingEmailBackend.sent = 0
+        CancellingEmailBackend.mailing_id = self.mailing.pk
+
+    def test_running_mailing_stops_at_next_check(self):
+        CancellingEmailBackend.cancel_after = 5
+
+        sent, failed = send_mailing(self.mailing, batch_size=100, pool=self.pool)
+
+        self.assertEqual((sent, failed), (CANCEL_CHECK_EVERY, 0))
+        self.assertEqual(self.mailing.outbox_emails.filter(status='cancelled').count(), 50 - CANCEL_CHECK_EVERY)
+        self.mailing.refresh_from_db()
+        self.assertEqual(self.mailing.status, 'interrupted')
+        self.assertEqual(MailingAttempt.objects.filter(mailing=self.mailing).count(), CANCEL_CHECK_EVERY)
+
+    def test_mailing_past_end_time_cancels_pending_emails(self):
+        self.mailing.status = 'started'
+        self.mailing.end_time = timezone.now() - timedelta(seconds=1)
+        enqueue_mailing(self.mailing)
+
+        self.assertEqual(deliver_mailing(self.mailing, pool=self.pool), (0, 0))
+        self.assertEqual(self.mailing.outbox_emails.filter(status='cancelled').count(), 50)
+        self.assertEqual(CancellingEmailBackend.sent, 0)
+
+
+class SuppressionTests(TestCase):
+    def setUp(self):
+        self.owner = CustomUser.objects.create(username='owner', email='owner@example.com')
+
+    def test_suppressed_addresses_are_not_enqueued(self):
+        Suppression.objects.create(email='Blocked@Example.com', reason='unsubscribe')
+        mailing = create_mailing(self.owner, ['BLOCKED@example.com', 'client@example.com'], status='started')
+
+        enqueue_mailing(mailing)
+
+        self.assertEqual(Suppression.objects.get().email, 'blocked@example.com')
+        self.assertEqual(list(mailing.outbox_emails.values_list('recipient', flat=True)), ['client@example.com'])
+
+    def test_suppress_emails_cancels_only_pending_mailing_emails(self):
+        mailing = create_mailing(self.owner, ['bounced@example.com', 'client@example.com'], status='started')
+        enqueue_mailing(mailing)
+        transactional = enqueue_email('Тема', 'Текст', 'bounced@example.com')
+
+        self.assertEqual(suppress_emails(['Bounced@Example.com ', 'bounced@example.com'], 'bounce'), 1)
+        self.assertEqual(suppress_emails(['bounced@example.com'], 'bounce'), 0)
+
+        self.assertEqual(Suppression.objects.count(), 1)
+        statuses = dict(OutboxEmail.objects.values_list('recipient', 'status').filter(mailing=mailing))
+        self.assertEqual(statuses, {'bounced@example.com': 'cancelled', 'client@example.com': 'pending'})
+        transactional.refresh_from_db()
+        self.assertEqual(transactional.status, 'pending')
+
+    def test_client_email_is_unique_per_owner_ignoring_case(self):
+        Client.objects.create(email='client@example.com', full_name='Клиент', owner=self.owner)
+        other = CustomUser.objects.create(username='other', email='other@example.com')
+        data = {'email': 'Client@Example.com', 'full_name': 'Клиент'}
+
+        self.assertFalse(ClientForm(data, user=self.owner).is_valid())
+        self.assertTrue(ClientForm(data, user=other).is_valid())
+
+
+@override_settings(EMAIL_MX_RESOLVER='mailing.validation.StaticResolver',
+                   EMAIL_MX_STATIC_DOMAINS={'dead.example': False})
+class ProgressTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.owner = CustomUser.objects.create(username='owner', email='owner@example.com')
+        self.mailing = create_mailing(self.owner, ['a@example.com', 'b@example.com', 'c@dead.example'])
+        self.pool = SmtpPool([SmtpAccount('main', backend='django.core.mail.backends.locmem.EmailBackend')])
+
+    def send(self):
+        # Итоговый статус рассылки попадает в кеш после фиксации транзакции
+        with self.captureOnCommitCallbacks(execute=True):
+            send_mailing(self.mailing, pool=self.pool)
+
+    def test_counters_follow_delivery(self):
+        self.send()
+
+        self.assertEqual(get_progress(self.mailing.pk), {
+            'owner': self.owner.pk, 'status': 'completed', 'total': 3, 'sent': 2, 'failed': 1,
+        })
+
+    def test_progress_is_visible_only_to_owner(self):
+        url = reverse('mailing:mailing_progress', args=[self.mailing.pk])
+        self.client.force_login(self.owner)
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+        self.send()
+
+        self.assertEqual(self.client.get(url).json(), {'status': 'completed', 'total': 3, 'sent': 2, 'failed': 1})
+        self.client.force_login(CustomUser.objects.create(username='other', email='other@example.com'))
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+    def test_stream_ends_with_final_counters(self):
+        self.send()
+        self.client.force_login(self.owner)
+
+        response = self.client.get(reverse('mailing:mailing_progress_stream', args=[self.mailing.pk]))
+
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        events = b''.join(response.streaming_content).decode()
+        self.assertEqual(events, 'data: {"status": "completed", "total": 3, "sent": 2, "failed": 1}\n\n')
+
+    async def test_asgi_stream_is_async(self):
+        await self.async_client.aforce_login(self.owner)
+        await sync_to_async(self.send)()
+
+        response = await self.async_client.get(reverse('mailing:mailing_progress_stream', args=[self.mailing.pk]))
+
+        self.assertTrue(response.is_async)
+        events = [event async for event in response.streaming_content]
+        self.assertEqual(len(events), 1)
+        self.assertIn(b'"sent": 2', events[0])
+
+
+class AsyncViewsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.owner = CustomUser.objects.create(username='owner', email='owner@example.com')
+        self.other = CustomUser.objects.create(username='other', email='other@example.com')
+        self.manager = CustomUser.objects.create(username='manager', email='manager@example.com')
+        self.manager.user_permissions.add(Permission.objects.get(codename='can_block_users'))
+        create_mailing(self.other, ['foreign@example.com'])
+        self.mailings = [create_mailing(self.owner, [f'client{index}@example.com']) for index in range(2)]
+
+    async def test_anonymous_user_is_redirected_to_login(self):
+        response = await self.async_client.get(reverse('mailing:client_list'))
+
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(response.url.startswith(reverse('users:login')))
+
+    async def test_client_list_is_limited_to_owner(self):
+        await self.async_client.aforce_login(self.owner)
+
+        response = await self.async_client.get(reverse('mailing:client_list'))
+
+        self.assertEqual([client.email for client in response.context['object_list']],
+                         ['client0@example.com', 'client1@example.com'])
+        self.assertFalse(response.context['is_paginated'])
+
+    async def test_manager_sees_all_mailings_numbered_per_owner(self):
+        await self.async_client.aforce_login(self.manager)
+
+        response = await self.async_client.get(reverse('mailing:mailing_list'))
+
+        mailings = response.context['mailings']
+        numbers = {mailing.pk: (mailing.user_number, mailing.clients_count) for mailing in mailings}
+        self.assertEqual(len(numbers), 3)
+        self.assertEqual(numbers[self.mailings[1].pk], (2, 1))
+
+    async def test_index_shows_owner_statistics(self):
+        await self.async_client.aforce_login(self.owner)
+
+        response = await self.async_client.get(reverse('mailing:index'))
+
+        self.assertEqual(response.context['total_mailings'], 2)
+        self.assertEqual(response.context['unique_clients'], 2)
+
+
+class SearchTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.owner = CustomUser.objects.create(username='owner', email='owner@example.com')
+        for email, full_name, comment in (
+            ('ivan.petrov@example.com', 'Ivan Petrov', ''),
+            ('maria@example.com', 'Maria Ivanova', ''),
+            ('ivan@example.com', 'Ivan Sidorov', ''),
+            ('olga@example.com', 'Olga Smirnova', 'VIP client'),
+        ):
+            Client.objects.create(email=email, full_name=full_name, comment=comment, owner=self.owner)
+        self.clients = Client.objects.filter(owner=self.owner)
+
+    def emails(self, queryset):
+        return [client.email for client in queryset]
+
+    @skipIf(connection.vendor == 'postgresql', 'ранжирование без индексов используется только вне PostgreSQL')
+    def test_clients_are_ranked_exact_then_prefix_then_substring(self):
+        self.assertEqual(self.emails(search_clients(self.clients, 'IVAN@example.com')), ['ivan@example.com'])
+        self.assertEqual(
+            self.emails(search_clients(self.clients, 'ivan')),
+            ['ivan.petrov@example.com', 'ivan@example.com', 'maria@example.com'],
+        )
+        self.assertEqual(self.emails(search_clients(self.clients, 'vip')), ['olga@example.com'])
+
+    @skipUnless(connection.vendor == 'postgresql', 'нужен PostgreSQL с pg_trgm')
+    def test_clients_are_found_with_typos(self):
+        self.assertIn('maria@example.com', self.emails(search_clients(self.clients, 'Ivanva')))
+
+    def test_messages_are_searched_by_subject_and_body(self):
+        Message.objects.create(subject='Spring sale', body='Discounts for everyone', owner=self.owner)
+        Message.objects.create(subject='Newsletter', body='Our spring sale starts soon', owner=self.owner)
+        Message.objects.create(subject='Newsletter', body='Nothing here', owner=self.owner)
+
+        found = search_messages(Message.objects.all(), 'spring sale')
+
+        self.assertEqual([message.subject for message in found], ['Spring sale', 'Newsletter'])
+
+    def test_list_view_passes_query_to_search(self):
+        self.client.force_login(self.owner)
+
+        response = self.client.get(reverse('mailing:client_list'), {'q': 'olga'})
+
+        self.assertEqual(response.context['query'], 'olga')
+        self.assertEqual(self.emails(response.context['object_list']), ['olga@example.com'])
+
+
+class DkimTests(TestCase):
+    def setUp(self):
+        dkim_signing._body_hashes.clear()
+        self.addCleanup(dkim_signing._body_hashes.clear)
+
+    def make_message(self, recipient):
+        message = AttachmentEmailMessage(
+            subject='Новости', body='Текст  письма \n\n\n', from_email='news@example.com', to=[recipient],
+            headers={'Message-ID': f'<{recipient}>'},
+        )
+        message.attach_alternative('<p>Текст письма</p>', 'text/html')
+        message.dkim_body_key = (1, 1)
+        return message
+
+    def make_key(self):
+        private_key = rsa.generate_private_key(public_exponent=65537, key_size=1024)
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        key_path = os.path.join(directory.name, 'dkim.pem')
+        with open(key_path, 'wb') as key_file:
+            key_file.write(private_key.private_bytes(
+                serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption(),
+            ))
+        return private_key, key_path
+
+    def test_relaxed_canonicalization(self):
+        self.assertEqual(dkim_signing.canonicalize_body(b'a \t b  \r\nc\t\r\n\r\n\r\n'), b'a b\r\nc\r\n')
+        self.assertEqual(dkim_signing.canonicalize_body(b'\r\n\r\n'), b'')
+        self.assertEqual(
+            dkim_signing.canonicalize_header(b'Subject ', b'  Hello \r\n\t world  '), b'subject:Hello world\r\n',
+        )
+
+    def test_body_hash_is_cached_by_key(self):
+        first = dkim_signing.body_hash(b'body\r\n', key=(1, 1))
+
+        with mock.patch.object(dkim_signing.hashlib, 'sha256') as sha256:
+            self.assertEqual(dkim_signing.body_hash(b'other body\r\n', key=(1, 1)), first)
+        sha256.assert_not_called()
+        self.assertNotEqual(dkim_signing.body_hash(b'other body\r\n'), first)
+
+    def test_mailing_bodies_are_identical_for_all_recipients(self):
+        backend = dkim_signing.DkimEmailBackend(dkim_selector=None)
+        bodies = {
+            backend.message_bytes(self.make_message(recipient)).partition(b'\r\n\r\n')[2]
+            for recipient in ('first@example.com', 'second@example.com')
+        }
+
+        self.assertEqual(len(bodies), 1)
+
+    @override_settings(DKIM_SELECTOR=None, DKIM_PRIVATE_KEY_PATH=None)
+    def test_messages_are_not_signed_without_key(self):
+        message = dkim_signing.DkimEmailBackend().message_bytes(self.make_message('first@example.com'))
+
+        self.assertFalse(message.startswith(b'DKIM-Signature:'))
+
+    @skipIf(rsa is None, 'нужен пакет cryptography')
+    def test_signed_message_passes_verification(self):
+        private_key, key_path = self.make_key()
+        backend = dkim_signing.DkimEmailBackend(
+            dkim_domain='example.com', dkim_selector='mail', dkim_private_key_path=key_path,
+        )
+
+        message = backend.message_bytes(self.make_message('first@example.com'))
+
+        self.assertTrue(message.startswith(b'DKIM-Signature: v=1; a=rsa-sha256; c=relaxed/relaxed; d=example.com;'))
+        if dkim is None:
+            self.skipTest('нужен пакет dkimpy')
+        public_key = private_key.public_key().public_bytes(
+            serialization.Encoding.DER, serialization.PublicFormat.SubjectPublicKeyInfo,
+        )
+        record = b'v=DKIM1; k=rsa; p=' + base64.b64encode(public_key)
+
+        def dnsfunc(name, timeout=5):
+            return record if name == b'mail._domainkey.example.com.' else None
+
+        self.assertTrue(dkim.verify(message, dnsfunc=dnsfunc))
@@ -27,9 +27,20 @@ urlpatterns = [
     path('mailings/<int:pk>/edit/', views.MailingUpdateView.as_view(), name='mailing_edit'),
     path('mailings/<int:pk>/delete/', views.MailingDeleteView.as_view(), name='mailing_delete'),
     path('mailings/<int:pk>/send/', views.MailingSendView.as_view(), name='mailing_send'),
+    path('mailings/<int:pk>/progress/', views.MailingProgressView.as_view(), name='mailing_progress'),
+    path(
+        'mailings/<int:pk>/progress/stream/',
+        views.MailingProgressStreamView.as_view(),
+        name='mailing_progress_stream',
+    ),
 
+    path('mailings/<int:pk>/report/', views.MailingReportView.as_view(), name='mailing_report'),
+
+    path('manager/reports/', views.ManagerReportView.as_view(), name='manager_report'),
     path('manager/users/', views.UserListView.as_view(), name='user_list'),
     path('manager/users/<int:pk>/block/', views.UserBlockView.as_view(), name='user_block'),
+    path('manager/users/bulk-block/', views.UserBulkBlockView.as_view(), name='user_bulk_block'),
     path('manager/mailings/<int:pk>/disable/', views.MailingDisableView.as_view(), name='mailing_disable'),
+    path('manager/mailings/bulk-disable/', views.MailingBulkDisableView.as_view(), name='mailing_bulk_disable'),
 
 ]
@@ -0,0 +1,169 @@
+import socket
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.utils.module_loading import import_string
+
+try:
+    import dns.exception
+    import dns.resolver
+except ImportError:
+    dns = None
+
+from .fragments import invalidate_fragments
+from .models import MailingAttempt
+from .suppression import suppressed
+
+VALIDATION_CHUNK_SIZE = 1000
+NEGATIVE_MX_CACHE_TTL = 60 * 60
+VALIDATION_FAILURE = 'Адрес не прошел проверку'
+
+
+class DnsResolver:
+    """Проверяет, что домен принимает почту: есть MX-запись или хотя бы A/AAAA"""
+
+    def has_mail_exchanger(self, domain):
+        """Возвращает True/False или None, если ответ получить не удалось"""
+        if dns is not None:
+            try:
+                dns.resolver.resolve(domain, 'MX')
+                return True
+            except (dns.resolver.NXDOMAIN, dns.resolver.NoNameservers):
+                return False
+            except dns.resolver.NoAnswer:
+                pass
+            except dns.exception.DNSException:
+                return None
+        try:
+            socket.getaddrinfo(domain, None)
+            return True
+        except socket.gaierror as e:
+            if e.errno in (socket.EAI_NONAME, getattr(socket, 'EAI_NODATA', socket.EAI_NONAME)):
+                return False
+            return None
+
+
+class StaticResolver:
+    """Резолвер-заглушка для тестов и локальной разработки
+
+    Домены из EMAIL_MX_STATIC_DOMAINS получают заданный ответ, остальные считаются рабочими.
+    """
+
+    def has_mail_exchanger(self, domain):
+        return getattr(settings, 'EMAIL_MX_STATIC_DOMAINS', {}).get(domain, True)
+
+
+def get_resolver():
+    return import_string(settings.EMAIL_MX_RESOLVER)()
+
+
+def mx_cache_key(domain):
+    return f'mailing:mx:{domain}'
+
+
+def check_domains(domains, resolver=None):
+    """Проверяет домены, обращаясь к DNS только для тех, которых нет в кеше"""
+    keys = {mx_cache_key(domain): domain for domain in domains}
+    results = {keys[key]: value for key, value in cache.get_many(keys).items()}
+
+    missing = [domain for domain in domains if domain not in results]
+    if missing:
+        resolver = resolver or get_resolver()
+        positive, negative = {}, {}
+        for domain in missing:
+            accepts_mail = resolver.has_mail_exchanger(domain)
+            if accepts_mail is None:
+                results[domain] = True
+                continue
+            results[domain] = accepts_mail
+            (positive if accepts_mail else negative)[mx_cache_key(domain)] = accepts_mail
+        if positive:
+            cache.set_many(positive, settings.EMAIL_MX_CACHE_TTL)
+        if negative:
+            cache.set_many(negative, NEGATIVE_MX_CACHE_TTL)
+    return results
+
+
+def mail_domain(email):
+    """Домен адреса в punycode для запроса к DNS или None, если адрес некорректен
+
+    Синтаксис проверяется тем же валидатором, что и у EmailField, поэтому адреса
+    с национальными доменами (user@пример.рф) проходят проверку.
+    """
+    try:
+        validate_email(email)
+        return email.rpartition('@')[2].encode('idna').decode('ascii').lower()
+    except (ValidationError, UnicodeError):
+        return None
+
+
+def find_invalid_emails(emails, resolver=None):
+    """Возвращает словарь {адрес: причина} для адресов пачки, которые не пройдут доставку"""
+    invalid = {}
+    domains = {}
+    for email in emails:
+        domain = mail_domain(email)
+        if domain is None:
+            invalid[email] = 'Некорректный формат адреса'
+        else:
+            domains[email] = domain
+
+    accepts_mail = check_domains(set(domains.values()), resolver)
+    for email, domain in domains.items():
+        if not accepts_mail[domain]:
+            invalid[email] = f'Домен {domain} не принимает почту'
+    return invalid
+
+
+def validate_mailing_recipients(mailing, resolver=None):
+    """Проверяет получателей рассылки до отправки и возвращает id клиентов с недействительными адресами
+
+    Для каждого такого клиента создается неуспешная попытка, а в очередь рассылки он не ставится.
+    В список подавления адреса не попадают: ответ DNS кешируется только на время EMAIL_MX_CACHE_TTL,
+    и следующая рассылка проверит их заново. При повторном запуске рассылки попытка для клиента,
+    уже не прошедшего проверку, второй раз не создается.
+    """
+    recipients = mailing.clients.filter(~suppressed()).values_list('id', 'email').iterator(
+        chunk_size=VALIDATION_CHUNK_SIZE
+    )
+    invalid_clients = set()
+    chunk = []
+    for recipient in recipients:
+        chunk.append(recipient)
+        if len(chunk) == VALIDATION_CHUNK_SIZE:
+            invalid_clients.update(_reject_invalid(mailing, chunk, resolver))
+            chunk = []
+    if chunk:
+        invalid_clients.update(_reject_invalid(mailing, chunk, resolver))
+    return invalid_clients
+
+
+def _reject_invalid(mailing, recipients, resolver):
+    invalid = find_invalid_emails([email for _, email in recipients], resolver)
+    rejected = {client_id: invalid[email] for client_id, email in recipients if email in invalid}
+    if not rejected:
+        return rejected
+    recorded = set(MailingAttempt.objects.filter(
+        mailing=mailing,
+        client_id__in=rejected,
+        status='failure',
+        server_response__startswith=VALIDATION_FAILURE,
+    ).values_list('client_id', flat=True))
+    attempts = [
+        MailingAttempt(
+            mailing=mailing,
+            client_id=client_id,
+            owner_id=mailing.owner_id,
+            status='failure',
+            server_response=f'{VALIDATION_FAILURE}: {reason}',
+        )
+        for client_id, reason in rejected.items()
+        if client_id not in recorded
+    ]
+    if not attempts:
+        return rejected
+    MailingAttempt.objects.bulk_create(attempts)
+    invalidate_fragments([mailing.pk], 'attempts')
+    return rejected
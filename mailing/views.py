@@ -1,53 +1,157 @@
+from asgiref.sync import sync_to_async
 from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
-from django.http import HttpResponseForbidden
+from django.contrib.auth.views import redirect_to_login
+from django.core.exceptions import PermissionDenied
+from django.core.handlers.asgi import ASGIRequest
+from django.core.paginator import Paginator
+from django.db.models import Count, F, Q, Window
+from django.db.models.functions import RowNumber
+from django.http import Http404, HttpResponseBadRequest, HttpResponseForbidden, JsonResponse, StreamingHttpResponse
 from django.shortcuts import render, get_object_or_404, redirect
 from django.urls import reverse_lazy
 from django.utils.decorators import method_decorator
 from django.views import View
 from django.views.decorators.cache import cache_page, cache_control
+from django.views.decorators.vary import vary_on_cookie
 from django.views.generic import ListView, CreateView, UpdateView, DeleteView, DetailView
 from mailing.forms import ClientForm, MessageForm, MailingForm
+from mailing.fragments import FRAGMENT_CACHE_TIMEOUT, aget_fragment_versions
 from mailing.models import Client, Mailing, Message, MailingAttempt
-from mailing.services import send_mailing
+from mailing.progress import aget_progress, astream_progress, stream_progress
+from mailing.reports import EXPORT_FORMATS, REPORTS, aexport_report, export_report
+from mailing.search import search_clients, search_messages
+from mailing.services import disable_mailings, send_mailing, set_users_active
 from users.models import CustomUser
 
+ATTEMPTS_ON_PAGE = 100
+
 
 class OwnerMixin(UserPassesTestMixin):
-    """Универсальный миксин для проверки владельца объекта"""
+    """Универсальный миксин для проверки владельца объекта
 
-    def test_func(self):
+    Объекты чужих владельцев отсекаются в get_queryset, а найденный объект
+    запоминается, чтобы представление не загружало его повторно.
+    """
+    _owner_object = None
+
+    def get_queryset(self):
+        if hasattr(super(), 'get_queryset'):
+            queryset = super().get_queryset()
+        else:
+            queryset = self.model._default_manager.all()
         if self.request.user.has_perm('users.can_block_users'):
-            return True
+            return queryset
+        return queryset.filter(owner_id=self.request.user.pk)
+
+    def get_object(self, queryset=None):
+        if queryset is None and self._owner_object is not None:
+            return self._owner_object
 
-        if hasattr(self, 'get_object'):
-            obj = self.get_object()
+        if hasattr(super(), 'get_object'):
+            obj = super().get_object(queryset)
         else:
-            obj = get_object_or_404(self.model, pk=self.kwargs['pk'])
-        return obj.owner == self.request.user
+            obj = get_object_or_404(queryset or self.get_queryset(), pk=self.kwargs['pk'])
+
+        if queryset is None:
+            self._owner_object = obj
+        return obj
+
+    def test_func(self):
+        if not self.request.user.is_authenticated:
+            return False
+        return self.get_object() is not None
+
+
+class AsyncLoginRequiredMixin:
+    """Асинхронный аналог LoginRequiredMixin: пользователь загружается через request.auser()
+
+    Загруженный пользователь подставляется в request.user, чтобы шаблоны
+    и контекстные процессоры не загружали его повторно.
+    """
+    is_manager = False
+
+    async def dispatch(self, request, *args, **kwargs):
+        user = await request.auser()
+        if not user.is_authenticated:
+            return redirect_to_login(request.get_full_path())
+        request.user = user
+        self.is_manager = await user.ahas_perm('users.can_block_users')
+        return await super().dispatch(request, *args, **kwargs)
+
+
+async def render_async(request, template_name, context):
+    """Рендерит шаблон в потоке: шаблоны могут обращаться к ORM синхронно"""
+    return await sync_to_async(render)(request, template_name, context)
 
 
-class OwnerListMixin:
-    """Миксин для ListView - фильтрует только объекты владельца, кроме менеджеров"""
+class AsyncOwnerListView(AsyncLoginRequiredMixin, View):
+    """Асинхронный список объектов владельца; менеджеры видят объекты всех пользователей
+
+    Если задан paginate_by, список разбивается на страницы; параметр q передается в search().
+    """
+    model = None
+    template_name = None
+    context_object_name = None
+    paginate_by = None
+
     def get_queryset(self):
-        if self.request.user.has_perm('users.can_block_users'):
+        if self.is_manager:
             return self.model.objects.all()
-        return self.model.objects.filter(owner=self.request.user)
+        return self.model.objects.filter(owner_id=self.request.user.pk)
+
+    def search(self, queryset, query):
+        return queryset
+
+    async def get(self, request, *args, **kwargs):
+        queryset = self.get_queryset()
+        query = request.GET.get('q', '').strip()
+        if query:
+            queryset = self.search(queryset, query)
+        context = {'view': self, 'query': query}
+
+        if self.paginate_by:
+            if not queryset.ordered:
+                queryset = queryset.order_by('id')
+            page = await sync_to_async(paginate)(queryset, self.paginate_by, request.GET.get('page'))
+            object_list = page.object_list
+            context.update({'page_obj': page, 'paginator': page.paginator, 'is_paginated': page.has_other_pages()})
+        else:
+            object_list = [obj async for obj in queryset]
+
+        context['object_list'] = object_list
+        if self.context_object_name:
+            context[self.context_object_name] = object_list
+        return await render_async(request, self.template_name, context)
+
+
+def paginate(queryset, per_page, number):
+    """Возвращает страницу с уже загруженными объектами"""
+    page = Paginator(queryset, per_page).get_page(number)
+    page.object_list = list(page.object_list)
+    return page
 
 
-@cache_control(max_age=600)
+@cache_control(private=True, max_age=600)
 @cache_page(60 * 15)
-def index(request):
+@vary_on_cookie
+async def index(request):
     """Главная страница со статистикой"""
-    if request.user.is_authenticated:
-        total_mailings = Mailing.objects.filter(owner=request.user).count()
-        active_mailings = Mailing.objects.filter(
-            owner=request.user,
-            status='started'
-        ).count()
-        unique_clients = Client.objects.filter(owner=request.user).count()
-        user_attempts = MailingAttempt.objects.filter(owner=request.user)
-        successful_attempts = user_attempts.filter(status='success').count()
-        failed_attempts = user_attempts.filter(status='failure').count()
+    user = await request.auser()
+    request.user = user
+    if user.is_authenticated:
+        mailings = await Mailing.objects.filter(owner=user).aaggregate(
+            total=Count('id'),
+            active=Count('id', filter=Q(status='started')),
+        )
+        unique_clients = await Client.objects.filter(owner=user).acount()
+        attempts = await MailingAttempt.objects.filter(owner=user).aaggregate(
+            successful=Count('id', filter=Q(status='success')),
+            failed=Count('id', filter=Q(status='failure')),
+        )
+        total_mailings = mailings['total']
+        active_mailings = mailings['active']
+        successful_attempts = attempts['successful']
+        failed_attempts = attempts['failed']
         total_sent_messages = successful_attempts
     else:
         total_mailings = active_mailings = unique_clients = 0
@@ -61,16 +165,20 @@ def index(request):
         'failed_attempts': failed_attempts,
         'total_sent_messages': total_sent_messages,
     }
-    return render(request, 'mailing/index.html', context)
+    return await render_async(request, 'mailing/index.html', context)
 
 
-@method_decorator(cache_page(60 * 15), name='dispatch')
-class ClientListView(LoginRequiredMixin, OwnerListMixin, ListView):
+@method_decorator([cache_page(60 * 15), vary_on_cookie], name='dispatch')
+class ClientListView(AsyncOwnerListView):
     model = Client
     template_name = 'mailing/client_list.html'
+    paginate_by = 50
 
+    def search(self, queryset, query):
+        return search_clients(queryset, query)
 
-class ClientDetailView(DetailView):
+
+class ClientDetailView(OwnerMixin, LoginRequiredMixin, DetailView):
     model = Client
     template_name = 'mailing/client_detail.html'
     context_object_name = 'client'
@@ -82,6 +190,11 @@ class ClientCreateView(LoginRequiredMixin, CreateView):
     template_name = 'mailing/client_form.html'
     success_url = reverse_lazy('mailing:client_list')
 
+    def get_form_kwargs(self):
+        kwargs = super().get_form_kwargs()
+        kwargs['user'] = self.request.user
+        return kwargs
+
     def form_valid(self, form):
         form.instance.owner = self.request.user
         return super().form_valid(form)
@@ -100,10 +213,14 @@ class ClientDeleteView(OwnerMixin, LoginRequiredMixin, DeleteView):
     success_url = reverse_lazy('mailing:client_list')
 
 
-@method_decorator(cache_page(60 * 15), name='dispatch')
-class MessageListView(LoginRequiredMixin, OwnerListMixin, ListView):
+@method_decorator([cache_page(60 * 15), vary_on_cookie], name='dispatch')
+class MessageListView(AsyncOwnerListView):
     model = Message
     template_name = 'mailing/message_list.html'
+    paginate_by = 50
+
+    def search(self, queryset, query):
+        return search_messages(queryset, query)
 
 
 class MessageDetailView(OwnerMixin, LoginRequiredMixin, DetailView):
@@ -136,12 +253,18 @@ class MessageDeleteView(OwnerMixin, LoginRequiredMixin, DeleteView):
     success_url = reverse_lazy('mailing:message_list')
 
 
-@method_decorator(cache_page(60 * 15), name='dispatch')
-class MailingListView(LoginRequiredMixin, OwnerListMixin, ListView):
+class MailingListView(AsyncOwnerListView):
+    """Список рассылок; номер рассылки у владельца и число клиентов считаются в том же запросе"""
     model = Mailing
     template_name = 'mailing/mailing_list.html'
     context_object_name = 'mailings'
 
+    def get_queryset(self):
+        return super().get_queryset().select_related('message', 'owner').annotate(
+            clients_count=Count('clients', distinct=True),
+            user_number=Window(RowNumber(), partition_by=F('owner_id'), order_by=F('id').asc()),
+        ).order_by('id')
+
 
 class MailingCreateView(LoginRequiredMixin, CreateView):
     model = Mailing
@@ -177,16 +300,124 @@ class MailingDeleteView(OwnerMixin, LoginRequiredMixin, DeleteView):
     success_url = reverse_lazy('mailing:mailing_list')
 
 
-class MailingDetailView(OwnerMixin, LoginRequiredMixin, DetailView):
-    model = Mailing
-    template_name = 'mailing/mailing_detail.html'
+class MailingDetailView(AsyncLoginRequiredMixin, View):
+    """Страница рассылки; таблицы получателей и попыток кешируются фрагментами по версиям из mailing.fragments"""
+
+    async def get(self, request, pk):
+        queryset = Mailing.objects.select_related('message', 'owner')
+        if not self.is_manager:
+            queryset = queryset.filter(owner_id=request.user.pk)
+        try:
+            mailing = await queryset.aget(pk=pk)
+        except Mailing.DoesNotExist:
+            raise Http404('Рассылка не найдена')
+
+        # Запрос ленивый: он выполняется, только если фрагмент с попытками не найден в кеше
+        attempts = MailingAttempt.objects.filter(mailing=mailing).order_by('-attempt_time')[:ATTEMPTS_ON_PAGE]
+        context = {
+            'view': self,
+            'object': mailing,
+            'mailing': mailing,
+            'attempts': attempts,
+            'versions': await aget_fragment_versions(mailing.pk),
+            'fragment_timeout': FRAGMENT_CACHE_TIMEOUT,
+        }
+        return await render_async(request, 'mailing/mailing_detail.html', context)
+
+
+class MailingProgressView(AsyncLoginRequiredMixin, View):
+    """Счетчики отправки рассылки из кеша, без обращений к таблицам рассылки"""
+
+    async def get_progress(self, pk):
+        progress = await aget_progress(pk)
+        if progress is None:
+            raise Http404('Рассылка еще не отправлялась')
+        if progress['owner'] != self.request.user.pk and not self.is_manager:
+            raise Http404('Рассылка не найдена')
+        return progress
+
+    async def get(self, request, pk):
+        progress = await self.get_progress(pk)
+        return JsonResponse({field: value for field, value in progress.items() if field != 'owner'})
+
+
+class MailingProgressStreamView(MailingProgressView):
+    """Поток Server-Sent Events с изменениями счетчиков, пока рассылка отправляется
+
+    Под ASGI поток асинхронный; WSGI-сервер получает синхронный генератор,
+    иначе Django собрал бы асинхронный поток целиком перед отправкой.
+    """
+
+    async def get(self, request, pk):
+        await self.get_progress(pk)
+        events = astream_progress(pk) if isinstance(request, ASGIRequest) else stream_progress(pk)
+        response = StreamingHttpResponse(events, content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+
+class ReportExportView(AsyncLoginRequiredMixin, View):
+    """Потоковая выгрузка отчета о доставке в CSV или JSONL
+
+    Параметры: kind — attempts (попытки) или recipients (состояние по получателям),
+    format — csv или jsonl.
+    """
+
+    async def get_mailing_ids(self):
+        """Проверяет права и возвращает id рассылок отчета или None, если в отчет входят все рассылки
+
+        По умолчанию менеджер получает отчет по всем рассылкам, остальные — только по своим.
+        """
+        if self.is_manager:
+            return None
+        return Mailing.objects.filter(owner_id=self.request.user.pk).values('id')
+
+    def get_filename(self, kind):
+        """Имя файла отчета без расширения"""
+        return f'report-{kind}'
+
+    async def get(self, request, *args, **kwargs):
+        kind = request.GET.get('kind', 'attempts')
+        export_format = request.GET.get('format', 'csv')
+        if kind not in REPORTS or export_format not in EXPORT_FORMATS:
+            return HttpResponseBadRequest('Неизвестный тип или формат отчета')
+
+        mailing_ids = await self.get_mailing_ids()
+        if isinstance(request, ASGIRequest):
+            rows = aexport_report(kind, export_format, mailing_ids)
+        else:
+            rows = export_report(kind, export_format, mailing_ids)
+        response = StreamingHttpResponse(rows, content_type=EXPORT_FORMATS[export_format])
+        response['Content-Disposition'] = f'attachment; filename="{self.get_filename(kind)}.{export_format}"'
+        return response
+
+
+class MailingReportView(ReportExportView):
+    """Отчет по одной рассылке для ее владельца или менеджера"""
+
+    async def get_mailing_ids(self):
+        queryset = Mailing.objects.filter(pk=self.kwargs['pk'])
+        if not self.is_manager:
+            queryset = queryset.filter(owner_id=self.request.user.pk)
+        if not await queryset.aexists():
+            raise Http404('Рассылка не найдена')
+        return [self.kwargs['pk']]
+
+    def get_filename(self, kind):
+        return f'mailing-{self.kwargs["pk"]}-{kind}'
 
-    def get_context_data(self, **kwargs):
-        context = super().get_context_data(**kwargs)
-        context['attempts'] = MailingAttempt.objects.filter(
-            mailing=self.object
-        ).order_by('-attempt_time')
-        return context
+
+class ManagerReportView(ReportExportView):
+    """Отчет по всем рассылкам (только для менеджеров)"""
+
+    async def get_mailing_ids(self):
+        if not self.is_manager:
+            raise PermissionDenied('У вас нет прав для выгрузки отчетов.')
+        return None
+
+    def get_filename(self, kind):
+        return f'mailings-{kind}'
 
 
 class MailingSendView(OwnerMixin, LoginRequiredMixin, View):
@@ -194,9 +425,9 @@ class MailingSendView(OwnerMixin, LoginRequiredMixin, View):
     model = Mailing
 
     def post(self, request, pk):
-        mailing = get_object_or_404(Mailing, pk=pk)
+        mailing = self.get_object()
 
-        if mailing.status == 'completed':
+        if mailing.status in ('completed', 'interrupted'):
             print(f"Рассылка #{mailing.id} уже завершена")
         else:
             sent, failed = send_mailing(mailing)
@@ -227,8 +458,29 @@ class UserBlockView(LoginRequiredMixin, View):
 
         user = get_object_or_404(CustomUser, pk=pk)
         if user != request.user:
-            user.is_active = not user.is_active
-            user.save()
+            set_users_active(CustomUser.objects.filter(pk=user.pk), not user.is_active)
+
+        return redirect('mailing:user_list')
+
+
+class UserBulkBlockView(LoginRequiredMixin, View):
+    """Массовая блокировка/разблокировка пользователей по списку id или домену email"""
+
+    def post(self, request):
+        if not request.user.has_perm('users.can_block_users'):
+            return HttpResponseForbidden("У вас нет прав для блокировки пользователей.")
+
+        ids = [pk for pk in request.POST.getlist('ids') if pk.isdigit()]
+        email_domain = request.POST.get('email_domain', '').strip().lstrip('@')
+        if ids:
+            users = CustomUser.objects.filter(pk__in=ids)
+        elif email_domain:
+            users = CustomUser.objects.filter(email__iendswith=f'@{email_domain}')
+        else:
+            return redirect('mailing:user_list')
+
+        is_active = request.POST.get('action') == 'unblock'
+        set_users_active(users.exclude(pk=request.user.pk), is_active)
 
         return redirect('mailing:user_list')
 
@@ -240,7 +492,22 @@ class MailingDisableView(LoginRequiredMixin, View):
             return HttpResponseForbidden("У вас нет прав для отключения рассылок.")
 
         mailing = get_object_or_404(Mailing, pk=pk)
-        mailing.status = 'completed'
-        mailing.save()
+        disable_mailings(Mailing.objects.filter(pk=mailing.pk))
+
+        return redirect('mailing:mailing_list')
+
+
+class MailingBulkDisableView(LoginRequiredMixin, View):
+    """Массовое отключение рассылок по списку id или владельцу"""
+    def post(self, request):
+        if not request.user.has_perm('mailing.can_disable_mailings'):
+            return HttpResponseForbidden("У вас нет прав для отключения рассылок.")
+
+        ids = [pk for pk in request.POST.getlist('ids') if pk.isdigit()]
+        owner = request.POST.get('owner', '')
+        if ids:
+            disable_mailings(Mailing.objects.filter(pk__in=ids))
+        elif owner.isdigit():
+            disable_mailings(Mailing.objects.filter(owner_id=owner))
 
         return redirect('mailing:mailing_list')
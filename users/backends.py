@@ -0,0 +1,32 @@
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import cache
+
+from .permissions import PERMISSIONS_CACHE_TIMEOUT, permissions_cache_key
+
+
+class CachedModelBackend(ModelBackend):
+    """Бэкенд авторизации, который хранит права пользователя в общем кеше"""
+
+    def get_all_permissions(self, user_obj, obj=None):
+        if not user_obj.is_active or user_obj.is_anonymous or obj is not None:
+            return set()
+        if not hasattr(user_obj, '_perm_cache'):
+            key = permissions_cache_key(user_obj.pk)
+            permissions = cache.get(key)
+            if permissions is None:
+                permissions = super().get_all_permissions(user_obj)
+                cache.set(key, permissions, PERMISSIONS_CACHE_TIMEOUT)
+            user_obj._perm_cache = permissions
+        return user_obj._perm_cache
+
+    async def aget_all_permissions(self, user_obj, obj=None):
+        if not user_obj.is_active or user_obj.is_anonymous or obj is not None:
+            return set()
+        if not hasattr(user_obj, '_perm_cache'):
+            key = permissions_cache_key(user_obj.pk)
+            permissions = await cache.aget(key)
+            if permissions is None:
+                permissions = await super().aget_all_permissions(user_obj)
+                await cache.aset(key, permissions, PERMISSIONS_CACHE_TIMEOUT)
+            user_obj._perm_cache = permissions
+        return user_obj._perm_cache
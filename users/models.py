@@ -1,5 +1,8 @@
 from django.db import models
 from django.contrib.auth.models import AbstractUser
+from django.core.cache import cache
+
+from .permissions import PERMISSIONS_CACHE_TIMEOUT, manager_cache_key
 
 
 class CustomUser(AbstractUser):
@@ -26,5 +29,11 @@ class CustomUser(AbstractUser):
         return self.email
 
     def is_manager(self):
-        """Проверяет, является ли пользователь менеджером"""
-        return self.groups.filter(name='Managers').exists() or self.has_perm('users.can_block_users')
+        """Проверяет, является ли пользователь менеджером (результат кешируется до смены групп)"""
+        if not hasattr(self, '_is_manager_cache'):
+            self._is_manager_cache = cache.get_or_set(
+                manager_cache_key(self.pk),
+                lambda: self.groups.filter(name='Managers').exists() or self.has_perm('users.can_block_users'),
+                PERMISSIONS_CACHE_TIMEOUT,
+            )
+        return self._is_manager_cache
@@ -0,0 +1,21 @@
+from django.core.cache import cache
+
+PERMISSIONS_CACHE_TIMEOUT = 60 * 15
+
+
+def permissions_cache_key(user_id):
+    return f'users:permissions:{user_id}'
+
+
+def manager_cache_key(user_id):
+    return f'users:is_manager:{user_id}'
+
+
+def invalidate_user_permissions(user_ids):
+    """Сбрасывает кеш прав и статуса менеджера для пользователей"""
+    keys = []
+    for user_id in user_ids:
+        keys.append(permissions_cache_key(user_id))
+        keys.append(manager_cache_key(user_id))
+    if keys:
+        cache.delete_many(keys)
@@ -1,14 +1,13 @@
-from django.core.mail import send_mail
-from django.conf import settings
 from django.utils.crypto import get_random_string
+from mailing.outbox import enqueue_email
 from .models import CustomUser
 
 
 def send_verification_email(user, request):
-    """Отправляет email для подтверждения"""
+    """Ставит в очередь email для подтверждения"""
     token = get_random_string(50)
     user.verification_token = token
-    user.save()
+    user.save(update_fields=['verification_token'])
 
     domain = request.get_host()
     protocol = 'https' if request.is_secure() else 'http'
@@ -24,12 +23,11 @@ def send_verification_email(user, request):
     Если вы не регистрировались на нашем сайте, проигнорируйте это письмо.
     '''
 
-    send_mail(
+    enqueue_email(
         subject=subject,
-        message=message,
-        from_email=settings.DEFAULT_FROM_EMAIL,
-        recipient_list=[user.email],
-        fail_silently=False,
+        body=message,
+        recipient=user.email,
+        idempotency_key=f'verification:{user.pk}:{token}',
     )
 
 
@@ -0,0 +1,49 @@
+from django.contrib.auth.models import Group
+from django.db.models.signals import m2m_changed, post_save, pre_delete
+from django.dispatch import receiver
+
+from .permissions import invalidate_user_permissions
+from .models import CustomUser
+
+M2M_ACTIONS = ('post_add', 'post_remove', 'pre_clear')
+
+
+@receiver(m2m_changed, sender=CustomUser.groups.through)
+@receiver(m2m_changed, sender=CustomUser.user_permissions.through)
+def user_relations_changed(sender, instance, action, pk_set, **kwargs):
+    """Сбрасывает кеш прав при изменении групп или личных прав пользователя"""
+    if action not in M2M_ACTIONS:
+        return
+    if isinstance(instance, CustomUser):
+        invalidate_user_permissions([instance.pk])
+    elif action == 'pre_clear':
+        invalidate_user_permissions(instance.user_set.values_list('pk', flat=True))
+    else:
+        invalidate_user_permissions(pk_set)
+
+
+@receiver(m2m_changed, sender=Group.permissions.through)
+def group_permissions_changed(sender, instance, action, pk_set, **kwargs):
+    """Сбрасывает кеш прав участников группы при изменении ее прав"""
+    if action not in M2M_ACTIONS:
+        return
+    if isinstance(instance, Group):
+        users = instance.user_set.all()
+    elif action == 'pre_clear':
+        users = CustomUser.objects.filter(groups__permissions=instance)
+    else:
+        users = CustomUser.objects.filter(groups__in=pk_set)
+    invalidate_user_permissions(users.values_list('pk', flat=True).distinct())
+
+
+@receiver(post_save, sender=Group)
+@receiver(pre_delete, sender=Group)
+def group_changed(sender, instance, **kwargs):
+    """Сбрасывает кеш участников при переименовании или удалении группы"""
+    invalidate_user_permissions(instance.user_set.values_list('pk', flat=True))
+
+
+@receiver(post_save, sender=CustomUser)
+def user_saved(sender, instance, **kwargs):
+    """Сбрасывает кеш после изменения пользователя, например флага is_superuser"""
+    invalidate_user_permissions([instance.pk])
@@ -0,0 +1,139 @@
+from io import StringIO
+from smtplib import SMTPDataError
+
+from django.contrib.auth import BACKEND_SESSION_KEY
+from django.contrib.auth.models import Group, Permission
+from django.core import mail
+from django.core.cache import cache
+from django.core.mail.backends.locmem import EmailBackend
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from mailing.models import OutboxEmail
+from mailing.outbox import RETRY_DELAY, drain_outbox
+from mailing.smtp_pool import SmtpAccount, SmtpPool
+from users.models import CustomUser
+
+
+class CachedPermissionsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = CustomUser.objects.create_user(username='user', email='user@example.com', password='secret')
+        self.group = Group.objects.create(name='Editors')
+        self.permission = Permission.objects.get(codename='can_block_users')
+
+    def fresh_user(self):
+        return CustomUser.objects.get(pk=self.user.pk)
+
+    def test_permissions_are_read_from_cache(self):
+        self.assertFalse(self.fresh_user().has_perm('users.can_block_users'))
+
+        user = self.fresh_user()
+        with self.assertNumQueries(0):
+            self.assertFalse(user.has_perm('users.can_block_users'))
+            self.assertEqual(user.get_all_permissions(), set())
+
+    def test_adding_user_to_group_invalidates_cache(self):
+        self.group.permissions.add(self.permission)
+        self.assertFalse(self.fresh_user().has_perm('users.can_block_users'))
+
+        self.user.groups.add(self.group)
+
+        self.assertTrue(self.fresh_user().has_perm('users.can_block_users'))
+
+    def test_changing_group_permissions_invalidates_members(self):
+        self.user.groups.add(self.group)
+        self.assertFalse(self.fresh_user().has_perm('users.can_block_users'))
+
+        self.group.permissions.add(self.permission)
+        self.assertTrue(self.fresh_user().has_perm('users.can_block_users'))
+
+        self.permission.group_set.clear()
+        self.assertFalse(self.fresh_user().has_perm('users.can_block_users'))
+
+    def test_user_permissions_and_superuser_flag_invalidate_cache(self):
+        self.assertFalse(self.fresh_user().has_perm('users.can_block_users'))
+
+        self.user.user_permissions.add(self.permission)
+        self.assertTrue(self.fresh_user().has_perm('users.can_block_users'))
+
+        self.user.user_permissions.clear()
+        self.assertFalse(self.fresh_user().has_perm('users.can_block_users'))
+
+        self.user.is_superuser = True
+        self.user.save()
+        self.assertTrue(self.fresh_user().has_perm('users.can_block_users'))
+
+    def test_is_manager_follows_managers_group(self):
+        managers = Group.objects.create(name='Managers')
+        self.assertFalse(self.fresh_user().is_manager())
+
+        self.user.groups.add(managers)
+        self.assertTrue(self.fresh_user().is_manager())
+
+        managers.delete()
+        self.assertFalse(self.fresh_user().is_manager())
+
+
+class LegacySessionTests(TestCase):
+    def test_session_created_with_model_backend_stays_logged_in(self):
+        user = CustomUser.objects.create_user(username='user', email='user@example.com', password='secret')
+        self.client.force_login(user, backend='django.contrib.auth.backends.ModelBackend')
+
+        response = self.client.get(reverse('mailing:client_list'))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.client.session[BACKEND_SESSION_KEY], 'django.contrib.auth.backends.ModelBackend')
+
+
+class RejectingEmailBackend(EmailBackend):
+    """Бэкенд, сервер которого отклоняет письмо целиком"""
+
+    def send_messages(self, messages):
+        raise SMTPDataError(554, b'5.6.0 Message rejected')
+
+
+@override_settings(EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend', EMAIL_ACCOUNTS=[],
+                   DEFAULT_FROM_EMAIL='service@example.com')
+class RegistrationEmailTests(TestCase):
+    def register(self):
+        return self.client.post(reverse('users:register'), {
+            'username': 'newuser',
+            'email': 'newuser@example.com',
+            'password1': 'Very-secret-42',
+            'password2': 'Very-secret-42',
+        })
+
+    def test_registration_queues_emails_without_smtp(self):
+        response = self.register()
+
+        self.assertRedirects(response, reverse('users:register_success'))
+        self.assertEqual(mail.outbox, [])
+        self.assertEqual(
+            sorted(OutboxEmail.objects.values_list('subject', 'status')),
+            [('Добро пожаловать в наш сервис', 'pending'), ('Подтверждение email адреса', 'pending')],
+        )
+
+    def test_send_outbox_delivers_queued_emails_once(self):
+        self.register()
+
+        call_command('send_outbox', stdout=StringIO())
+        call_command('send_outbox', stdout=StringIO())
+
+        self.assertEqual(len(mail.outbox), 2)
+        self.assertEqual({message.from_email for message in mail.outbox}, {'service@example.com'})
+        self.assertEqual({message.to[0] for message in mail.outbox}, {'newuser@example.com'})
+        self.assertFalse(OutboxEmail.objects.exclude(status='sent').exists())
+
+    def test_rejected_email_is_retried_later(self):
+        self.register()
+        pool = SmtpPool([SmtpAccount('main', backend='users.tests.RejectingEmailBackend')])
+
+        self.assertEqual(drain_outbox(pool), (0, 0, 2))
+
+        for email in OutboxEmail.objects.all():
+            self.assertEqual((email.status, email.attempts), ('pending', 1))
+            self.assertGreater(email.next_attempt_at, timezone.now() + RETRY_DELAY / 2)
+        self.assertEqual(drain_outbox(pool), (0, 0, 0))
@@ -1,10 +1,11 @@
 from django.contrib.auth.views import LoginView, LogoutView
+from django.db import transaction
 from django.shortcuts import render
 from django.urls import reverse_lazy
 from django.views import View
 from django.views.generic import TemplateView
 from django.views.generic.edit import CreateView
-from django.core.mail import send_mail
+from mailing.outbox import enqueue_email
 from .forms import CustomUserCreationForm, CustomAuthenticationForm
 from .services import verify_email
 
@@ -14,22 +15,26 @@ class RegisterView(CreateView):
     form_class = CustomUserCreationForm
     success_url = reverse_lazy('users:register_success')
 
+    @transaction.atomic
     def form_valid(self, form):
         user = form.save()
 
         from .services import send_verification_email
         send_verification_email(user, self.request)
 
-        self.send_welcome_email(user.email)
+        self.send_welcome_email(user)
 
         return super().form_valid(form)
 
-    def send_welcome_email(self, user_email):
+    def send_welcome_email(self, user):
         subject = 'Добро пожаловать в наш сервис'
         message = 'Спасибо за регистрацию! Проверьте вашу почту для подтверждения email.'
-        from_email = 'kveremyeva@yandex.ru'
-        recipient_list = [user_email]
-        send_mail(subject, message, from_email, recipient_list)
+        enqueue_email(
+            subject=subject,
+            body=message,
+            recipient=user.email,
+            idempotency_key=f'welcome:{user.pk}',
+        )
 
 
 class RegisterSuccessView(TemplateView):